@@ -0,0 +1,390 @@
+"""
+Modelo colunar de um feixe: a ControlPointSequence é percorrida uma única vez e
+convertida em arrays NumPy contíguos (um valor por CP).
+
+Os valores que o DICOM permite omitir nos CPs seguintes (ângulos, jaws, MLC...)
+são herdados do último CP que os define; as máscaras em `defined` indicam quais
+CPs trazem o valor explicitamente. Valores nunca definidos ficam como NaN.
+
+Os elementos DS ainda não convertidos pelo pydicom (RawDataElement) são lidos
+direto dos bytes, sem criar um DSfloat por lâmina.
+
+As edições feitas nos arrays (set_scalar, set_device, set_leaves) ficam marcadas
+como pendentes por campo e CP; write_back grava no Dataset apenas esses elementos,
+numa única passada (ao salvar ou exportar).
+
+to_arrays/from_arrays convertem o modelo em arrays nomeados (sem objetos Python),
+usados pelo cache em disco de plan_cache.
+
+Este módulo não depende do Qt e pode ser usado pelo conversor EFS em processos
+separados.
+"""
+import numpy as np
+from pydicom.dataelem import DataElement, RawDataElement
+from pydicom.dataset import Dataset
+from pydicom.sequence import Sequence
+from pydicom.valuerep import format_number_as_ds
+
+TAG_GANTRY_ANGLE = 0x300A011E
+TAG_GANTRY_ROTATION_DIRECTION = 0x300A011F
+TAG_BEAM_LIMITING_DEVICE_ANGLE = 0x300A0120
+TAG_PATIENT_SUPPORT_ANGLE = 0x300A0122
+TAG_CUMULATIVE_METERSET_WEIGHT = 0x300A0134
+TAG_LEAF_JAW_POSITIONS = 0x300A011C
+TAG_BEAM_LIMITING_DEVICE_POSITION_SEQUENCE = 0x300A011A
+TAG_CONTROL_POINT_SEQUENCE = 0x300A0111
+
+# Campo do modelo -> tag escalar do CP
+SCALAR_TAGS = {
+    'gantry': TAG_GANTRY_ANGLE,
+    'collimator': TAG_BEAM_LIMITING_DEVICE_ANGLE,
+    'couch': TAG_PATIENT_SUPPORT_ANGLE,
+    'meterset_weight': TAG_CUMULATIVE_METERSET_WEIGHT,
+}
+
+
+def _ds_values(ds, tag):
+    # Valores numéricos (DS/IS) de um elemento, ou None se ausente/vazio
+    elem = ds.get_item(tag)
+    if elem is None:
+        return None
+    value = elem.value
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        parts = value.split(b'\\')
+        if not value.strip():
+            return None
+    elif isinstance(value, (str, int, float)):
+        parts = [value]
+    else:
+        parts = list(value)
+    return [_to_float(p) for p in parts]
+
+
+def _to_float(text):
+    # Número DS; tolera espaços internos gravados por alguns TPS (ex.: "66 .0")
+    try:
+        return float(text)
+    except ValueError:
+        if isinstance(text, bytes):
+            text = text.decode('ascii', 'replace')
+        return float(str(text).replace(' ', '') or 'nan')
+
+
+def _ds_float(ds, tag):
+    values = _ds_values(ds, tag)
+    return values[0] if values else None
+
+
+def _cs_value(ds, tag):
+    elem = ds.get_item(tag)
+    if elem is None or elem.value is None:
+        return None
+    value = elem.value
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'replace')
+    return str(value).strip() or None
+
+
+def _ds_text(value):
+    # Número como DS: a maior precisão que cabe nos 16 caracteres do VR
+    return format_number_as_ds(float(value))
+
+
+def _set_ds(ds, tag, values):
+    """
+    Grava valores DS num elemento, preservando-o quando possível: um DataElement já
+    convertido é alterado no lugar (a árvore mantém a referência) e um
+    RawDataElement continua bruto, só com os bytes novos.
+    """
+    texts = [_ds_text(v) for v in values]
+    elem = ds.get_item(tag)
+    if isinstance(elem, RawDataElement):
+        raw = "\\".join(texts).encode("ascii")
+        if len(raw) % 2:
+            raw += b" "
+        ds[tag] = elem._replace(value=raw, length=len(raw))
+    elif elem is not None:
+        elem.value = texts if len(texts) > 1 else texts[0]
+    else:
+        ds[tag] = DataElement(tag, "DS", texts if len(texts) > 1 else texts[0])
+
+
+def _device_item(cp, dtype, changed, journal=None):
+    # Item do dispositivo no CP; é criado (e anotado em changed) se o CP ainda não o define
+    if journal is not None:
+        journal.touch(cp, TAG_BEAM_LIMITING_DEVICE_POSITION_SEQUENCE)
+    bl_seq = getattr(cp, "BeamLimitingDevicePositionSequence", None)
+    if bl_seq is None:
+        cp.BeamLimitingDevicePositionSequence = Sequence()
+        bl_seq = cp.BeamLimitingDevicePositionSequence
+    for item in bl_seq:
+        if getattr(item, "RTBeamLimitingDeviceType", "") == dtype:
+            return item
+    item = Dataset()
+    item.RTBeamLimitingDeviceType = dtype
+    bl_seq.append(item)
+    changed.append((cp, TAG_BEAM_LIMITING_DEVICE_POSITION_SEQUENCE))
+    return item
+
+
+def _carry_forward(values, defined):
+    # Repete, ao longo do eixo 0, o último valor definido (NaN antes do primeiro)
+    if defined.all() or not defined.any():
+        return values
+    idx = np.where(defined, np.arange(len(defined)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    out = values[np.maximum(idx, 0)]
+    out[idx < 0] = np.nan
+    return out
+
+
+def jaw_axis(device_type):
+    """
+    Eixo ('X' ou 'Y') de um RTBeamLimitingDeviceType de jaw (X, Y, ASYMX, ASYMY,
+    'X JAW'...), ou None para MLC e tipos desconhecidos.
+    """
+    dtype = (device_type or '').upper()
+    if 'MLC' in dtype:
+        return None
+    if dtype.startswith('ASYM'):
+        dtype = dtype[4:]
+    if dtype[:1] in ('X', 'Y'):
+        return dtype[:1]
+    return None
+
+
+class BeamModel:
+    """
+    Arrays de um feixe, extraídos uma única vez:
+      gantry, collimator, couch (graus), meterset_weight (CumulativeMetersetWeight)
+      gantry_direction (lista de str)
+      devices: {RTBeamLimitingDeviceType: array n_cps×k} na ordem em que aparecem
+      leaves: matriz n_cps×N do MLC (n_cps×0 se o feixe não tiver MLC)
+      jaw_x, jaw_y: n_cps×2 (NaN se o feixe não tiver o jaw)
+      defined: {campo ou tipo de dispositivo: máscara bool dos CPs que o trazem}
+    """
+
+    def __init__(self, beam, index=0):
+        self.beam = beam
+        self.index = index
+        self.number = getattr(beam, "BeamNumber", index + 1)
+        self.name = getattr(beam, "BeamName", "")
+        control_points = getattr(beam, "ControlPointSequence", None) or []
+        self.n_cps = n_cps = len(control_points)
+
+        scalars = {field: np.full(n_cps, np.nan) for field in SCALAR_TAGS}
+        directions = [None] * n_cps
+        device_rows = {}
+        bl_defined = np.zeros(n_cps, dtype=bool)
+
+        for i, cp in enumerate(control_points):
+            for field, tag in SCALAR_TAGS.items():
+                value = _ds_float(cp, tag)
+                if value is not None:
+                    scalars[field][i] = value
+            directions[i] = _cs_value(cp, TAG_GANTRY_ROTATION_DIRECTION)
+            bl_seq = getattr(cp, "BeamLimitingDevicePositionSequence", None)
+            if not bl_seq:
+                continue
+            bl_defined[i] = True
+            for item in bl_seq:
+                dtype = getattr(item, "RTBeamLimitingDeviceType", "")
+                positions = _ds_values(item, TAG_LEAF_JAW_POSITIONS)
+                if positions is not None:
+                    device_rows.setdefault(dtype, {})[i] = positions
+
+        self.defined = {'bl_seq': bl_defined}
+        for field, values in scalars.items():
+            defined = ~np.isnan(values)
+            self.defined[field] = defined
+            setattr(self, field, _carry_forward(values, defined))
+
+        self.gantry_direction = []
+        last = None
+        for direction in directions:
+            last = direction if direction is not None else last
+            self.gantry_direction.append(last or "NONE")
+
+        self.devices = {}
+        for dtype, rows in device_rows.items():
+            width = max(len(row) for row in rows.values())
+            values = np.full((n_cps, width), np.nan)
+            defined = np.zeros(n_cps, dtype=bool)
+            for i, row in rows.items():
+                values[i, :len(row)] = row
+                defined[i] = True
+            self.devices[dtype] = _carry_forward(values, defined)
+            self.defined[dtype] = defined
+
+        self._set_device_views()
+
+    def _set_device_views(self):
+        # MLC e jaws a partir de self.devices; zera as edições pendentes
+        self.mlc_type = next((t for t in self.devices if 'MLC' in t.upper()), None)
+        self.leaves = self.devices[self.mlc_type] if self.mlc_type else np.empty((self.n_cps, 0))
+        self.jaw_x_type = next((t for t in self.devices if jaw_axis(t) == 'X'), None)
+        self.jaw_y_type = next((t for t in self.devices if jaw_axis(t) == 'Y'), None)
+        self.jaw_x = self._jaw(self.jaw_x_type)
+        self.jaw_y = self._jaw(self.jaw_y_type)
+
+        # Edições pendentes: campo escalar ou tipo de dispositivo -> CPs alterados
+        self.dirty = {}
+
+    def _jaw(self, dtype):
+        if dtype is None:
+            return np.full((self.n_cps, 2), np.nan)
+        return self.devices[dtype][:, :2]
+
+    @property
+    def n_leaves(self):
+        return self.leaves.shape[1]
+
+    def device_positions(self, dtype, cp_idx):
+        """Posições do dispositivo no CP (lista de float) ou None se não houver."""
+        values = self.devices.get(dtype)
+        if values is None or np.isnan(values[cp_idx]).all():
+            return None
+        return values[cp_idx].tolist()
+
+    def _assign(self, key, values, defined, cp_idx, new_row):
+        # Atribui o valor ao CP e o propaga aos CPs seguintes que o herdavam
+        end = cp_idx + 1
+        while end < self.n_cps and not defined[end]:
+            end += 1
+        values[cp_idx:end] = new_row
+        defined[cp_idx] = True
+        self.dirty.setdefault(key, set()).add(cp_idx)
+
+    def set_scalar(self, field, cp_idx, value):
+        """
+        Altera gantry, collimator, couch ou meterset_weight no CP. Retorna False
+        (sem marcar o CP) se o valor não mudou.
+        """
+        values = getattr(self, field)
+        defined = self.defined[field]
+        value = float(value)
+        if defined[cp_idx] and values[cp_idx] == value:
+            return False
+        self._assign(field, values, defined, cp_idx, value)
+        return True
+
+    def set_device(self, dtype, cp_idx, positions, leaf_idx=None):
+        """
+        Altera as posições de um dispositivo (jaw ou MLC) no CP: todas, ou apenas
+        as colunas em leaf_idx. Retorna False se nada mudou.
+        """
+        values = self.devices[dtype]
+        defined = self.defined[dtype]
+        row = values[cp_idx].copy()
+        if leaf_idx is None:
+            row[:len(positions)] = positions
+        else:
+            row[leaf_idx] = positions
+        if defined[cp_idx] and np.array_equal(row, values[cp_idx]):
+            return False
+        self._assign(dtype, values, defined, cp_idx, row)
+        return True
+
+    def set_leaves(self, cp_idx, positions, leaf_idx=None):
+        return self.set_device(self.mlc_type, cp_idx, positions, leaf_idx)
+
+    @property
+    def is_dirty(self):
+        return bool(self.dirty)
+
+    def write_back(self, journal=None):
+        """
+        Grava no Dataset apenas os elementos dos CPs editados, formatados como DS.
+        Retorna a lista de (dataset, tag) alterados, para avisar as views. Com
+        journal (EditJournal em gravação), o estado anterior de cada elemento é
+        registrado para desfazer.
+        """
+        if not self.dirty:
+            return []
+        control_points = self.beam.ControlPointSequence
+        changed = []
+        for key, cp_indices in self.dirty.items():
+            for cp_idx in sorted(cp_indices):
+                cp = control_points[cp_idx]
+                if key in SCALAR_TAGS:
+                    if journal is not None:
+                        journal.touch(cp, SCALAR_TAGS[key])
+                    _set_ds(cp, SCALAR_TAGS[key], [getattr(self, key)[cp_idx]])
+                    changed.append((cp, SCALAR_TAGS[key]))
+                else:
+                    row = self.devices[key][cp_idx]
+                    item = _device_item(cp, key, changed, journal)
+                    if journal is not None:
+                        journal.touch(item, TAG_LEAF_JAW_POSITIONS)
+                    _set_ds(item, TAG_LEAF_JAW_POSITIONS, row[~np.isnan(row)].tolist())
+                    changed.append((item, TAG_LEAF_JAW_POSITIONS))
+                    self.defined['bl_seq'][cp_idx] = True
+        self.dirty = {}
+        return changed
+
+    def to_arrays(self):
+        """
+        Arrays do modelo (sem as edições pendentes), com nomes fixos; dispositivos
+        na ordem de self.devices como device_<k>/defined_<k>.
+        """
+        arrays = {
+            'n_cps': np.array(self.n_cps),
+            'gantry_direction': np.array(self.gantry_direction, dtype=str),
+            'bl_seq': self.defined['bl_seq'],
+            'device_types': np.array(list(self.devices), dtype=str),
+        }
+        for field in SCALAR_TAGS:
+            arrays[field] = getattr(self, field)
+            arrays['defined_' + field] = self.defined[field]
+        for k, (dtype, values) in enumerate(self.devices.items()):
+            arrays['device_%d' % k] = values
+            arrays['defined_device_%d' % k] = self.defined[dtype]
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, beam, index, arrays):
+        """
+        Recria o modelo a partir de to_arrays sem percorrer a ControlPointSequence
+        (ela só é lida de novo pelo pydicom se o feixe for gravado ou exibido na árvore).
+        """
+        model = cls.__new__(cls)
+        model.beam = beam
+        model.index = index
+        model.number = getattr(beam, "BeamNumber", index + 1)
+        model.name = getattr(beam, "BeamName", "")
+        model.n_cps = int(arrays['n_cps'])
+        model.gantry_direction = [str(d) for d in arrays['gantry_direction']]
+        model.defined = {'bl_seq': np.array(arrays['bl_seq'])}
+        for field in SCALAR_TAGS:
+            setattr(model, field, np.array(arrays[field]))
+            model.defined[field] = np.array(arrays['defined_' + field])
+        model.devices = {}
+        for k, dtype in enumerate(arrays['device_types']):
+            dtype = str(dtype)
+            model.devices[dtype] = np.array(arrays['device_%d' % k])
+            model.defined[dtype] = np.array(arrays['defined_device_%d' % k])
+        model._set_device_views()
+        return model
+
+    def __repr__(self):
+        return "BeamModel(beam=%r, cps=%d, leaves=%d)" % (self.number, self.n_cps, self.n_leaves)
+
+
+def get_beams(ds):
+    return getattr(ds, "RTBeamSequence", None) or getattr(ds, "BeamSequence", None) or []
+
+
+def build_beam_models(ds):
+    # Um BeamModel por feixe do plano, na ordem de BeamSequence
+    return [BeamModel(beam, idx) for idx, beam in enumerate(get_beams(ds))]
+
+
+def write_back_models(models, journal=None):
+    # Passada única de gravação de todos os feixes editados; retorna os (dataset, tag) alterados
+    changed = []
+    for model in models:
+        if model.is_dirty:
+            changed.extend(model.write_back(journal))
+    return changed
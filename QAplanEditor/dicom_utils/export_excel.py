@@ -1,59 +1,50 @@
 import os
 import tempfile
 import subprocess
+import numpy as np
 import pandas as pd
 from openpyxl import load_workbook
 from PyQt5.QtWidgets import QMessageBox
 
-def export_to_excel(ds):
+import dicom_utils.beam_model as bm
+
+def _beam_sheet_data(model):
+    # Colunas CP0..CPn a partir dos arrays do BeamModel; vazio onde o CP não traz o valor
+    fields = ["gantry", "collimator", "couch", "meterset_weight"]
+    n_cps = model.n_cps
+    half_leaf = (model.n_leaves + 1) // 2
+    table = np.full((len(fields) + 2 * half_leaf, n_cps), "", dtype=object)
+    for row, field in enumerate(fields):
+        defined = model.defined[field]
+        table[row, defined] = getattr(model, field)[defined].tolist()
+    if model.mlc_type:
+        defined = model.defined[model.mlc_type]
+        leaves = model.leaves[defined]
+        values = np.array(leaves.tolist(), dtype=object)
+        values[np.isnan(leaves)] = ""
+        table[len(fields):len(fields) + model.n_leaves, defined] = values.T
+    return half_leaf, {f"CP{idx_cp}": table[:, idx_cp].tolist() for idx_cp in range(n_cps)}
+
+
+def export_to_excel(ds, models=None):
     beams = getattr(ds, "RTBeamSequence", None) or getattr(ds, "BeamSequence", None)
     if not beams:
         QMessageBox.warning(None, "Atenção", "Nenhum feixe disponível.")
         return
+    if models is None:
+        models = bm.build_beam_models(ds)
     tmp_dir = tempfile.gettempdir()
     path = os.path.join(tmp_dir, "CPs_todos_beams.xlsx")
     try:
         writer = pd.ExcelWriter(path, engine="openpyxl")
-        for beam_idx, beam in enumerate(beams):
+        for beam_idx, model in enumerate(models):
             sheet_name = f"Beam_{beam_idx}"
-            cps = beam.ControlPointSequence
-            max_leaf_len = 0
-            for cp in cps:
-                bl_seq = getattr(cp, "BeamLimitingDevicePositionSequence", None)
-                if bl_seq:
-                    for item in bl_seq:
-                        dtype = getattr(item, "RTBeamLimitingDeviceType", "").upper()
-                        if "MLC" in dtype and hasattr(item, "LeafJawPositions"):
-                            leaf_len = len(item.LeafJawPositions)
-                            if leaf_len > max_leaf_len:
-                                max_leaf_len = leaf_len
-                            break
-            if max_leaf_len % 2 != 0:
-                max_leaf_len += 1
-            half_leaf = max_leaf_len // 2
+            half_leaf, data = _beam_sheet_data(model)
             row_labels = ["GantryAngle", "BeamLimitingDeviceAngle", "PatientSupportAngle", "CumulativeMetersetWeight"]
             for i in range(1, half_leaf+1):
                 row_labels.append(f"Leaf_Left_{i}")
             for i in range(1, half_leaf+1):
                 row_labels.append(f"Leaf_Right_{i}")
-            data = {}
-            for idx_cp, cp in enumerate(cps):
-                col = f"CP{idx_cp}"
-                vals = [getattr(cp, "GantryAngle", ""), getattr(cp, "BeamLimitingDeviceAngle", ""), getattr(cp, "PatientSupportAngle", ""), getattr(cp, "CumulativeMetersetWeight", "")]
-                leaf_list = []
-                bl_seq = getattr(cp, "BeamLimitingDevicePositionSequence", None)
-                if bl_seq:
-                    for item in bl_seq:
-                        dtype = getattr(item, "RTBeamLimitingDeviceType", "").upper()
-                        if "MLC" in dtype and hasattr(item, "LeafJawPositions"):
-                            leaf_list = [float(x) for x in item.LeafJawPositions]
-                            break
-                left_vals = leaf_list[:half_leaf] if len(leaf_list)>=half_leaf else leaf_list+[ "" for _ in range(half_leaf-len(leaf_list))]
-                right_vals = leaf_list[half_leaf:half_leaf*2] if len(leaf_list)>=half_leaf*2 else leaf_list[half_leaf:]+["" for _ in range(half_leaf-len(leaf_list[half_leaf:]))]
-                if len(left_vals)<half_leaf: left_vals += ["" for _ in range(half_leaf-len(left_vals))]
-                if len(right_vals)<half_leaf: right_vals += ["" for _ in range(half_leaf-len(right_vals))]
-                vals.extend(left_vals); vals.extend(right_vals)
-                data[col]=vals
             df = pd.DataFrame(data, index=row_labels)
             df.to_excel(writer, sheet_name=sheet_name)
         writer.close()
@@ -78,7 +69,14 @@ def export_to_excel(ds):
         QMessageBox.information(None,"Excel",f"Salvo em:\n{path}")
     QMessageBox.information(None,"Exportado",f"Excel salvo em:\n{path}")
 
-def import_from_excel(ds, beam_idx):
+def import_from_excel(ds, beam_idx, model=None, journal=None):
+    """
+    Aplica a planilha Beam_<beam_idx> ao BeamModel do feixe: só os valores que
+    mudaram ficam marcados para gravação (BeamModel.write_back). Se model não for
+    informado, um modelo é criado e gravado no Dataset ao final.
+    journal (EditJournal em gravação) registra o que for gravado aqui no Dataset.
+    Retorna o modelo usado (ou None em caso de erro).
+    """
     tmp_dir = tempfile.gettempdir()
     path = os.path.join(tmp_dir, "CPs_todos_beams.xlsx")
     if not os.path.exists(path):
@@ -91,51 +89,46 @@ def import_from_excel(ds, beam_idx):
         QMessageBox.critical(None, "Erro", f"Não foi possível ler Excel:\n{e}"); return
     beams = getattr(ds, "RTBeamSequence", None) or getattr(ds, "BeamSequence", None)
     beam = beams[beam_idx]; cps = beam.ControlPointSequence
+    owns_model = model is None or model.beam is not beam
     existing_len = len(cps)
     cp_cols = [c for c in df.columns if c.startswith("CP")]
     total_cols = len(cp_cols)
     if total_cols > existing_len:
+        # A estrutura do feixe muda: grava o que estiver pendente e refaz o modelo
+        if not owns_model: model.write_back(journal)
+        if journal is not None: journal.touch(beam, bm.TAG_CONTROL_POINT_SEQUENCE)
         last = cps[-1]
         import copy as _copy
         for i in range(existing_len,total_cols):
             cps.append(_copy.deepcopy(last))
-    cps = beam.ControlPointSequence
+        model = None
+    if model is None or model.beam is not beam:
+        model = bm.BeamModel(beam, beam_idx)
     leaf_left_rows = [r for r in df.index if r.startswith("Leaf_Left_")]
     half_leaf = len(leaf_left_rows)
+    scalar_rows = [("GantryAngle", "gantry"), ("BeamLimitingDeviceAngle", "collimator"),
+                   ("PatientSupportAngle", "couch"), ("CumulativeMetersetWeight", "meterset_weight")]
     for idx_cp, col in enumerate(cp_cols):
-        cp = cps[idx_cp]
         try:
-            ga = df.at["GantryAngle", col]; 
-            if pd.notna(ga): cp.GantryAngle=float(ga)
-            ba = df.at["BeamLimitingDeviceAngle", col]
-            if pd.notna(ba): cp.BeamLimitingDeviceAngle=float(ba)
-            ta = df.at["PatientSupportAngle", col]
-            if pd.notna(ta): cp.PatientSupportAngle=float(ta)
-            cw = df.at["CumulativeMetersetWeight", col]
-            if pd.notna(cw): cp.CumulativeMetersetWeight=float(cw)
+            for row, field in scalar_rows:
+                val = df.at[row, col]
+                if pd.notna(val): model.set_scalar(field, idx_cp, float(val))
         except Exception as e:
-            QMessageBox.warning(None, "Erro", f"Conversão Ângulos/Fração CP{idx_cp}:\n{e}"); return
+            QMessageBox.warning(None, "Erro", f"Conversão Ângulos/Fração CP{idx_cp}:\n{e}"); return None
         leaf_list=[]
-        for i in range(1, half_leaf+1):
-            try:
-                lv = df.at[f"Leaf_Left_{i}", col]
-                leaf_list.append(float(lv) if pd.notna(lv) else 0.0)
-            except Exception as e:
-                QMessageBox.warning(None,"Erro Leaf Left",f"CP{idx_cp} Leaf_Left_{i}:\n{e}"); return
-        for i in range(1, half_leaf+1):
-            try:
-                lv = df.at[f"Leaf_Right_{i}", col]
-                leaf_list.append(float(lv) if pd.notna(lv) else 0.0)
-            except Exception as e:
-                QMessageBox.warning(None,"Erro Leaf Right",f"CP{idx_cp} Leaf_Right_{i}:\n{e}"); return
-        bl_seq = getattr(cp, "BeamLimitingDevicePositionSequence", None)
-        mlc_item=None
-        if bl_seq:
-            for item in bl_seq:
-                if "MLC" in getattr(item, "RTBeamLimitingDeviceType", "").upper() and hasattr(item, "LeafJawPositions"):
-                    mlc_item = item; break
-        if mlc_item:
-            try: mlc_item.LeafJawPositions = leaf_list
+        for side, label in (("Left", "Erro Leaf Left"), ("Right", "Erro Leaf Right")):
+            for i in range(1, half_leaf+1):
+                try:
+                    lv = df.at[f"Leaf_{side}_{i}", col]
+                    leaf_list.append(float(lv) if pd.notna(lv) else 0.0)
+                except Exception as e:
+                    QMessageBox.warning(None,label,f"CP{idx_cp} Leaf_{side}_{i}:\n{e}"); return None
+        # Como antes, as lâminas só são atualizadas nos CPs que trazem o item do MLC
+        if model.mlc_type and model.defined[model.mlc_type][idx_cp]:
+            try: model.set_leaves(idx_cp, leaf_list[:model.n_leaves])
             except Exception as e:
-                QMessageBox.warning(None,"Erro MLC",f"Não foi possível atribuir LeafJawPositions CP{idx_cp}:\n{e}"); return
+                QMessageBox.warning(None,"Erro MLC",f"Não foi possível atribuir LeafJawPositions CP{idx_cp}:\n{e}"); return None
+    if owns_model:
+        model.write_back(journal)
     QMessageBox.information(None, "Importado", "CPs atualizados em memória. Use 'Salvar Como...' para gravar.")
+    return model
@@ -0,0 +1,170 @@
+"""
+Mapa de fluência acumulada de um feixe, calculado a partir dos arrays do BeamModel.
+
+Cada intervalo entre dois CPs consecutivos contribui com o delta da
+CumulativeMetersetWeight, e a abertura usada é a do ponto médio do intervalo
+(média das posições das lâminas e das jaws nos dois CPs). Em step-and-shoot os
+dois CPs do segmento têm a mesma abertura; em VMAT/sliding window essa média
+aproxima o movimento entre os CPs. Em cada par de lâminas, o trecho aberto vai
+do banco esquerdo ao direito, cortado pelas jaws X, e as linhas de pixels são
+cortadas pelas jaws Y. Nas bordas conta a fração do pixel coberta, e não só se
+o pixel está dentro ou fora.
+
+O cálculo é vetorizado num grid CP × lâmina × pixel, processado em blocos de CPs
+para que a memória fique abaixo de MAX_CHUNK_BYTES. compute_fluence só recebe
+arrays (ver beam_job), para poder rodar num pool de processos; fluence_key
+identifica o resultado pelo conteúdo desses arrays (ver fluence_pool).
+
+Este módulo não depende do Qt.
+"""
+import hashlib
+
+import numpy as np
+
+# Faixa de X (mm) do mapa; em Y, o mapa cobre os limites das lâminas
+X_LIMITS = (-200.0, 200.0)
+# Tamanho do pixel (mm)
+DEFAULT_RESOLUTION = 1.0
+# Memória máxima dos arrays intermediários de um bloco de CPs
+MAX_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def plan_leaf_boundaries(model):
+    """
+    LeafPositionBoundaries (mm, N+1 valores crescentes) do MLC do feixe na
+    BeamLimitingDeviceSequence, ou None se o plano não os traz (ou não batem com
+    o número de lâminas).
+    """
+    if not model.mlc_type:
+        return None
+    for item in getattr(model.beam, "BeamLimitingDeviceSequence", None) or []:
+        if getattr(item, "RTBeamLimitingDeviceType", "") != model.mlc_type:
+            continue
+        values = getattr(item, "LeafPositionBoundaries", None)
+        if not values:
+            return None
+        boundaries = np.asarray([float(v) for v in values])
+        if len(boundaries) != model.n_leaves // 2 + 1 or not (np.diff(boundaries) > 0).all():
+            return None
+        return boundaries
+    return None
+
+
+def uniform_leaf_boundaries(n_pairs, thickness):
+    # Lâminas de mesma espessura centradas em 0 (como o visualizador de MLC)
+    return (np.arange(n_pairs + 1) - n_pairs / 2.0) * thickness
+
+
+def beam_meterset(dataset, beam_number):
+    """BeamMeterset (MU) do feixe na FractionGroupSequence, ou None."""
+    for group in getattr(dataset, "FractionGroupSequence", None) or []:
+        for ref in getattr(group, "ReferencedBeamSequence", None) or []:
+            if getattr(ref, "ReferencedBeamNumber", None) == beam_number:
+                value = getattr(ref, "BeamMeterset", None)
+                return float(value) if value not in (None, "") else None
+    return None
+
+
+def segment_weights(meterset_weight):
+    """
+    Peso de cada intervalo entre CPs: delta da CumulativeMetersetWeight, como
+    fração do total (deltas negativos ou indefinidos contam zero).
+    """
+    weights = np.diff(np.nan_to_num(np.asarray(meterset_weight, dtype=float)))
+    weights[~(weights > 0)] = 0.0
+    total = weights.sum()
+    return weights / total if total > 0 else weights
+
+
+def _midpoints(values):
+    return (values[:-1] + values[1:]) / 2.0
+
+
+def _coverage(lo, hi, edges):
+    # Fração de cada pixel [edges[k], edges[k+1]] dentro de [lo, hi] (lo/hi: (..., 1))
+    width = edges[1:] - edges[:-1]
+    covered = np.minimum(hi, edges[1:]) - np.maximum(lo, edges[:-1])
+    return np.nan_to_num(np.clip(covered / width, 0.0, 1.0))
+
+
+def compute_fluence(leaves, jaw_x, jaw_y, meterset_weight, boundaries,
+                    resolution=DEFAULT_RESOLUTION, chunk_bytes=MAX_CHUNK_BYTES):
+    """
+    Fluência acumulada de um feixe. leaves: n_cps×2N (banco esquerdo e direito,
+    n_cps×0 sem MLC); jaw_x, jaw_y: n_cps×2 (NaN sem a jaw); meterset_weight: n_cps;
+    boundaries: N+1 limites das lâminas em Y (sem MLC, a faixa Y do mapa).
+    Retorna (fluence ny×nx em fração do meterset do feixe, x_edges, y_edges).
+    """
+    boundaries = np.asarray(boundaries, dtype=float)
+    x_edges = np.arange(X_LIMITS[0], X_LIMITS[1] + resolution / 2.0, resolution)
+    y_edges = np.arange(boundaries[0], boundaries[-1] + resolution / 2.0, resolution)
+    fluence = np.zeros((len(y_edges) - 1, len(x_edges) - 1))
+
+    weights = segment_weights(meterset_weight)
+    if not weights.any():
+        return fluence, x_edges, y_edges
+
+    leaves = np.asarray(leaves, dtype=float)
+    n_pairs = leaves.shape[1] // 2
+    if n_pairs:
+        left = _midpoints(leaves[:, :n_pairs])
+        right = _midpoints(leaves[:, n_pairs:])
+    else:
+        # Sem MLC: um único "par" aberto, só as jaws limitam o campo
+        n_pairs = 1
+        left = np.full((len(weights), 1), -np.inf)
+        right = np.full((len(weights), 1), np.inf)
+        boundaries = boundaries[[0, -1]]
+    jaw_x = _midpoints(np.asarray(jaw_x, dtype=float))
+    jaw_y = _midpoints(np.asarray(jaw_y, dtype=float))
+
+    # Trecho aberto de cada par de lâminas (fmax/fmin ignoram a jaw ausente, NaN);
+    # lâminas sem posição definida contam como fechadas
+    lo = np.where(np.isnan(left), np.nan, np.fmax(left, jaw_x[:, :1]))
+    hi = np.where(np.isnan(right), np.nan, np.fmin(right, jaw_x[:, 1:]))
+    # Par de lâminas de cada linha de pixels (centro da linha); fora do MLC: fechado
+    centers = (y_edges[:-1] + y_edges[1:]) / 2.0
+    pair = np.searchsorted(boundaries, centers, side="right") - 1
+    inside = (pair >= 0) & (pair < n_pairs)
+    pair = np.clip(pair, 0, n_pairs - 1)
+
+    used = np.flatnonzero(weights)
+    ny, nx = fluence.shape
+    per_cp = 4 * (n_pairs * nx + ny * nx + ny)
+    chunk = max(1, chunk_bytes // per_cp)
+    for start in range(0, len(used), chunk):
+        cps = used[start:start + chunk]
+        # CP × lâmina × pixel em X
+        open_x = _coverage(lo[cps, :, None], hi[cps, :, None], x_edges).astype(np.float32)
+        # CP × linha em Y: jaws Y (sem jaw Y, linha inteira) e peso do intervalo
+        rows = _coverage(np.fmax(jaw_y[cps, :1], -np.inf), np.fmin(jaw_y[cps, 1:], np.inf), y_edges)
+        rows = (rows * inside * weights[cps, None]).astype(np.float32)
+        fluence += np.einsum("cy,cyx->yx", rows, open_x[:, pair, :])
+    return fluence, x_edges, y_edges
+
+
+def beam_job(model, boundaries, resolution=DEFAULT_RESOLUTION):
+    """
+    Argumentos de compute_fluence para um BeamModel: cópias dos arrays de lâminas,
+    jaws e pesos (o modelo pode ser editado enquanto o job espera na fila).
+    """
+    return (np.array(model.leaves, dtype=float), np.array(model.jaw_x, dtype=float),
+            np.array(model.jaw_y, dtype=float), np.array(model.meterset_weight, dtype=float),
+            np.array(boundaries, dtype=float), float(resolution))
+
+
+def fluence_key(leaves, jaw_x, jaw_y, meterset_weight, boundaries, resolution=DEFAULT_RESOLUTION):
+    """Hash (BLAKE2b) dos argumentos de compute_fluence; muda com qualquer edição do feixe."""
+    digest = hashlib.blake2b(digest_size=20)
+    for values in (leaves, jaw_x, jaw_y, meterset_weight, boundaries):
+        values = np.ascontiguousarray(values, dtype=float)
+        digest.update(repr(values.shape).encode())
+        digest.update(values.tobytes())
+    digest.update(repr(float(resolution)).encode())
+    return digest.hexdigest()
+
+
+def beam_fluence(model, boundaries, resolution=DEFAULT_RESOLUTION):
+    """compute_fluence com os arrays de um BeamModel."""
+    return compute_fluence(model.leaves, model.jaw_x, model.jaw_y, model.meterset_weight,
+                           boundaries, resolution)
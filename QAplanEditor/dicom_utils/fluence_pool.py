@@ -0,0 +1,148 @@
+"""
+Cálculo da fluência de vários feixes num pool de processos, com cache dos mapas.
+
+Cada job é compute_fluence com os arrays compactos do feixe (fluence.beam_job):
+nada do Dataset vai para os processos. Os resultados ficam num cache em memória
+identificado por fluence.fluence_key, o hash do conteúdo desses arrays: um feixe
+editado (na árvore, nos CPs, pela importação do Excel ou por desfazer) gera outra
+chave e é recalculado, e os mapas que não valem mais saem do cache pela ordem
+LRU, até o total caber em max_bytes.
+
+O pool (concurrent.futures.ProcessPoolExecutor) só é criado no primeiro job; o fim
+de cada job é avisado na thread da interface pelo sinal finished(chave). Se o pool
+não puder ser criado ou quebrar, os jobs passam a ser calculados na própria thread
+da interface.
+"""
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+import dicom_utils.fluence as fl
+
+# Memória máxima dos mapas guardados (um mapa de 400 x 400 mm a 1 mm: ~1,3 MB)
+MAX_CACHE_BYTES = 128 * 1024 * 1024
+
+
+def _result_bytes(result):
+    return sum(values.nbytes for values in result)
+
+
+class FluencePool(QObject):
+    # Chave do mapa que acabou de ser calculado (já no cache)
+    finished = pyqtSignal(str)
+    # Chave e mensagem de erro de um job que falhou
+    failed = pyqtSignal(str, str)
+    # Fim de um job, emitido pela thread do executor (conexão enfileirada)
+    _done = pyqtSignal(str, object)
+
+    def __init__(self, workers=None, max_bytes=MAX_CACHE_BYTES, parent=None):
+        super().__init__(parent)
+        self.workers = workers
+        self.max_bytes = max_bytes
+        self._executor = None
+        # chave -> (fluence, x_edges, y_edges), do usado há mais tempo para o mais recente
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        # chave -> Future dos jobs em andamento
+        self._pending = {}
+        self._done.connect(self._on_done)
+
+    def get(self, key):
+        """Mapa já calculado (fluence, x_edges, y_edges), ou None."""
+        result = self._cache.get(key)
+        if result is not None:
+            self._cache.move_to_end(key)
+        return result
+
+    def is_pending(self, key):
+        return key in self._pending
+
+    def pending_count(self):
+        return len(self._pending)
+
+    def submit(self, key, args):
+        """
+        Agenda compute_fluence(*args) se o mapa da chave não está no cache nem em
+        andamento. args: tupla de fluence.beam_job.
+        """
+        if key in self._cache or key in self._pending:
+            return
+        executor = self._get_executor()
+        if executor is not None:
+            try:
+                future = executor.submit(fl.compute_fluence, *args)
+            except (BrokenProcessPool, RuntimeError, OSError):
+                self._executor = None
+                self.workers = 0
+            else:
+                self._pending[key] = future
+                future.add_done_callback(lambda f, key=key: self._done.emit(key, f))
+                return
+        # Sem pool: calcula aqui mesmo
+        try:
+            self._store(key, fl.compute_fluence(*args))
+        except Exception as e:
+            self.failed.emit(key, str(e))
+            return
+        self.finished.emit(key)
+
+    def cancel_except(self, keys):
+        """Cancela os jobs ainda na fila cujas chaves não estão em keys."""
+        keys = set(keys)
+        for key, future in list(self._pending.items()):
+            if key not in keys and future.cancel():
+                del self._pending[key]
+
+    def clear(self):
+        self.cancel_except(())
+        self._cache.clear()
+        self._cache_bytes = 0
+
+    def shutdown(self):
+        """
+        Cancela os jobs na fila e espera os processos terminarem (só os jobs já em
+        execução, no máximo um por processo), para o pool não ficar com a thread de
+        gerenciamento viva até a saída do interpretador.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        self._pending = {}
+
+    def _get_executor(self):
+        if self._executor is None and self.workers != 0:
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, ValueError, NotImplementedError):
+                self.workers = 0
+        return self._executor
+
+    def _store(self, key, result):
+        self._cache[key] = result
+        self._cache_bytes += _result_bytes(result)
+        while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+            _, old = self._cache.popitem(last=False)
+            self._cache_bytes -= _result_bytes(old)
+
+    def _on_done(self, key, future):
+        if self._pending.get(key) is not future:
+            # Cancelado ou de um pool já encerrado
+            return
+        del self._pending[key]
+        if future.cancelled():
+            return
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # Processo do pool morreu: os próximos jobs rodam na thread da interface
+            self._executor = None
+            self.workers = 0
+            self.failed.emit(key, str(e) or "pool de processos interrompido")
+            return
+        except Exception as e:
+            self.failed.emit(key, str(e))
+            return
+        self._store(key, result)
+        self.finished.emit(key)
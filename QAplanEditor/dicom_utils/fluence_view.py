@@ -0,0 +1,78 @@
+"""
+Janela do mapa de fluência acumulada de um feixe (ver dicom_utils.fluence).
+
+A janela só exibe o resultado: quem calcula é a janela principal (os mapas de
+todos os feixes, num FluencePool), que preenche a lista de feixes com set_beams e
+chama show_fluence quando o mapa do feixe escolhido fica pronto.
+"""
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.figure import Figure
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QComboBox, QDialog, QHBoxLayout, QLabel, QVBoxLayout
+
+
+class FluenceDialog(QDialog):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Fluência do Feixe")
+        self.resize(640, 640)
+        layout = QVBoxLayout(self)
+        beam_layout = QHBoxLayout()
+        beam_layout.addWidget(QLabel("Feixe:"))
+        self.beam_combo = QComboBox()
+        beam_layout.addWidget(self.beam_combo, 1)
+        self.lbl_status = QLabel("")
+        beam_layout.addWidget(self.lbl_status)
+        layout.addLayout(beam_layout)
+        self.fig = Figure(figsize=(5, 5))
+        self.canvas = FigureCanvas(self.fig)
+        layout.addWidget(self.canvas)
+        self.lbl_info = QLabel("")
+        self.lbl_info.setAlignment(Qt.AlignLeft)
+        self.lbl_info.setWordWrap(True)
+        layout.addWidget(self.lbl_info)
+
+    def set_beams(self, labels, current=0):
+        """Preenche a lista de feixes (sem emitir a troca de feixe)."""
+        self.beam_combo.blockSignals(True)
+        self.beam_combo.clear()
+        self.beam_combo.addItems(labels)
+        if labels:
+            self.beam_combo.setCurrentIndex(min(current, len(labels) - 1))
+        self.beam_combo.blockSignals(False)
+
+    def select_beam(self, index):
+        self.beam_combo.blockSignals(True)
+        self.beam_combo.setCurrentIndex(index)
+        self.beam_combo.blockSignals(False)
+
+    def selected_beam(self):
+        return max(self.beam_combo.currentIndex(), 0)
+
+    def set_status(self, text):
+        self.lbl_status.setText(text)
+
+    def show_fluence(self, title, fluence, x_edges, y_edges, meterset=None, info=""):
+        """
+        Desenha o mapa (fração do meterset do feixe; em MU se meterset for dado),
+        com a mesma orientação do visualizador de MLC (Y crescendo para baixo).
+        """
+        values = fluence * meterset if meterset else fluence
+        self.fig.clear()
+        ax = self.fig.add_subplot(111)
+        image = ax.imshow(values, extent=(x_edges[0], x_edges[-1], y_edges[-1], y_edges[0]),
+                          origin="upper", cmap="viridis", interpolation="nearest")
+        self.fig.colorbar(image, ax=ax, label="MU" if meterset else "Fração do meterset")
+        ax.set_xlabel("Posição X (mm)")
+        ax.set_ylabel("Posição Y (mm)")
+        ax.set_title(title)
+        self.canvas.draw_idle()
+        unit = "MU" if meterset else ""
+        self.lbl_info.setText(f"Máximo: {values.max():.3f} {unit}".rstrip() + (f" · {info}" if info else ""))
+
+    def show_message(self, title):
+        self.fig.clear()
+        self.fig.add_subplot(111).set_title(title)
+        self.canvas.draw_idle()
+        self.lbl_info.setText("")
@@ -0,0 +1,228 @@
+"""
+Histórico de desfazer/refazer das edições de um Dataset.
+
+Cada passo guarda só os elementos alterados, identificados por (dataset, tag), com
+o estado antes e depois da edição:
+  - RawDataElement: a própria tupla (imutável; nenhuma cópia)
+  - DataElement: (VR, valor)
+  - sequência: a lista dos itens (referências)
+  - None: elemento ausente
+
+Valores multivalorados com o mesmo número de valores antes e depois (ex.: algumas
+lâminas de LeafJawPositions alteradas) são guardados como patch, só com as
+posições que mudaram; nos elementos brutos, o patch é feito nos valores em bytes.
+
+Quem edita chama touch(dataset, tag) antes de alterar o elemento, dentro de um
+passo (record/begin...commit); no commit o estado novo é lido e os elementos que
+não mudaram são descartados. Desfazer e refazer custam o tamanho do passo.
+
+Cada touch também marca o elemento em `modified`, que não é esvaziado pelo
+histórico: reader.save_dicom_file grava com os bytes originais as sequências que
+não contêm nada marcado.
+
+Este módulo não depende do Qt.
+"""
+from contextlib import contextmanager
+
+import numpy as np
+from pydicom.dataelem import RawDataElement
+from pydicom.tag import Tag
+
+# Número máximo de passos guardados (os mais antigos são descartados)
+MAX_STEPS = 500
+# Valores multivalorados a partir deste tamanho são guardados como patch
+PATCH_MIN_VALUES = 8
+
+
+def _state(ds, tag):
+    elem = ds.get_item(tag)
+    if elem is None or isinstance(elem, RawDataElement):
+        return elem
+    if elem.VR == "SQ":
+        return ("seq", list(elem.value))
+    value = elem.value
+    if isinstance(value, (list, tuple)) or hasattr(value, "append"):
+        value = list(value)
+    return ("elem", elem.VR, value)
+
+
+def _same(a, b):
+    if a is None or b is None or isinstance(a, RawDataElement) or isinstance(b, RawDataElement):
+        return a is b
+    if a[0] != b[0]:
+        return False
+    if a[0] == "seq":
+        return len(a[1]) == len(b[1]) and all(x is y for x, y in zip(a[1], b[1]))
+    return a[1] == b[1] and a[2] == b[2]
+
+
+def _values(state):
+    # Valores multivalorados de um estado, para o patch (None se não se aplica)
+    if isinstance(state, RawDataElement):
+        if isinstance(state.value, bytes) and state.value:
+            return state.value.split(b"\\")
+        return None
+    if isinstance(state, tuple) and state[0] == "elem" and isinstance(state[2], list):
+        return state[2]
+    return None
+
+
+def _patched(values, idx, replacement):
+    values = list(values)
+    for i, value in zip(idx, replacement):
+        values[i] = value
+    return values
+
+
+class _Change:
+    """Um elemento alterado num passo: estado antigo e novo (ou patch)."""
+    __slots__ = ("dataset", "tag", "old", "new", "patch")
+
+    def __init__(self, dataset, tag, old, new):
+        self.dataset = dataset
+        self.tag = tag
+        self.patch = None
+        old_values = _values(old)
+        new_values = _values(new)
+        if (old_values is not None and new_values is not None
+                and isinstance(old, RawDataElement) == isinstance(new, RawDataElement)
+                and (isinstance(old, RawDataElement) or old[1] == new[1])
+                and len(old_values) == len(new_values) >= PATCH_MIN_VALUES):
+            # Só as posições que mudaram
+            idx = np.array([i for i, (a, b) in enumerate(zip(old_values, new_values)) if a != b],
+                           dtype=np.int32)
+            self.patch = (idx, [old_values[i] for i in idx], [new_values[i] for i in idx])
+            old = new = None
+        self.old = old
+        self.new = new
+
+    def apply(self, undo):
+        ds, tag = self.dataset, self.tag
+        if self.patch is not None:
+            idx, old_values, new_values = self.patch
+            replacement = old_values if undo else new_values
+            elem = ds.get_item(tag)
+            if isinstance(elem, RawDataElement):
+                raw = b"\\".join(_patched(elem.value.split(b"\\"), idx, replacement))
+                ds[tag] = elem._replace(value=raw, length=len(raw))
+            else:
+                elem.value = _patched(elem.value, idx, replacement)
+            return
+        state = self.old if undo else self.new
+        if state is None:
+            if tag in ds:
+                del ds[tag]
+        elif isinstance(state, RawDataElement):
+            ds[tag] = state
+        elif state[0] == "seq":
+            ds[tag].value = list(state[1])
+        else:
+            _, vr, value = state
+            elem = ds.get_item(tag)
+            if elem is None or isinstance(elem, RawDataElement) or elem.VR != vr:
+                ds.add_new(tag, vr, value)
+            else:
+                # No lugar: a árvore e os modelos mantêm a referência do elemento
+                elem.value = value
+
+
+class _Step:
+    __slots__ = ("label", "changes")
+
+    def __init__(self, label, changes):
+        self.label = label
+        self.changes = changes
+
+
+class EditJournal:
+
+    def __init__(self, max_steps=MAX_STEPS):
+        self.max_steps = max_steps
+        self._undo = []
+        self._redo = []
+        # Passo em gravação: label, profundidade (record aninhado) e estados antigos
+        self._label = None
+        self._depth = 0
+        self._touched = {}
+        # id(dataset) -> (dataset, tags) de tudo que já passou por touch
+        self.modified = {}
+
+    def begin(self, label):
+        if self._depth == 0:
+            self._label = label
+            self._touched = {}
+        self._depth += 1
+
+    def touch(self, ds, tag):
+        """Guarda o estado atual do elemento (uma vez por passo), antes de alterá-lo."""
+        tag = Tag(tag)
+        self.modified.setdefault(id(ds), (ds, set()))[1].add(tag)
+        if self._depth == 0:
+            return
+        key = (id(ds), tag)
+        if key not in self._touched:
+            self._touched[key] = (ds, tag, _state(ds, tag))
+
+    def commit(self):
+        """Fecha o passo; retorna False se nada mudou (o passo não entra no histórico)."""
+        self._depth -= 1
+        if self._depth > 0:
+            return True
+        changes = []
+        for ds, tag, old in self._touched.values():
+            new = _state(ds, tag)
+            if not _same(old, new):
+                changes.append(_Change(ds, tag, old, new))
+        self._touched = {}
+        if not changes:
+            return False
+        self._undo.append(_Step(self._label, changes))
+        del self._undo[:-self.max_steps]
+        self._redo = []
+        return True
+
+    @contextmanager
+    def record(self, label):
+        # Passo de edição: with journal.record("..."): journal.touch(...); <altera>
+        self.begin(label)
+        try:
+            yield self
+        finally:
+            self.commit()
+
+    @property
+    def can_undo(self):
+        return bool(self._undo)
+
+    @property
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo_label(self):
+        return self._undo[-1].label if self._undo else None
+
+    def redo_label(self):
+        return self._redo[-1].label if self._redo else None
+
+    def undo(self):
+        """Desfaz o último passo; retorna os (dataset, tag) alterados (ou [])."""
+        if not self._undo:
+            return []
+        step = self._undo.pop()
+        for change in reversed(step.changes):
+            change.apply(undo=True)
+        self._redo.append(step)
+        return [(change.dataset, change.tag) for change in step.changes]
+
+    def redo(self):
+        if not self._redo:
+            return []
+        step = self._redo.pop()
+        for change in step.changes:
+            change.apply(undo=False)
+        self._undo.append(step)
+        return [(change.dataset, change.tag) for change in step.changes]
+
+    def clear(self):
+        self._undo = []
+        self._redo = []
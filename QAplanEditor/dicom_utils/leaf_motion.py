@@ -0,0 +1,122 @@
+"""
+Deslocamento e velocidade das lâminas entre CPs, calculados a partir dos arrays do
+BeamModel.
+
+Para cada intervalo entre dois CPs consecutivos e cada lâmina:
+  - deslocamento: |posição no CP seguinte - posição no CP atual| (mm)
+  - tempo mínimo do intervalo: o maior entre o giro do gantry na velocidade
+    máxima (|delta do GantryAngle|, pelo menor caminho, como os ângulos de
+    getGantry no EFS) e a entrega do delta de MU na taxa de dose máxima (só com
+    o BeamMeterset do feixe)
+  - velocidade implícita: deslocamento / tempo mínimo (mm/s), a velocidade que a
+    lâmina precisaria ter para o arco não ser freado
+
+Intervalos de tempo zero (gantry parado e sem MU, ex.: step-and-shoot) não têm
+velocidade definida (NaN) e nunca são marcados. O percurso de cada lâmina é a
+soma dos deslocamentos. Tudo é calculado numa única passada vetorizada sobre a
+matriz CP × lâmina.
+
+Este módulo não depende do Qt.
+"""
+import numpy as np
+
+# Limites de cada modelo de MLC (os nomes do "Modelo MLC" da janela principal):
+# velocidade das lâminas (mm/s), do gantry (graus/s) e taxa de dose (MU/min)
+MACHINE_LIMITS = {
+    "Agility": {"leaf_speed": 35.0, "gantry_speed": 6.0, "dose_rate": 600.0},
+    "MLCi2": {"leaf_speed": 20.0, "gantry_speed": 6.0, "dose_rate": 600.0},
+}
+DEFAULT_MODEL = "Agility"
+
+
+def machine_limits(model_name):
+    """Cópia dos limites do modelo (os do DEFAULT_MODEL se o nome não for conhecido)."""
+    return dict(MACHINE_LIMITS.get(model_name, MACHINE_LIMITS[DEFAULT_MODEL]))
+
+
+def leaf_labels(n_leaves):
+    # Mesmos nomes das linhas da planilha do Excel (Leaf_Left_1..., Leaf_Right_1...)
+    half = n_leaves // 2
+    return [f"Leaf_Left_{i}" for i in range(1, half + 1)] + \
+        [f"Leaf_Right_{i}" for i in range(1, n_leaves - half + 1)]
+
+
+def gantry_deltas(gantry):
+    """|delta do ângulo| entre CPs consecutivos (graus), pelo menor caminho (0..180)."""
+    delta = np.diff(np.asarray(gantry, dtype=float))
+    return np.abs((delta + 180.0) % 360.0 - 180.0)
+
+
+class LeafMotion:
+    """
+    Resultado de analyze_leaf_motion (intervalo i: do CP i ao CP i+1):
+      displacement: (n_cps-1)×N, mm (NaN onde a lâmina não tem posição)
+      travel: N, percurso total de cada lâmina (mm)
+      segment_time: n_cps-1, tempo mínimo de cada intervalo (s)
+      speed: (n_cps-1)×N, velocidade implícita (mm/s; NaN com tempo zero)
+      over: (n_cps-1)×N, bool, velocidade acima de limits["leaf_speed"]
+    """
+
+    def __init__(self, displacement, segment_time, speed, limits):
+        self.displacement = displacement
+        self.segment_time = segment_time
+        self.speed = speed
+        self.limits = limits
+        self.travel = np.nansum(displacement, axis=0)
+        with np.errstate(invalid="ignore"):
+            self.over = speed > limits["leaf_speed"]
+
+    @property
+    def n_leaves(self):
+        return self.displacement.shape[1]
+
+    def max_speed(self):
+        """Velocidade máxima por lâmina (NaN sem intervalo com tempo definido)."""
+        speed = np.where(np.isnan(self.speed), -np.inf, self.speed)
+        best = speed.max(axis=0, initial=-np.inf)
+        return np.where(np.isinf(best), np.nan, best)
+
+    def flagged_leaves(self):
+        """
+        Lâminas com algum intervalo acima do limite, da mais rápida para a mais lenta:
+        [(lâmina, velocidade máxima, intervalo da máxima, nº de intervalos acima), ...]
+        """
+        counts = self.over.sum(axis=0)
+        leaves = np.flatnonzero(counts)
+        if not len(leaves):
+            return []
+        speed = np.where(np.isnan(self.speed[:, leaves]), -np.inf, self.speed[:, leaves])
+        worst = speed.argmax(axis=0)
+        peaks = speed[worst, np.arange(len(leaves))]
+        order = np.argsort(-peaks)
+        return [(int(leaves[i]), float(peaks[i]), int(worst[i]), int(counts[leaves[i]])) for i in order]
+
+
+def analyze_leaf_motion(leaves, gantry, meterset_weight, limits, meterset=None):
+    """
+    leaves: n_cps×N posições das lâminas; gantry: n_cps ângulos (graus);
+    meterset_weight: n_cps CumulativeMetersetWeight; limits: dicionário como em
+    MACHINE_LIMITS; meterset: BeamMeterset (MU) do feixe, ou None.
+    """
+    leaves = np.asarray(leaves, dtype=float)
+    n_intervals = max(leaves.shape[0] - 1, 0)
+    displacement = np.abs(np.diff(leaves, axis=0))
+
+    time = np.zeros(n_intervals)
+    if limits.get("gantry_speed"):
+        time = gantry_deltas(gantry) / limits["gantry_speed"]
+    if meterset and limits.get("dose_rate"):
+        weight = np.asarray(meterset_weight, dtype=float)
+        total = np.nanmax(weight) if len(weight) else 0.0
+        if total > 0:
+            mu = np.clip(np.nan_to_num(np.diff(weight)), 0.0, None) / total * meterset
+            time = np.maximum(time, mu / (limits["dose_rate"] / 60.0))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(time[:, None] > 0, displacement / time[:, None], np.nan)
+    return LeafMotion(displacement, time, speed, limits)
+
+
+def beam_leaf_motion(model, limits, meterset=None):
+    """analyze_leaf_motion com os arrays de um BeamModel."""
+    return analyze_leaf_motion(model.leaves, model.gantry, model.meterset_weight, limits, meterset)
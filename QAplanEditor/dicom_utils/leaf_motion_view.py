@@ -0,0 +1,124 @@
+"""
+Janela da análise de deslocamento e velocidade das lâminas (ver dicom_utils.leaf_motion).
+
+Como a janela da fluência, só exibe o resultado: a janela principal calcula e
+chama show_motion. Os limites da máquina ficam editáveis aqui (preenchidos com
+os do "Modelo MLC"); cada alteração emite limits_changed.
+"""
+import numpy as np
+from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.colors import ListedColormap
+from matplotlib.figure import Figure
+from PyQt5.QtCore import Qt, pyqtSignal
+from PyQt5.QtWidgets import (
+    QAbstractItemView, QDialog, QDoubleSpinBox, QHBoxLayout, QLabel, QTableWidget,
+    QTableWidgetItem, QVBoxLayout
+)
+
+# Linhas da tabela de lâminas acima do limite
+MAX_TABLE_ROWS = 200
+
+
+class LeafMotionDialog(QDialog):
+    limits_changed = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Velocidade das Lâminas")
+        self.resize(820, 760)
+        layout = QVBoxLayout(self)
+
+        limits_layout = QHBoxLayout()
+        self.lbl_model = QLabel("")
+        limits_layout.addWidget(self.lbl_model)
+        self.spin_leaf = self._spin_box(limits_layout, "Lâminas (mm/s):", 1.0, 500.0, 1)
+        self.spin_gantry = self._spin_box(limits_layout, "Gantry (graus/s):", 0.1, 60.0, 2)
+        self.spin_dose_rate = self._spin_box(limits_layout, "Taxa de dose (MU/min):", 0.0, 5000.0, 0)
+        limits_layout.addStretch(1)
+        layout.addLayout(limits_layout)
+
+        self.fig = Figure(figsize=(7, 5))
+        self.canvas = FigureCanvas(self.fig)
+        layout.addWidget(self.canvas, 3)
+        self.lbl_info = QLabel("")
+        self.lbl_info.setAlignment(Qt.AlignLeft)
+        self.lbl_info.setWordWrap(True)
+        layout.addWidget(self.lbl_info)
+
+        self.table = QTableWidget(0, 4)
+        self.table.setHorizontalHeaderLabels(
+            ["Lâmina", "Velocidade máx. (mm/s)", "Intervalo da máx.", "Intervalos acima"])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.table, 1)
+
+    def _spin_box(self, layout, text, minimum, maximum, decimals):
+        layout.addWidget(QLabel(text))
+        spin = QDoubleSpinBox()
+        spin.setRange(minimum, maximum)
+        spin.setDecimals(decimals)
+        spin.valueChanged.connect(lambda _: self.limits_changed.emit())
+        layout.addWidget(spin)
+        return spin
+
+    def set_limits(self, limits, model_name=""):
+        """Preenche os limites (sem emitir limits_changed)."""
+        for spin, key in ((self.spin_leaf, "leaf_speed"), (self.spin_gantry, "gantry_speed"),
+                          (self.spin_dose_rate, "dose_rate")):
+            spin.blockSignals(True)
+            spin.setValue(limits.get(key) or 0.0)
+            spin.blockSignals(False)
+        self.lbl_model.setText(f"Limites ({model_name}):" if model_name else "Limites:")
+
+    def limits(self):
+        return {"leaf_speed": self.spin_leaf.value(), "gantry_speed": self.spin_gantry.value(),
+                "dose_rate": self.spin_dose_rate.value()}
+
+    def show_motion(self, title, motion, labels, info=""):
+        """
+        Desenha a velocidade por intervalo × lâmina (acima do limite em vermelho) e o
+        percurso total de cada lâmina, e lista as lâminas acima do limite.
+        """
+        self.fig.clear()
+        ax_speed, ax_travel = self.fig.subplots(2, 1, sharex=True, gridspec_kw={"height_ratios": [3, 1]})
+        n_intervals, n_leaves = motion.speed.shape
+        extent = (0.5, n_leaves + 0.5, n_intervals - 0.5, -0.5)
+        image = ax_speed.imshow(motion.speed, aspect="auto", extent=extent, cmap="viridis",
+                                interpolation="nearest", vmin=0.0, vmax=max(motion.limits["leaf_speed"], 1e-6))
+        ax_speed.imshow(np.ma.masked_where(~motion.over, motion.over), aspect="auto", extent=extent,
+                        cmap=ListedColormap(["red"]), interpolation="nearest")
+        self.fig.colorbar(image, ax=[ax_speed, ax_travel], label="Velocidade (mm/s)")
+        ax_speed.set_ylabel("Intervalo (CP i → i+1)")
+        ax_speed.set_title(title)
+        ax_travel.bar(np.arange(1, n_leaves + 1), motion.travel, width=1.0, color="gray")
+        ax_travel.set_xlabel("Lâmina (esquerda 1..N, direita N+1..2N)")
+        ax_travel.set_ylabel("Percurso (mm)")
+        self.canvas.draw_idle()
+
+        flagged = motion.flagged_leaves()
+        peak = motion.max_speed()
+        parts = []
+        if n_leaves:
+            worst = int(np.argmax(motion.travel))
+            parts.append(f"Maior percurso: {motion.travel[worst]:.1f} mm ({labels[worst]})")
+        if not np.isnan(peak).all():
+            fastest = int(np.nanargmax(peak))
+            parts.append(f"velocidade máxima: {peak[fastest]:.1f} mm/s ({labels[fastest]})")
+        parts.append(f"{len(flagged)} lâmina(s) acima de {motion.limits['leaf_speed']:g} mm/s, "
+                     f"em {int(motion.over.any(axis=1).sum())} de {n_intervals} intervalos")
+        if info:
+            parts.append(info)
+        self.lbl_info.setText(" · ".join(parts))
+
+        rows = flagged[:MAX_TABLE_ROWS]
+        self.table.setRowCount(len(rows))
+        for row, (leaf, speed, interval, count) in enumerate(rows):
+            for col, text in enumerate((labels[leaf], f"{speed:.1f}", f"CP{interval} → CP{interval + 1}", str(count))):
+                self.table.setItem(row, col, QTableWidgetItem(text))
+
+    def show_message(self, title):
+        self.fig.clear()
+        self.fig.add_subplot(111).set_title(title)
+        self.canvas.draw_idle()
+        self.lbl_info.setText("")
+        self.table.setRowCount(0)
@@ -0,0 +1,159 @@
+"""
+Carregamento de um RTPLAN fora da thread da interface.
+
+load_plan lê o arquivo (com a mesma recuperação de open_dicom_file: sem preâmbulo
+válido, relê com force=True), monta os BeamModel de todos os feixes e o TagIndex
+da busca, ou os recupera do PlanCache quando o mesmo arquivo já foi aberto.
+PlanLoadThread executa load_plan numa QThread, avisa o andamento por sinais e
+pode ser interrompida com requestInterruption(); a janela só troca o plano aberto
+quando recebe o resultado completo (sinal loaded).
+"""
+import io
+import os
+
+import pydicom
+from pydicom.errors import InvalidDicomError
+from PyQt5.QtCore import QThread, pyqtSignal
+
+import dicom_utils.beam_model as bm
+from dicom_utils.plan_cache import content_key
+from dicom_utils.tag_index import TagIndex
+
+# Faixas da barra de progresso (%) de cada etapa
+READ_RANGE = (0, 30)
+BEAMS_RANGE = (30, 65)
+INDEX_RANGE = (65, 100)
+
+
+class LoadCanceled(Exception):
+    """Carregamento interrompido pelo usuário."""
+
+
+class LoadedPlan:
+    """
+    Resultado de load_plan: dataset, BeamModel por feixe e índice de busca; source
+    são os bytes do arquivo lido (reaproveitados na gravação, ver
+    reader.save_dicom_file) e size o seu tamanho.
+    """
+
+    def __init__(self, path, source, dataset, beam_models, tag_index):
+        self.path = path
+        self.source = source
+        self.size = len(source)
+        self.dataset = dataset
+        self.beam_models = beam_models
+        self.tag_index = tag_index
+
+
+# Tamanho dos blocos lidos do disco (o progresso é avisado a cada bloco)
+READ_CHUNK = 1 << 20
+
+
+def _scaled(progress, span, text):
+    # Callback da etapa: fração 0..1 -> % dentro da faixa span
+    start, end = span
+
+    def report(fraction):
+        progress(int(start + (end - start) * fraction), text)
+    return report
+
+
+def read_file_bytes(path, progress=None):
+    # Conteúdo do arquivo, lido em blocos; progress(fração) a cada bloco
+    size = os.path.getsize(path) or 1
+    chunks = []
+    done = 0
+    with open(path, "rb") as fp:
+        while True:
+            chunk = fp.read(READ_CHUNK)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(min(done / size, 1.0))
+    return b"".join(chunks)
+
+
+def parse_dataset(data, path=None):
+    """pydicom.dcmread dos bytes do arquivo, com a recuperação de open_dicom_file."""
+    try:
+        dataset = pydicom.dcmread(io.BytesIO(data))
+    except InvalidDicomError:
+        dataset = pydicom.dcmread(io.BytesIO(data), force=True)
+    dataset.filename = path
+    return dataset
+
+
+def load_plan(path, progress=None, cache=None):
+    """
+    Lê o RTPLAN e prepara tudo o que a janela precisa para exibi-lo. progress(%, texto)
+    é chamado a cada etapa; se levantar LoadCanceled, o carregamento é abandonado.
+    cache (PlanCache, opcional) fornece ou guarda os feixes e o índice do arquivo.
+    """
+    if progress is None:
+        progress = lambda percent, text: None
+    name = os.path.basename(path)
+
+    progress(READ_RANGE[0], f"Lendo {name}...")
+    data = read_file_bytes(path, _scaled(progress, READ_RANGE, f"Lendo {name}..."))
+    dataset = parse_dataset(data, path)
+
+    key = content_key(data) if cache is not None else None
+    cached = cache.load(key, len(data), dataset) if cache is not None else None
+    if cached is not None:
+        beam_models, tag_index = cached
+        progress(INDEX_RANGE[1], "Concluído")
+        return LoadedPlan(path, data, dataset, beam_models, tag_index)
+
+    beams = bm.get_beams(dataset)
+    report = _scaled(progress, BEAMS_RANGE, "Montando os feixes...")
+    beam_models = []
+    for idx, beam in enumerate(beams):
+        report(idx / len(beams))
+        beam_models.append(bm.BeamModel(beam, idx))
+
+    report = _scaled(progress, INDEX_RANGE, "Indexando as tags...")
+    report(0.0)
+    tag_index = TagIndex(dataset, step=lambda: report(0.0))
+    if cache is not None:
+        progress(INDEX_RANGE[1], "Gravando o cache...")
+        cache.store(key, path, beam_models, tag_index)
+    progress(INDEX_RANGE[1], "Concluído")
+    return LoadedPlan(path, data, dataset, beam_models, tag_index)
+
+
+class PlanLoadThread(QThread):
+    """
+    Executa load_plan em segundo plano. Sinais:
+      progress(int, str) - % e descrição da etapa
+      loaded(LoadedPlan) - carregamento concluído
+      failed(str)        - erro de leitura (mensagem)
+    Interrompida (requestInterruption), termina sem emitir loaded nem failed.
+    """
+    progress = pyqtSignal(int, str)
+    loaded = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, path, cache=None, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self.cache = cache
+        self._last = None
+
+    def _report(self, percent, text):
+        if self.isInterruptionRequested():
+            raise LoadCanceled()
+        if (percent, text) != self._last:
+            self._last = (percent, text)
+            self.progress.emit(percent, text)
+
+    def run(self):
+        try:
+            plan = load_plan(self.path, self._report, self.cache)
+        except LoadCanceled:
+            return
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.loaded.emit(plan)
@@ -0,0 +1,241 @@
+"""
+Desenho do MLC e das jaws de um CP num Axes do matplotlib.
+
+Os artistas são criados uma vez por layout (uma PolyCollection por banco de
+lâminas, as quatro linhas das jaws, a legenda e o título); na troca de CP só os
+vértices, as posições das linhas e os textos mudam. Esses artistas são
+`animated`: canvas.draw() desenha apenas o fundo (eixos, grade, rótulos), que é
+guardado com copy_from_bbox, e cada CP é desenhado por blitting (restore_region,
+draw_artist, blit). O desenho completo só é refeito quando o layout muda (número
+de lâminas, espessura, limites do eixo Y) ou o canvas é redimensionado.
+
+Os quadros já desenhados ficam num cache LRU (regiões copiadas do canvas, até
+MAX_FRAME_CACHE_BYTES), identificados pela chave que quem chama passa a draw_cp
+(ex.: (feixe, CP)); mostrar um quadro do cache é só restore_region + blit.
+prefetch desenha um quadro fora da tela direto para o cache. O cache é esvaziado
+a cada desenho completo do fundo e por clear_frames (CPs editados).
+"""
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.collections import PolyCollection
+
+# Faixa em X (mm) desenhada; cada lâmina vai da borda do campo até a sua posição
+X_LIMITS = (-200.0, 200.0)
+LEAF_STYLE = dict(facecolor="lightgray", edgecolor="black")
+X_JAW_STYLE = dict(color="red", linestyle="--", linewidth=1.5)
+Y_JAW_STYLE = dict(color="blue", linestyle="--", linewidth=1.5)
+# Memória máxima dos quadros em cache (cada um ocupa largura x altura x 4 bytes)
+MAX_FRAME_CACHE_BYTES = 64 * 1024 * 1024
+
+
+class MLCRenderer:
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.canvas = ax.figure.canvas
+        # (n_lâminas_por_banco, espessura) dos artistas atuais; None: eixos sem MLC
+        self._layout = None
+        self._background = None
+        self._rows = None
+        self._banks = []
+        self._x_jaws = []
+        self._y_jaws = []
+        self._legend = None
+        self._legend_handles = ()
+        # chave -> região do canvas com o quadro desenhado (LRU)
+        self._frames = OrderedDict()
+        # Quadro em exibição: argumentos de draw_cp e a região desenhada
+        self._shown = None
+        self._shown_region = None
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+
+    # ------------------------------------------------------------------
+    #    Estrutura
+    # ------------------------------------------------------------------
+    def show_message(self, title=""):
+        """Eixos vazios, só com o título (sem feixe, sem MLC no CP...)."""
+        self.ax.clear()
+        self._layout = None
+        self._shown = None
+        self._legend = None
+        self._legend_handles = ()
+        if title:
+            self.ax.set_title(title)
+        self.canvas.draw()
+
+    def _build(self, n_leaves, thickness):
+        ax = self.ax
+        ax.clear()
+        half_height = n_leaves * thickness / 2.0
+        bottom = np.arange(n_leaves) * thickness - half_height
+        self._rows = (bottom, bottom + thickness)
+        self._banks = []
+        for _ in range(2):
+            bank = PolyCollection(np.zeros((0, 4, 2)), animated=True, **LEAF_STYLE)
+            ax.add_collection(bank, autolim=False)
+            self._banks.append(bank)
+        self._x_jaws = [ax.axvline(x=0.0, animated=True, visible=False, **X_JAW_STYLE) for _ in range(2)]
+        self._y_jaws = [ax.axhline(y=0.0, animated=True, visible=False, **Y_JAW_STYLE) for _ in range(2)]
+        self._x_jaws[0].set_label("X Jaw Esquerda")
+        self._x_jaws[1].set_label("X Jaw Direita")
+        self._legend = None
+        self._legend_handles = ()
+        ax.title.set_animated(True)
+        ax.set_xlim(*X_LIMITS)
+        ax.set_ylim(half_height, -half_height)
+        ax.set_xlabel("Posição X (mm)")
+        ax.set_ylabel("Posição Y (mm)")
+        ax.grid(True, linestyle=":", linewidth=0.5, alpha=0.6)
+        self._layout = (n_leaves, thickness)
+
+    # ------------------------------------------------------------------
+    #    Atualização por CP
+    # ------------------------------------------------------------------
+    def draw_cp(self, left, right, x_jaws, y_jaws, thickness, title, key=None):
+        """
+        Desenha um CP: left/right são as posições (mm) dos dois bancos, x_jaws e
+        y_jaws os pares das jaws (ou None se ausentes). Com key, o quadro é lido do
+        cache se já estiver lá, e guardado nele se não estiver.
+        """
+        frame = (left, right, x_jaws, y_jaws, thickness, title)
+        full = self._apply(*frame)
+        self._shown = frame
+        if full or self._background is None:
+            # _on_draw guarda o fundo novo (esvaziando o cache) e desenha os artistas animados
+            self.canvas.draw()
+        elif key in self._frames:
+            self._frames.move_to_end(key)
+            self.canvas.restore_region(self._frames[key])
+            self.canvas.blit(self.ax.figure.bbox)
+        else:
+            self._blit()
+        self._shown_region = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+        if key is not None and key not in self._frames:
+            self._store(key, self._shown_region)
+
+    def prefetch(self, key, left, right, x_jaws, y_jaws, thickness, title):
+        """
+        Desenha um CP fora da tela, só para o cache. Retorna False se o quadro não
+        pode ser guardado (outro layout ou limites do eixo Y, ou canvas ainda não
+        desenhado); o quadro em exibição não muda.
+        """
+        if key in self._frames:
+            return True
+        if self._background is None or self._shown is None or (len(left), thickness) != self._layout:
+            return False
+        if self._apply(left, right, x_jaws, y_jaws, thickness, title):
+            # Precisaria de outro fundo: volta ao quadro em exibição
+            self._apply(*self._shown)
+            return False
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self._store(key, self.canvas.copy_from_bbox(self.ax.figure.bbox))
+        # O buffer do canvas volta ao quadro em exibição (sem blit: a tela não mudou)
+        self._apply(*self._shown)
+        self.canvas.restore_region(self._shown_region)
+        return True
+
+    def has_frame(self, key):
+        return key in self._frames
+
+    def clear_frames(self):
+        self._frames.clear()
+
+    def _store(self, key, region):
+        self._frames[key] = region
+        width, height = self.ax.figure.bbox.size
+        max_frames = max(1, MAX_FRAME_CACHE_BYTES // max(1, int(width * height * 4)))
+        while len(self._frames) > max_frames:
+            self._frames.popitem(last=False)
+
+    def _apply(self, left, right, x_jaws, y_jaws, thickness, title):
+        # Atualiza os artistas para o CP; retorna True se o fundo precisa ser redesenhado
+        left = np.asarray(left, dtype=float)
+        right = np.asarray(right, dtype=float)
+        full = (len(left), thickness) != self._layout
+        if full:
+            self._build(len(left), thickness)
+
+        xmin, xmax = X_LIMITS
+        bottom, top = self._rows
+        # Lâminas que não entram no campo (ou sem valor) não são desenhadas
+        shown = left > xmin
+        self._banks[0].set_verts(self._rectangles(np.full(shown.sum(), xmin), left[shown],
+                                                  bottom[shown], top[shown]))
+        shown = right < xmax
+        self._banks[1].set_verts(self._rectangles(right[shown], np.full(shown.sum(), xmax),
+                                                  bottom[shown], top[shown]))
+
+        for line, value in zip(self._x_jaws, x_jaws or (None, None)):
+            line.set_visible(value is not None)
+            if value is not None:
+                value = max(min(value, xmax), xmin)
+                line.set_xdata([value, value])
+        for line, value in zip(self._y_jaws, y_jaws or (None, None)):
+            line.set_visible(value is not None)
+            if value is not None:
+                line.set_ydata([value, value])
+                line.set_label(f"Y Jaw {value}mm")
+        self._update_legend()
+        self.ax.set_title(title)
+
+        half_height = len(left) * thickness / 2.0
+        if y_jaws:
+            ylim = (max(half_height, y_jaws[1]), min(-half_height, y_jaws[0]))
+        else:
+            ylim = (half_height, -half_height)
+        if tuple(self.ax.get_ylim()) != ylim:
+            self.ax.set_ylim(*ylim)
+            full = True
+        return full
+
+    @staticmethod
+    def _rectangles(x0, x1, y0, y1):
+        # Vértices (n, 4, 2) de retângulos [x0, x1] x [y0, y1]
+        return np.stack([np.stack([x0, y0], axis=1), np.stack([x1, y0], axis=1),
+                         np.stack([x1, y1], axis=1), np.stack([x0, y1], axis=1)], axis=1)
+
+    def _update_legend(self):
+        handles = tuple(line for line in self._x_jaws + self._y_jaws if line.get_visible())
+        if handles != self._legend_handles:
+            if self._legend is not None:
+                self._legend.remove()
+                self._legend = None
+            if handles:
+                self._legend = self.ax.legend(handles=list(handles), loc="upper right", fontsize="small")
+                self._legend.set_animated(True)
+            self._legend_handles = handles
+        elif self._legend is not None:
+            for text, line in zip(self._legend.get_texts(), handles):
+                text.set_text(line.get_label())
+
+    # ------------------------------------------------------------------
+    #    Blitting
+    # ------------------------------------------------------------------
+    def _animated(self):
+        artists = self._banks + self._x_jaws + self._y_jaws
+        if self._legend is not None:
+            artists.append(self._legend)
+        artists.append(self.ax.title)
+        return artists
+
+    def _draw_animated(self):
+        for artist in self._animated():
+            if artist.get_visible():
+                self.ax.draw_artist(artist)
+
+    def _on_draw(self, event):
+        # Fundo novo (layout, limites, tamanho): os quadros guardados não valem mais
+        self._frames.clear()
+        if self._layout is None:
+            self._background = None
+            return
+        self._background = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+        self._draw_animated()
+        self._shown_region = self.canvas.copy_from_bbox(self.ax.figure.bbox)
+
+    def _blit(self):
+        self.canvas.restore_region(self._background)
+        self._draw_animated()
+        self.canvas.blit(self.ax.figure.bbox)
@@ -0,0 +1,141 @@
+"""
+Cache em disco dos planos já abertos: os arrays de BeamModel de cada feixe e as
+entradas do TagIndex, num .npz por arquivo (sem pickle).
+
+A entrada é identificada pelo hash do conteúdo do arquivo (BLAKE2b), que já é lido
+inteiro para o pydicom; caminho, tamanho e mtime ficam gravados na entrada e o
+tamanho precisa bater. Assim, reabrir o mesmo plano (mesmo copiado para outra
+pasta) pula a leitura da ControlPointSequence e a indexação.
+
+Política de descarte: LRU pela data de modificação dos .npz (atualizada a cada
+uso), até o total caber em max_bytes. Entradas de outra versão do formato ou
+ilegíveis são apagadas ao serem encontradas.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+import dicom_utils.beam_model as bm
+from dicom_utils.tag_index import TagIndex
+
+# Versão do formato das entradas; mudar ao alterar BeamModel/TagIndex.to_arrays
+CACHE_VERSION = 1
+CACHE_DIR = os.environ.get("QAPLAN_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "QAplanEditor", "plans")
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+
+def content_key(data):
+    # Hash do conteúdo do arquivo (bytes), usado como nome da entrada
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class PlanCache:
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def _remove(self, entry):
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def load(self, key, size, dataset):
+        """
+        (beam_models, tag_index) do cache para o arquivo de hash key e tamanho size,
+        já ligados a `dataset` (o arquivo lido de novo), ou None se não houver entrada.
+        """
+        entry = self._entry_path(key)
+        if not os.path.exists(entry):
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+            if int(arrays['meta_version']) != CACHE_VERSION or int(arrays['meta_size']) != size:
+                raise ValueError("entrada de outra versão ou outro arquivo")
+            beams = bm.get_beams(dataset)
+            if int(arrays['meta_beams']) != len(beams):
+                raise ValueError("número de feixes diferente")
+            beam_models = []
+            for idx, beam in enumerate(beams):
+                prefix = "beam%d_" % idx
+                beam_arrays = {name[len(prefix):]: value for name, value in arrays.items()
+                               if name.startswith(prefix)}
+                beam_models.append(bm.BeamModel.from_arrays(beam, idx, beam_arrays))
+            prefix = "index_"
+            tag_index = TagIndex.from_arrays(
+                {name[len(prefix):]: value for name, value in arrays.items() if name.startswith(prefix)},
+                dataset)
+        except Exception:
+            self._remove(entry)
+            return None
+        # Marca a entrada como usada agora (ordem do LRU)
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return beam_models, tag_index
+
+    def store(self, key, path, beam_models, tag_index):
+        """
+        Grava a entrada do arquivo (gravação atômica) e aplica o limite de tamanho.
+        Falhas de disco são ignoradas: o cache é só um atalho.
+        """
+        stat = os.stat(path)
+        arrays = {
+            'meta_version': np.array(CACHE_VERSION),
+            'meta_size': np.array(stat.st_size),
+            'meta_mtime': np.array(stat.st_mtime_ns),
+            'meta_path': np.array(os.path.abspath(path)),
+            'meta_beams': np.array(len(beam_models)),
+        }
+        for model in beam_models:
+            for name, value in model.to_arrays().items():
+                arrays["beam%d_%s" % (model.index, name)] = value
+        for name, value in tag_index.to_arrays().items():
+            arrays["index_" + name] = value
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, "wb") as fp:
+                np.savez_compressed(fp, **arrays)
+            os.replace(tmp, self._entry_path(key))
+        except OSError:
+            return
+        self.evict()
+
+    def entries(self):
+        # [(mtime, tamanho, caminho)] das entradas, da menos para a mais recente
+        if not os.path.isdir(self.directory):
+            return []
+        items = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                entry = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(entry)
+                except OSError:
+                    continue
+                items.append((stat.st_mtime, stat.st_size, entry))
+        return sorted(items)
+
+    def evict(self):
+        """Apaga as entradas usadas há mais tempo até o total caber em max_bytes."""
+        items = self.entries()
+        total = sum(size for _, size, _ in items)
+        for _, size, entry in items:
+            if total <= self.max_bytes:
+                break
+            self._remove(entry)
+            total -= size
+
+    def clear(self):
+        for _, _, entry in self.entries():
+            self._remove(entry)
@@ -1,6 +1,11 @@
+import struct
+
 import pydicom
+from pydicom.datadict import dictionary_description, dictionary_VR
+from pydicom.dataelem import RawDataElement
 from pydicom.errors import InvalidDicomError
-from PyQt5.QtWidgets import QTreeWidgetItem
+from pydicom.multival import MultiValue
+from pydicom.tag import Tag
 
 def open_dicom_file(path):
     try:
@@ -9,26 +14,41 @@ def open_dicom_file(path):
         ds = pydicom.dcmread(path, force=True)
     return ds
 
-def populate_tree(ds, parent_item):
-    for elem in ds:
-        tag_str = f"({elem.tag.group:04X},{elem.tag.element:04X})"
-        name = elem.name
-        vr = elem.VR
-
-        if vr == "SQ":
-            seq_item = QTreeWidgetItem(parent_item, [tag_str, vr, name, f"[Sequence of {len(elem.value)}]"])
-            seq_item.data_element = elem
-            for idx, item in enumerate(elem.value):
-                item_root = QTreeWidgetItem(seq_item, [f"Item {idx}", "", "", ""])
-                populate_tree(item, item_root)
-        else:
-            val = elem.value
-            if isinstance(val, bytes) and len(val) > 64:
-                val_str = "<bytes...>"
-            else:
-                val_str = str(val)
-            child = QTreeWidgetItem(parent_item, [tag_str, vr, name, val_str])
-            child.data_element = elem
+# Quantos valores de um elemento multivalorado aparecem na coluna Value
+PREVIEW_VALUES = 8
+TEXT_VRS = {"AE", "AS", "CS", "DA", "DS", "DT", "IS", "LO", "LT", "PN", "SH", "ST", "TM", "UC", "UI", "UR", "UT"}
+
+
+def value_preview(value):
+    # Texto curto do valor para a coluna Value; multivalorados longos mostram só o início
+    if isinstance(value, bytes) and len(value) > 64:
+        return "<bytes...>"
+    if isinstance(value, (list, tuple, MultiValue)) and len(value) > PREVIEW_VALUES:
+        head = ", ".join(str(v) for v in value[:PREVIEW_VALUES])
+        return f"[{head}, ...] ({len(value)} valores)"
+    return str(value)
+
+
+def raw_preview(ds, tag):
+    """
+    Prévia de um elemento texto multivalorado ainda não convertido (RawDataElement),
+    direto dos bytes. Retorna (vr, name, preview) ou None se não se aplicar.
+    """
+    raw = ds.get_item(tag)
+    if not isinstance(raw, RawDataElement) or raw.value is None or tag.is_private:
+        return None
+    try:
+        vr = raw.VR or dictionary_VR(tag)
+        name = dictionary_description(tag)
+    except KeyError:
+        return None
+    if vr not in TEXT_VRS or raw.value.count(b"\\") < PREVIEW_VALUES:
+        return None
+    parts = raw.value.split(b"\\", PREVIEW_VALUES)
+    count = raw.value.count(b"\\") + 1
+    head = ", ".join(p.decode("latin-1").strip() for p in parts[:PREVIEW_VALUES])
+    return vr, name, f"[{head}, ...] ({count} valores)"
+
 
 def save_data_element(elem, new_str):
     vr = elem.VR
@@ -51,8 +71,96 @@ def save_data_element(elem, new_str):
     else:
         elem.value = new_str
 
-def save_dicom_file(ds, path_out):
-    ds.save_as(path_out)
+# SpecificCharacterSet: se for alterado, as sequências abaixo são recodificadas
+TAG_SPECIFIC_CHARACTER_SET = Tag(0x00080005)
+
+
+def _save_encoding(ds):
+    # (implicit VR, little endian) com que ds será gravado, ou None se não for o de leitura
+    encoding = getattr(ds, "original_encoding", (None, None))
+    tsyntax = getattr(getattr(ds, "file_meta", None), "TransferSyntaxUID", None)
+    if tsyntax is not None:
+        try:
+            if (tsyntax.is_implicit_VR, tsyntax.is_little_endian) != encoding:
+                return None
+        except ValueError:
+            return None
+    return encoding if None not in encoding else None
+
+
+def _source_value(elem, source, base, encoding):
+    """
+    (posição, tamanho) do valor da sequência elem em source, conferindo o cabeçalho
+    do elemento nos bytes originais; None se não for possível (ex.: tamanho
+    indefinido). base: posição do valor de onde o dataset de elem foi lido.
+    """
+    if base is None or elem.file_tell is None or elem.is_undefined_length:
+        return None
+    implicit, little = encoding
+    pos = base + elem.file_tell
+    header = 8 if implicit else 12
+    if pos < header or pos > len(source):
+        return None
+    order = "<" if little else ">"
+    group, element = struct.unpack(order + "HH", source[pos - header:pos - header + 4])
+    if Tag(group, element) != elem.tag or (not implicit and source[pos - 8:pos - 6] != b"SQ"):
+        return None
+    length, = struct.unpack(order + "L", source[pos - 4:pos])
+    if length == 0xFFFFFFFF or pos + length > len(source):
+        return None
+    return pos, length
+
+
+def _original_sequences(ds, source, base, modified, encoding, out):
+    """
+    Acrescenta a out (dataset, tag, RawDataElement original) das sequências já
+    convertidas de ds sem nada alterado (só a mais externa de cada ramo).
+    Retorna True se nada em ds, nem abaixo dele, foi alterado.
+    """
+    tags = modified.get(id(ds), (None, ()))[1]
+    clean = not tags
+    if TAG_SPECIFIC_CHARACTER_SET in tags:
+        base = None
+    for tag in list(ds.keys()):
+        elem = ds.get_item(tag)
+        if isinstance(elem, RawDataElement) or elem.VR != "SQ":
+            continue
+        start = len(out)
+        value = _source_value(elem, source, base, encoding)
+        items_clean = True
+        for item in elem.value:
+            if not _original_sequences(item, source, value[0] if value else None,
+                                       modified, encoding, out):
+                items_clean = False
+        if items_clean and tag not in tags and value is not None:
+            pos, length = value
+            del out[start:]
+            out.append((ds, tag, RawDataElement(tag, "SQ", length, source[pos:pos + length],
+                                                elem.file_tell, encoding[0], encoding[1])))
+        clean = clean and items_clean and tag not in tags
+    return clean
+
+
+def save_dicom_file(ds, path_out, source=None, modified=None):
+    """
+    Grava ds em path_out. Com source (bytes do arquivo de onde ds foi lido) e
+    modified (EditJournal.modified), as sequências que o pydicom já converteu mas
+    não foram alteradas são gravadas com os bytes originais, sem recodificar; os
+    elementos nunca acessados já continuam brutos (RawDataElement).
+    """
+    swaps = []
+    encoding = _save_encoding(ds) if source is not None and modified is not None else None
+    if encoding is not None:
+        _original_sequences(ds, source, 0, modified, encoding, swaps)
+    # Troca temporária: a árvore e os BeamModel continuam com os elementos convertidos
+    originals = [(dataset, tag, dataset.get_item(tag)) for dataset, tag, _ in swaps]
+    try:
+        for dataset, tag, raw in swaps:
+            dataset[tag] = raw
+        ds.save_as(path_out)
+    finally:
+        for dataset, tag, elem in originals:
+            dataset[tag] = elem
 
 def get_beams(ds):
     return getattr(ds, "RTBeamSequence", None) or getattr(ds, "BeamSequence", None)
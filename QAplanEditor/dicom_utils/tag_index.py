@@ -0,0 +1,228 @@
+"""
+Índice de busca das tags de um Dataset, montado uma única vez ao abrir o arquivo.
+
+Cada elemento (inclusive dentro de sequências ainda não expandidas na árvore) vira
+uma entrada com o texto pesquisável "(gggg,eeee) ggggeeee keyword nome valor" em
+minúsculas, identificada pelo caminho até ele: (tag,) no nível raiz,
+(tag_seq, idx_item, tag) dentro de um item, e assim por diante.
+
+Os valores ainda não convertidos pelo pydicom (RawDataElement) entram direto dos
+bytes, sem conversão. As buscas são incrementais: se o texto novo contém o anterior
+como prefixo, só os resultados da busca anterior são examinados.
+
+to_arrays/from_arrays guardam as entradas em arrays NumPy (cache em disco de
+plan_cache), para que um plano já indexado não precise ser percorrido de novo.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from pydicom.datadict import dictionary_description, dictionary_VR, keyword_for_tag
+from pydicom.dataelem import RawDataElement
+from pydicom.tag import Tag
+
+# VRs cujo valor não é indexado (binários)
+BINARY_VRS = {"OB", "OD", "OF", "OL", "OV", "OW", "UN"}
+# VRs de texto, indexados direto dos bytes quando o elemento ainda está bruto
+TEXT_VRS = {"AE", "AS", "CS", "DA", "DS", "DT", "IS", "LO", "LT", "PN", "SH", "ST", "TM", "UC", "UI", "UR", "UT"}
+# Limite de caracteres do valor indexado por elemento
+MAX_VALUE_CHARS = 4096
+
+
+@lru_cache(maxsize=None)
+def _tag_info(tag):
+    """
+    (VR, keyword, nome) de uma tag pública do dicionário, ou None (privada,
+    desconhecida ou de VR ambíguo). Em cache: as mesmas tags se repetem em cada CP.
+    """
+    if tag.is_private:
+        return None
+    try:
+        vr = dictionary_VR(tag)
+    except KeyError:
+        return None
+    if " or " in vr:
+        return None
+    return vr, keyword_for_tag(tag), dictionary_description(tag)
+
+
+def _raw_vr(elem):
+    # VR de um RawDataElement (arquivos implicit VR não trazem o VR; usa o dicionário)
+    if elem.VR is not None:
+        return elem.VR
+    info = _tag_info(elem.tag)
+    return info[0] if info else None
+
+
+def _element_vr(ds, tag):
+    elem = ds.get_item(tag)
+    vr = _raw_vr(elem) if isinstance(elem, RawDataElement) else elem.VR
+    return vr if vr is not None else ds[tag].VR
+
+
+def _element_text(ds, tag):
+    # Texto pesquisável de um elemento, sem converter elementos brutos
+    tag_text = f"({tag.group:04x},{tag.element:04x}) {tag.group:04x}{tag.element:04x}"
+    elem = ds.get_item(tag)
+    info = _tag_info(tag) if isinstance(elem, RawDataElement) else None
+    if info is not None:
+        vr, keyword, name = info
+        if (elem.VR or vr) in TEXT_VRS and elem.value is not None:
+            value = elem.value[:MAX_VALUE_CHARS].decode("latin-1")
+        else:
+            value = ""
+        return f"{tag_text} {keyword} {name} {value}".lower()
+    if isinstance(elem, RawDataElement):
+        elem = ds[tag]
+    value = "" if elem.VR in BINARY_VRS or elem.VR == "SQ" else str(elem.value)[:MAX_VALUE_CHARS]
+    return f"{tag_text} {elem.keyword} {elem.name} {value}".lower()
+
+
+def _positions(offsets):
+    # Posição de cada chave dentro do seu caminho, para caminhos concatenados
+    for i in range(len(offsets) - 1):
+        yield from range(offsets[i + 1] - offsets[i])
+
+
+class TagIndex:
+    """
+    step, se informado, é chamado após cada dataset indexado na montagem inicial
+    (o carregamento em segundo plano o usa para poder interromper a montagem).
+    """
+
+    def __init__(self, dataset=None, step=None):
+        self._entries = {}
+        # id(dataset) -> caminho do dataset (raiz ou item de sequência)
+        self._dataset_paths = {}
+        self._last_query = None
+        self._last_matches = None
+        self._step = step
+        # Dataset raiz, para reconstruir _dataset_paths de um índice restaurado
+        self._root = dataset
+        if dataset is not None:
+            self._add_dataset(dataset, ())
+        self._step = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def text_size(self):
+        # Total de caracteres indexados (estimativa de memória do workspace)
+        return sum(len(text) for text in self._entries.values())
+
+    def _add_dataset(self, ds, path):
+        self._dataset_paths[id(ds)] = path
+        for tag in ds.keys():
+            self._add_element(ds, Tag(tag), path)
+        if self._step is not None:
+            self._step()
+
+    def _add_element(self, ds, tag, base):
+        path = base + (tag,)
+        self._entries[path] = _element_text(ds, tag)
+        if _element_vr(ds, tag) == "SQ":
+            for idx, item in enumerate(ds[tag].value):
+                self._add_dataset(item, path + (idx,))
+
+    def _remove_prefix(self, prefix):
+        n = len(prefix)
+        for path in [p for p in self._entries if p[:n] == prefix]:
+            del self._entries[path]
+        for key in [k for k, p in self._dataset_paths.items() if p[:n] == prefix]:
+            del self._dataset_paths[key]
+
+    def _map_datasets(self, ds, path):
+        # Só os caminhos dos datasets (sem reindexar), para um índice vindo de from_arrays
+        self._dataset_paths[id(ds)] = path
+        for tag in ds.keys():
+            if _element_vr(ds, tag) == "SQ":
+                for idx, item in enumerate(ds[tag].value):
+                    self._map_datasets(item, path + (Tag(tag), idx))
+
+    def refresh_elements(self, changed):
+        """
+        Atualiza as entradas de elementos alterados, changed = [(dataset, tag), ...]
+        (mesmo formato de DicomTreeModel.notify_elements_changed). Sequências
+        alteradas são reindexadas por inteiro.
+        """
+        if changed and self._dataset_paths is None:
+            self._dataset_paths = {}
+            self._map_datasets(self._root, ())
+        for ds, tag in changed:
+            base = self._dataset_paths.get(id(ds))
+            if base is None:
+                continue
+            tag = Tag(tag)
+            path = base + (tag,)
+            if tag in ds and path in self._entries and _element_vr(ds, tag) != "SQ":
+                self._entries[path] = _element_text(ds, tag)
+                continue
+            self._remove_prefix(path)
+            if tag in ds:
+                self._add_element(ds, tag, base)
+        self._last_query = None
+
+    def search(self, query):
+        """Caminhos dos elementos cujo texto contém query (sem distinção de maiúsculas)."""
+        query = query.strip().lower()
+        if not query:
+            return []
+        if self._last_query and query.startswith(self._last_query):
+            candidates = self._last_matches
+        else:
+            candidates = self._entries
+        matches = [path for path in candidates if query in self._entries[path]]
+        self._last_query = query
+        self._last_matches = matches
+        return matches
+
+    def to_arrays(self):
+        """
+        Entradas como arrays: os caminhos concatenados em path_keys (path_offsets
+        delimita cada um) e os textos em UTF-8 em text_bytes (text_offsets).
+        """
+        paths = list(self._entries)
+        path_offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        np.cumsum([len(path) for path in paths], out=path_offsets[1:])
+        path_keys = np.fromiter((int(key) for path in paths for key in path), dtype=np.int64,
+                                count=int(path_offsets[-1]))
+        texts = [self._entries[path].encode("utf-8") for path in paths]
+        text_offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=text_offsets[1:])
+        text_bytes = np.frombuffer(b"".join(texts), dtype=np.uint8)
+        return {'path_keys': path_keys, 'path_offsets': path_offsets,
+                'text_bytes': text_bytes, 'text_offsets': text_offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays, dataset):
+        """
+        Índice de to_arrays para `dataset` (o mesmo arquivo). Os caminhos dos datasets
+        só são levantados na primeira chamada de refresh_elements.
+        """
+        index = cls()
+        index._root = dataset
+        index._dataset_paths = None
+        keys = arrays['path_keys'].tolist()
+        path_offsets = arrays['path_offsets'].tolist()
+        text = arrays['text_bytes'].tobytes()
+        text_offsets = arrays['text_offsets'].tolist()
+        # Posições pares do caminho são tags; ímpares, índices de itens
+        tags = {}
+        keys = [key if pos % 2 else tags.get(key) or tags.setdefault(key, Tag(key))
+                for key, pos in zip(keys, _positions(path_offsets))]
+        for i in range(len(path_offsets) - 1):
+            path = tuple(keys[path_offsets[i]:path_offsets[i + 1]])
+            index._entries[path] = text[text_offsets[i]:text_offsets[i + 1]].decode("utf-8")
+        return index
+
+    @staticmethod
+    def with_ancestors(paths):
+        # Conjunto com os caminhos e todos os seus prefixos (nós que levam até eles)
+        accepted = set()
+        for path in paths:
+            for end in range(len(path), 0, -1):
+                prefix = path[:end]
+                if prefix in accepted:
+                    break
+                accepted.add(prefix)
+        return accepted
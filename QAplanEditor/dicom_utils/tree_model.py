@@ -0,0 +1,331 @@
+"""
+Modelo virtual (QAbstractItemModel) sobre um pydicom Dataset, para uso com QTreeView.
+
+Os índices apontam direto para o Dataset e para os itens das sequências: cada nó
+guarda (dataset, tag) ou o item da sequência, e os filhos só são criados quando a
+view pede as linhas de um nó. Nada é copiado do Dataset; o texto de cada célula é
+calculado em data() com as prévias de reader.value_preview e reader.raw_preview.
+
+DicomFilterProxyModel filtra e destaca a árvore a partir de um TagIndex, sem
+percorrer o Dataset a cada tecla.
+"""
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, QSortFilterProxyModel, Qt
+from PyQt5.QtGui import QBrush, QColor
+from pydicom.tag import Tag
+
+import dicom_utils.reader as dr
+from dicom_utils.tag_index import TagIndex
+
+HEADERS = ["Tag (Group,Elem)", "VR", "Name", "Value"]
+COL_VALUE = 3
+HIGHLIGHT_BRUSH = QBrush(QColor(255, 245, 157))
+
+
+class _Node:
+    """
+    Nó da árvore. kind:
+      'dataset' - raiz ou item de sequência (filhos: elementos de `dataset`)
+      'element' - elemento `tag` de `dataset` (filhos: itens, se for SQ)
+    """
+    __slots__ = ("parent", "row", "kind", "dataset", "tag", "children")
+
+    def __init__(self, parent, row, kind, dataset, tag=None):
+        self.parent = parent
+        self.row = row
+        self.kind = kind
+        self.dataset = dataset
+        self.tag = tag
+        self.children = None
+
+
+class DicomTreeModel(QAbstractItemModel):
+
+    def __init__(self, dataset=None, parent=None):
+        super().__init__(parent)
+        self._root = None
+        # id(dataset) -> nó 'dataset' já materializado (para os avisos de alteração)
+        self._dataset_nodes = {}
+        self.set_dataset(dataset)
+
+    # ------------------------------------------------------------------
+    #    Estrutura
+    # ------------------------------------------------------------------
+    def set_dataset(self, dataset):
+        self.beginResetModel()
+        self._dataset_nodes = {}
+        self._root = self._dataset_node(None, 0, dataset) if dataset is not None else None
+        self.endResetModel()
+
+    def _dataset_node(self, parent, row, dataset):
+        node = _Node(parent, row, "dataset", dataset)
+        self._dataset_nodes[id(dataset)] = node
+        return node
+
+    def _element(self, node):
+        return node.dataset[node.tag]
+
+    def _child_keys(self, node):
+        # Tags (nó 'dataset') ou itens (nó SQ) que formam as linhas do nó
+        if node.kind == "dataset":
+            return sorted(node.dataset.keys())
+        elem = self._element(node)
+        if elem.VR != "SQ":
+            return []
+        return list(elem.value)
+
+    def _make_child(self, node, row, key):
+        if node.kind == "dataset":
+            return _Node(node, row, "element", node.dataset, key)
+        return self._dataset_node(node, row, key)
+
+    def _children(self, node):
+        if node.children is None:
+            node.children = [self._make_child(node, row, key)
+                             for row, key in enumerate(self._child_keys(node))]
+        return node.children
+
+    def _node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self._root
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if node is None or not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column, self._children(node)[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self._root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self._node(parent)
+        if node is None:
+            return 0
+        if node.children is not None:
+            return len(node.children)
+        if node.kind == "dataset":
+            return len(node.dataset)
+        # Nº de itens de uma sequência sem criar os nós
+        elem = self._element(node)
+        return len(elem.value) if elem.VR == "SQ" else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(HEADERS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        return self.rowCount(parent) > 0
+
+    # ------------------------------------------------------------------
+    #    Dados
+    # ------------------------------------------------------------------
+    def _texts(self, node):
+        if node.kind == "dataset":
+            return [f"Item {node.row}", "", "", ""]
+        tag = node.tag
+        tag_str = f"({tag.group:04X},{tag.element:04X})"
+        raw = dr.raw_preview(node.dataset, tag)
+        if raw is not None:
+            vr, name, val_str = raw
+            return [tag_str, vr, name, val_str]
+        elem = self._element(node)
+        if elem.VR == "SQ":
+            return [tag_str, elem.VR, elem.name, f"[Sequence of {len(elem.value)}]"]
+        return [tag_str, elem.VR, elem.name, dr.value_preview(elem.value)]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        return self._texts(index.internalPointer())[index.column()]
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[section]
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    def element(self, index):
+        """DataElement do índice, ou None para itens de sequência."""
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        return self._element(node) if node.kind == "element" else None
+
+    def element_key(self, index):
+        """(dataset, tag) do elemento do índice, ou None para itens de sequência."""
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        return (node.dataset, node.tag) if node.kind == "element" else None
+
+    def node_path(self, index):
+        """
+        Caminho do nó no formato de TagIndex: (tag,), (tag_seq, idx_item, tag)...
+        """
+        node = self._node(index)
+        path = []
+        while node is not None and node is not self._root:
+            path.append(node.tag if node.kind == "element" else node.row)
+            node = node.parent
+        return tuple(reversed(path))
+
+    def index_for_path(self, path):
+        """Índice (coluna 0) do nó de um caminho de TagIndex, criando os nós no caminho."""
+        node = self._root
+        for key in path:
+            if node is None:
+                return QModelIndex()
+            children = self._children(node)
+            if node.kind == "dataset":
+                node = next((child for child in children if child.tag == key), None)
+            else:
+                node = children[key] if key < len(children) else None
+        return self._index_of(node) if node is not None else QModelIndex()
+
+    def set_value(self, index, new_str):
+        """
+        Edição de um elemento a partir do texto (mesma conversão de
+        reader.save_data_element). Retorna o (dataset, tag) alterado.
+        """
+        elem = self.element(index)
+        dr.save_data_element(elem, new_str)
+        row_index = index.sibling(index.row(), 0)
+        self.dataChanged.emit(row_index, index.sibling(index.row(), COL_VALUE), [Qt.DisplayRole])
+        node = index.internalPointer()
+        return node.dataset, node.tag
+
+    # ------------------------------------------------------------------
+    #    Avisos de alteração feitos fora do modelo
+    # ------------------------------------------------------------------
+    def _index_of(self, node):
+        if node is None or node is self._root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def _sync_rows(self, node):
+        """
+        Ajusta as linhas já materializadas de um nó à estrutura atual do Dataset
+        (elementos ou itens incluídos/removidos), com insert/remove de linhas.
+        """
+        if node.children is None:
+            return
+        keys = self._child_keys(node)
+        if node.kind == "dataset":
+            same = [child.tag for child in node.children] == keys
+        else:
+            same = len(node.children) == len(keys) and all(
+                child.dataset is key for child, key in zip(node.children, keys))
+        if same:
+            return
+        parent = self._index_of(node)
+        if node.children:
+            self.beginRemoveRows(parent, 0, len(node.children) - 1)
+            for child in node.children:
+                self._forget(child)
+            node.children = []
+            self.endRemoveRows()
+        if keys:
+            self.beginInsertRows(parent, 0, len(keys) - 1)
+            node.children = [self._make_child(node, row, key) for row, key in enumerate(keys)]
+            self.endInsertRows()
+
+    def _forget(self, node):
+        if node.kind == "dataset" and self._dataset_nodes.get(id(node.dataset)) is node:
+            del self._dataset_nodes[id(node.dataset)]
+        for child in node.children or []:
+            self._forget(child)
+
+    def notify_dataset_changed(self, dataset, tags=None):
+        """
+        Avisa que elementos de `dataset` (raiz ou item de sequência) foram alterados.
+        Emite dataChanged só para as linhas já materializadas dessas tags (todas, se
+        tags for None); sequências alteradas têm os itens ressincronizados.
+        """
+        node = self._dataset_nodes.get(id(dataset))
+        if node is None or node.children is None:
+            return
+        self._sync_rows(node)
+        wanted = None if tags is None else {Tag(t) for t in tags}
+        rows = [child for child in node.children if wanted is None or child.tag in wanted]
+        for child in rows:
+            if child.children is not None:
+                self._sync_rows(child)
+        if rows:
+            parent = self._index_of(node)
+            first = min(child.row for child in rows)
+            last = max(child.row for child in rows)
+            self.dataChanged.emit(self.index(first, 0, parent), self.index(last, COL_VALUE, parent),
+                                  [Qt.DisplayRole])
+
+    def notify_elements_changed(self, changed):
+        # changed: lista de (dataset, tag), ex.: o retorno de beam_model.write_back_models
+        by_dataset = {}
+        for dataset, tag in changed:
+            by_dataset.setdefault(id(dataset), (dataset, set()))[1].add(tag)
+        for dataset, tags in by_dataset.values():
+            self.notify_dataset_changed(dataset, tags)
+
+
+class DicomFilterProxyModel(QSortFilterProxyModel):
+    """
+    Proxy de busca sobre DicomTreeModel. A consulta é resolvida no TagIndex (uma
+    vez por texto digitado); filterAcceptsRow só consulta o conjunto de caminhos
+    aceitos, então ramos ainda não expandidos também são encontrados.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._tag_index = None
+        self._query = ""
+        self._matches = set()
+        self._accepted = None
+
+    def set_tag_index(self, tag_index):
+        self._tag_index = tag_index
+        return self.set_query(self._query)
+
+    def set_query(self, text):
+        # Aplica o filtro e retorna o número de elementos encontrados
+        self._query = text.strip()
+        if self._query and self._tag_index is not None:
+            matches = self._tag_index.search(self._query)
+            self._matches = set(matches)
+            self._accepted = TagIndex.with_ancestors(matches)
+        else:
+            self._matches = set()
+            self._accepted = None
+        self.invalidateFilter()
+        return len(self._matches)
+
+    def is_filtering(self):
+        return self._accepted is not None
+
+    def matches(self):
+        return sorted(self._matches)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self._accepted is None:
+            return True
+        source = self.sourceModel()
+        path = source.node_path(source.index(source_row, 0, source_parent))
+        if path in self._accepted:
+            return True
+        # Descendentes de um elemento encontrado (ex.: itens de uma sequência) continuam visíveis
+        return any(path[:end] in self._matches for end in range(1, len(path)))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.BackgroundRole and self._matches:
+            path = self.sourceModel().node_path(self.mapToSource(index))
+            return HIGHLIGHT_BRUSH if path in self._matches else None
+        return super().data(index, role)
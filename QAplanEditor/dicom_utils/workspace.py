@@ -0,0 +1,136 @@
+"""
+Conjunto de planos abertos na janela (uma aba por plano).
+
+Cada plano tem uma PlanEntry com o resultado do carregamento (LoadedPlan), os
+BeamModel em uso e o estado de navegação (feixe e CP). Workspace mantém as
+entradas em ordem LRU e, quando a memória estimada passa de budget_bytes, descarta
+o Dataset dos planos usados há mais tempo: a entrada (e a aba) continua, e o plano
+é lido de novo ao ser selecionado (rápido, pelo PlanCache). Planos com edições não
+salvas e o plano ativo nunca são descartados.
+
+Cada entrada tem também o seu EditJournal (desfazer/refazer), recriado quando o
+plano é lido de novo do disco.
+
+Este módulo não depende do Qt.
+"""
+import os
+from collections import OrderedDict
+
+from dicom_utils.journal import EditJournal
+
+DEFAULT_BUDGET_BYTES = 1024 * 1024 * 1024
+# Memória típica de um Dataset do pydicom por byte do arquivo, com as sequências
+# dos CPs já convertidas (a árvore totalmente expandida chega a ~70x)
+DATASET_BYTES_PER_FILE_BYTE = 20
+
+
+def plan_key(path):
+    # Chave de um arquivo no workspace (o mesmo arquivo por caminhos diferentes)
+    return os.path.normcase(os.path.abspath(path))
+
+
+def plan_memory(plan):
+    """Estimativa (bytes) da memória ocupada por um LoadedPlan."""
+    # Dataset e os bytes do arquivo, guardados para a gravação
+    total = plan.size * (DATASET_BYTES_PER_FILE_BYTE + 1)
+    for model in plan.beam_models:
+        total += sum(values.nbytes for values in model.devices.values())
+        total += 5 * model.n_cps * 8
+    total += plan.tag_index.text_size()
+    return total
+
+
+class PlanEntry:
+
+    def __init__(self, path):
+        self.path = path
+        self.plan = None
+        # beam_idx -> BeamModel em uso (inclui os recriados pela importação do Excel)
+        self.beam_models = {}
+        self.beam_idx = 0
+        self.cp_idx = 0
+        self.modified = False
+        self.memory = 0
+        self.journal = EditJournal()
+
+    @property
+    def loaded(self):
+        return self.plan is not None
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def __repr__(self):
+        return "PlanEntry(%r, loaded=%r, modified=%r)" % (self.name, self.loaded, self.modified)
+
+
+class Workspace:
+
+    def __init__(self, budget_bytes=DEFAULT_BUDGET_BYTES):
+        self.budget_bytes = budget_bytes
+        # plan_key -> PlanEntry, do usado há mais tempo para o mais recente
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return plan_key(path) in self._entries
+
+    def get(self, path):
+        if path is None:
+            return None
+        return self._entries.get(plan_key(path))
+
+    def entries(self):
+        return list(self._entries.values())
+
+    def touch(self, path):
+        # Marca o plano como o usado mais recentemente
+        self._entries.move_to_end(plan_key(path))
+
+    def set_plan(self, plan):
+        """
+        Registra um plano carregado (novo ou recarregado após descarte); a entrada
+        existente mantém o estado de navegação. Retorna a PlanEntry.
+        """
+        key = plan_key(plan.path)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = PlanEntry(plan.path)
+        entry.plan = plan
+        entry.beam_models = {model.index: model for model in plan.beam_models}
+        entry.modified = False
+        entry.memory = plan_memory(plan)
+        entry.journal = EditJournal()
+        self.touch(plan.path)
+        return entry
+
+    def remove(self, path):
+        self._entries.pop(plan_key(path), None)
+
+    def memory_in_use(self):
+        return sum(entry.memory for entry in self._entries.values() if entry.loaded)
+
+    def evict(self, keep=None):
+        """
+        Descarta os Datasets dos planos usados há mais tempo até a memória estimada
+        caber em budget_bytes. keep (plano ativo) e planos modificados ficam.
+        Retorna as entradas descartadas.
+        """
+        keep = plan_key(keep) if keep is not None else None
+        in_use = self.memory_in_use()
+        evicted = []
+        for key, entry in self._entries.items():
+            if in_use <= self.budget_bytes:
+                break
+            if key == keep or not entry.loaded or entry.modified:
+                continue
+            in_use -= entry.memory
+            entry.plan = None
+            entry.beam_models = {}
+            entry.memory = 0
+            entry.journal = EditJournal()
+            evicted.append(entry)
+        return evicted
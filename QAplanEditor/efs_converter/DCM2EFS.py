@@ -1,9 +1,15 @@
 from http.client import EXPECTATION_FAILED
 import pydicom
+import io
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 import tkinter as tk
 from tkinter import filedialog
 
+import dicom_utils.beam_model as bm
+
 
 def create_efs(efs_file_path):
     # Cria (ou zera) o arquivo .efs no caminho especificado
@@ -11,220 +17,158 @@ def create_efs(efs_file_path):
         file.write('')
 
 
+class EfsWriter:
+    """
+    Escritor de arquivo .efs com um único handle por feixe.
+    As linhas são acumuladas em memória e gravadas numa única chamada de write()
+    ao fechar (ou sempre que o buffer atingir max_lines, se definido).
+    O destino pode ser um caminho, aberto (e zerado) só no primeiro flush, substituindo
+    create_efs, ou qualquer objeto com write() (ex.: io.StringIO), que não é fechado.
+    """
+
+    def __init__(self, efs_file_path, max_lines=None):
+        self.max_lines = max_lines
+        self._lines = []
+        self._closed = False
+        if hasattr(efs_file_path, 'write'):
+            self.path = None
+            self._file = efs_file_path
+            self._owns_file = False
+        else:
+            self.path = efs_file_path
+            self._file = None
+            self._owns_file = True
+
+    def write(self, cp, code, data):
+        self._lines.append(format_efs(cp, code, data))
+        if self.max_lines is not None and len(self._lines) >= self.max_lines:
+            self.flush()
+
+    def flush(self):
+        if self._file is None:
+            self._file = open(self.path, 'w')
+        self._file.write(''.join(self._lines))
+        self._lines = []
+
+    def close(self):
+        if self._closed:
+            return
+        try:
+            self.flush()
+        finally:
+            if self._owns_file:
+                self._file.close()
+            self._file = None
+            self._closed = True
+
+    def discard(self):
+        # Descarta o conteúdo pendente sem gravar (usado quando a conversão falha)
+        self._lines = []
+        if self._file is not None and self._owns_file:
+            self._file.close()
+        self._file = None
+        self._closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+# Códigos hexadecimais das lâminas, calculados uma única vez:
+# banco X1 (A) = 0x101..0x150, banco X2 (B) = 0x201..0x250
+MLCX1_CODES = {str(leaf): '%x' % (0x100 + leaf) for leaf in range(1, 81)}
+MLCX2_CODES = {str(leaf): '%x' % (0x200 + leaf) for leaf in range(1, 81)}
+
+# Ordem de escrita das 160 lâminas de um CP: as 80 primeiras posições do DICOM
+# vão para o banco X2 em ordem reversa (sinal invertido), as 80 seguintes para X1
+MLC_LINE_PREFIXES = (['5001,%s-' % MLCX2_CODES[str(81 - mlc)] for mlc in range(1, 81)] +
+                     ['5001,%s-' % MLCX1_CODES[str(161 - mlc)] for mlc in range(81, 161)])
+MLC_BANK_B_LEAVES = 80
+
+# Formato de cada linha: {0} = índice do CP, {1} = valor
+EFS_CODES = {
+    'MUs': "5001,1-0 {1}\n",
+    'LINAC': "7001,1-0 {1}\n",
+    'PID': "7001,2-0 {1}\n",
+    'PName': "7001,3-0 {1}\n",
+    'PlanName': "7001,4-0 {1}\n",
+    'TxName': "7001,5-0 {1}\n",
+    'BeamName': "7001,7-0 {1}\n",
+    'BeamID': "7001,6-0 {1}\n",
+    'FieldComplexity': "7002,5-0 {1}\n",
+    'LeafWidth': "7002,6-0 {1}\n",
+    'RadType': "5001,2-{0} {1}\n",
+    'Energy': "5001,3-{0} {1} MV\n",
+    'Wedge': "5001,4-{0} {1}\n",  # OUT
+    'Gantry': "5001,7-{0} {1}\n",
+    'Acc': "5001,f-{0} {1}\n",
+    'GantryDirection': "5001,19-{0} {1}\n",
+    'Collimator': "5001,8-{0} {1}\n",
+    'CollimatorDir': "5001,bb-{0} {1}\n",
+    'X1': "5001,9-{0} {1}\n",
+    'X2': "5001,a-{0} {1}\n",
+    'Y1': "5001,b-{0} {1}\n",
+    'Y2': "5001,c-{0} {1}\n",
+    'MeterSet': "7002,4-{0} {1}\n",  # is zero
+    # Add more cases as needed
+}
+
+
 def MLCX1_Lookup(leave):
-    MLC_code = {
-        '1': '101',
-        '2': '102',
-        '3': '103',
-        '4': '104',
-        '5': '105',
-        '6': '106',
-        '7': '107',
-        '8': '108',
-        '9': '109',
-        '10': '10a',
-        '11': '10b',
-        '12': '10c',
-        '13': '10d',
-        '14': '10e',
-        '15': '10f',
-        '16': '110',
-        '17': '111',
-        '18': '112',
-        '19': '113',
-        '20': '114',
-        '21': '115',
-        '22': '116',
-        '23': '117',
-        '24': '118',
-        '25': '119',
-        '26': '11a',
-        '27': '11b',
-        '28': '11c',
-        '29': '11d',
-        '30': '11e',
-        '31': '11f',
-        '32': '120',
-        '33': '121',
-        '34': '122',
-        '35': '123',
-        '36': '124',
-        '37': '125',
-        '38': '126',
-        '39': '127',
-        '40': '128',
-        '41': '129',
-        '42': '12a',
-        '43': '12b',
-        '44': '12c',
-        '45': '12d',
-        '46': '12e',
-        '47': '12f',
-        '48': '130',
-        '49': '131',
-        '50': '132',
-        '51': '133',
-        '52': '134',
-        '53': '135',
-        '54': '136',
-        '55': '137',
-        '56': '138',
-        '57': '139',
-        '58': '13a',
-        '59': '13b',
-        '60': '13c',
-        '61': '13d',
-        '62': '13e',
-        '63': '13f',
-        '64': '140',
-        '65': '141',
-        '66': '142',
-        '67': '143',
-        '68': '144',
-        '69': '145',
-        '70': '146',
-        '71': '147',
-        '72': '148',
-        '73': '149',
-        '74': '14a',
-        '75': '14b',
-        '76': '14c',
-        '77': '14d',
-        '78': '14e',
-        '79': '14f',
-        '80': '150',
-    }
-    return MLC_code[leave]
+    return MLCX1_CODES[leave]
 
 
 def MLCX2_Lookup(leave):
-    MLC_code = {
-        '1': '201',
-        '2': '202',
-        '3': '203',
-        '4': '204',
-        '5': '205',
-        '6': '206',
-        '7': '207',
-        '8': '208',
-        '9': '209',
-        '10': '20a',
-        '11': '20b',
-        '12': '20c',
-        '13': '20d',
-        '14': '20e',
-        '15': '20f',
-        '16': '210',
-        '17': '211',
-        '18': '212',
-        '19': '213',
-        '20': '214',
-        '21': '215',
-        '22': '216',
-        '23': '217',
-        '24': '218',
-        '25': '219',
-        '26': '21a',
-        '27': '21b',
-        '28': '21c',
-        '29': '21d',
-        '30': '21e',
-        '31': '21f',
-        '32': '220',
-        '33': '221',
-        '34': '222',
-        '35': '223',
-        '36': '224',
-        '37': '225',
-        '38': '226',
-        '39': '227',
-        '40': '228',
-        '41': '229',
-        '42': '22a',
-        '43': '22b',
-        '44': '22c',
-        '45': '22d',
-        '46': '22e',
-        '47': '22f',
-        '48': '230',
-        '49': '231',
-        '50': '232',
-        '51': '233',
-        '52': '234',
-        '53': '235',
-        '54': '236',
-        '55': '237',
-        '56': '238',
-        '57': '239',
-        '58': '23a',
-        '59': '23b',
-        '60': '23c',
-        '61': '23d',
-        '62': '23e',
-        '63': '23f',
-        '64': '240',
-        '65': '241',
-        '66': '242',
-        '67': '243',
-        '68': '244',
-        '69': '245',
-        '70': '246',
-        '71': '247',
-        '72': '248',
-        '73': '249',
-        '74': '24a',
-        '75': '24b',
-        '76': '24c',
-        '77': '24d',
-        '78': '24e',
-        '79': '24f',
-        '80': '250',
-    }
-    return MLC_code[leave]
-
-
-def write_efs(file_name, cp, code, data):  # f-string formatting changed to .format for 3.4 compatibility.
-    codes_Dict = {
-        'MUs': "5001,1-0 {}\n".format(data),
-        'LINAC': "7001,1-0 {}\n".format(data),
-        'PID': "7001,2-0 {}\n".format(data),
-        'PName': "7001,3-0 {}\n".format(data),
-        'PlanName': "7001,4-0 {}\n".format(data),
-        'TxName': "7001,5-0 {}\n".format(data),
-        'BeamName': "7001,7-0 {}\n".format(data),
-        'BeamID': "7001,6-0 {}\n".format(data),
-        'FieldComplexity': "7002,5-0 {}\n".format(data),
-        'LeafWidth': "7002,6-0 {}\n".format(data),
-        'RadType': "5001,2-{0} {1}\n".format(cp, data),
-        'Energy': "5001,3-{0} {1} MV\n".format(cp, data),
-        'Wedge': "5001,4-{0} {1}\n".format(cp, data),  # OUT
-        'Gantry': "5001,7-{0} {1}\n".format(cp, data),
-        'Acc': "5001,f-{0} {1}\n".format(cp, data),
-        'GantryDirection': "5001,19-{0} {1}\n".format(cp, data),
-        'Collimator': "5001,8-{0} {1}\n".format(cp, data),
-        'CollimatorDir': "5001,bb-{0} {1}\n".format(cp, data),
-        'X1': "5001,9-{0} {1}\n".format(cp, data),
-        'X2': "5001,a-{0} {1}\n".format(cp, data),
-        'Y1': "5001,b-{0} {1}\n".format(cp, data),
-        'Y2': "5001,c-{0} {1}\n".format(cp, data),
-        'MeterSet': "7002,4-{0} {1}\n".format(cp, data),  # is zero
-        # Add more cases as needed
-    }
-    with open(file_name, 'a') as file:
-        if "MLC" not in code:
-            line_to_write = codes_Dict[code]
-            file.write(line_to_write)
-        else:
-            mlc = 1
-            for leave in data:
-                if mlc < 81:
-                    mlc_code = MLCX2_Lookup(str(81 - mlc))
-                    line_to_write = "5001,{0}-{1} {2}\n".format(mlc_code, cp, round(-leave / 10, 2))
-                else:
-                    mlc_code = MLCX1_Lookup(str(161 - mlc))
-                    line_to_write = "5001,{0}-{1} {2}\n".format(mlc_code, cp, round(leave / 10, 2))
-                mlc += 1
-                file.write(line_to_write)
+    return MLCX2_CODES[leave]
+
+
+def mlc_efs_values(leaves):
+    """
+    Converte as posições DICOM (mm) de um CP nos valores EFS (cm), de forma vetorizada:
+    -leave/10 para o banco X2 e leave/10 para o banco X1, arredondados a 2 casas.
+    O resultado é idêntico ao round() do Python: np.round multiplica por 100 antes
+    de arredondar, então os valores próximos de ...5 são refeitos com round().
+    """
+    leaves = np.asarray(leaves, dtype=np.float64)
+    if leaves.size > len(MLC_LINE_PREFIXES):
+        raise ValueError("Número de lâminas não suportado no EFS: %d" % leaves.size)
+    values = leaves / 10
+    values[:MLC_BANK_B_LEAVES] = -values[:MLC_BANK_B_LEAVES]
+    rounded = np.round(values, 2)
+    scaled = values * 100
+    ties = np.flatnonzero(np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6)
+    for k in ties:
+        rounded[k] = round(float(values[k]), 2)
+    return rounded
+
+
+def format_mlc_efs(cp, leaves):
+    # Todas as linhas de lâmina de um CP num único passo
+    values = mlc_efs_values(leaves).tolist()
+    return ''.join(["{0}{1} {2}\n".format(prefix, cp, value)
+                    for prefix, value in zip(MLC_LINE_PREFIXES, values)])
+
+
+def format_efs(cp, code, data):  # f-string formatting changed to .format for 3.4 compatibility.
+    if "MLC" in code:
+        return format_mlc_efs(cp, data)
+    return EFS_CODES[code].format(cp, data)
+
+
+def write_efs(efs_file, cp, code, data):
+    # efs_file pode ser um EfsWriter (caminho rápido) ou o caminho do arquivo,
+    # que é reaberto em modo append a cada chamada (comportamento original)
+    if isinstance(efs_file, EfsWriter):
+        efs_file.write(cp, code, data)
+        return
+    with open(efs_file, 'a') as file:
+        file.write(format_efs(cp, code, data))
 
 
 def getGantry(cp):
@@ -246,15 +190,26 @@ def getCollimator(beam):
     return collimator
 
 
-def get_total_MUs(rtplan, beam_number):
-    # Get the total MUs for the beam from Fraction Group
-    total_mus = 0.0
-    fraction_group = rtplan.FractionGroupSequence[0]
-    for referenced_beam in fraction_group.ReferencedBeamSequence:
-        if referenced_beam.ReferencedBeamNumber == beam_number:
-            total_mus = referenced_beam.BeamMeterset
-            break
-    return total_mus
+def build_meterset_index(rtplan):
+    """
+    Índice ReferencedBeamNumber -> BeamMeterset de todos os Fraction Groups do plano,
+    montado uma única vez por Dataset. Se um feixe aparece em mais de um grupo,
+    prevalece o primeiro grupo (mesmo resultado da busca original no grupo 0).
+    """
+    index = {}
+    for fraction_group in getattr(rtplan, "FractionGroupSequence", None) or []:
+        for referenced_beam in getattr(fraction_group, "ReferencedBeamSequence", None) or []:
+            if "BeamMeterset" not in referenced_beam or referenced_beam.BeamMeterset is None:
+                continue
+            index.setdefault(int(referenced_beam.ReferencedBeamNumber), referenced_beam.BeamMeterset)
+    return index
+
+
+def get_total_MUs(rtplan, beam_number, meterset_index=None):
+    # Get the total MUs for the beam from the Fraction Groups
+    if meterset_index is None:
+        meterset_index = build_meterset_index(rtplan)
+    return meterset_index.get(int(beam_number), 0.0)
 
 
 def getFirstGantry(beam):
@@ -297,7 +252,35 @@ def getBeamDelimiters(Beam_Lim_Dev_Pos_Seq, First_Yjaw_position):
     return Xjaw_position, Yjaw_position, mlc_positions
 
 
-def efs_standard_header_struct(crtplan, cbeam, efs_file):
+def _efs_device_type(model, prefix):
+    # Mesma regra de getBeamDelimiters: tipo que começa com 'X'/'Y' (o último encontrado)
+    types = [t for t in model.devices if t.upper().startswith(prefix) and "MLC" not in t.upper()]
+    return types[-1] if types else None
+
+
+def efs_jaw_positions(model):
+    """
+    Versão colunar de getBeamDelimiters para um BeamModel: devolve as listas de
+    [jaw1, jaw2] por CP para X e Y, com os mesmos tipos e valores padrão
+    (±200 mm; para Y, a posição do primeiro CP). CPs que omitem o jaw herdam o
+    valor do CP anterior.
+    """
+    x_type = _efs_device_type(model, "X")
+    y_type = _efs_device_type(model, "Y")
+    First_Yjaw_position = model.device_positions(y_type, 0) if y_type else None
+
+    def rows(dtype, default):
+        if dtype is None:
+            return [list(default) for _ in range(model.n_cps)]
+        values = model.devices[dtype][:, :2]
+        missing = np.isnan(values[:, 0]).tolist()
+        return [default if miss else row for miss, row in zip(missing, values.tolist())]
+
+    return (rows(x_type, [-200.0, 200.0]),
+            rows(y_type, First_Yjaw_position[:2] if First_Yjaw_position else [-200.0, 200.0]))
+
+
+def efs_standard_header_struct(crtplan, cbeam, efs_file, meterset_index=None):
     PatientID = crtplan.PatientID
     patient_name = crtplan.PatientName
     treatment_name = crtplan.BeamSequence[0].TreatmentMachineName
@@ -309,9 +292,10 @@ def efs_standard_header_struct(crtplan, cbeam, efs_file):
     beam_name = cbeam.BeamDescription
     leaf_width = 0.5
 
-    total_monitor_units = round(get_total_MUs(crtplan, cbeam.BeamNumber), 2)
+    total_monitor_units = round(get_total_MUs(crtplan, cbeam.BeamNumber, meterset_index), 2)
 
-    create_efs(efs_file)
+    if not isinstance(efs_file, EfsWriter):
+        create_efs(efs_file)
     write_efs(efs_file, 0, 'MUs', total_monitor_units)
     write_efs(efs_file, 0, 'LINAC', '6480')
     write_efs(efs_file, 0, 'PID', PatientID)
@@ -344,86 +328,181 @@ def efs_control_point_struct(FieldTech, energy, gantry_angle, gantry_rot, collim
     write_efs(efs_file, cp_count, 'MeterSet', 100 * monitor_units)
 
 
-def convert_dcm2efs(file_path, efs_name_path=None):
+def convert_beam_to_efs(rtplan, beam, efs_file, meterset_index=None):
+    # efs_file pode ser um EfsWriter ou um caminho (ver write_efs)
+    # Cabeçalhos gerais
+    efs_standard_header_struct(rtplan, beam, efs_file, meterset_index)
+
+    control_points = beam.ControlPointSequence
+    collimator = int(getCollimator(beam))
+    energy = control_points[0].NominalBeamEnergy
+
+    cp_len = len(control_points)
+    First_gantry, First_gantry_rot = getFirstGantry(beam)
+
+    # Jaws, MLC e pesos vêm do modelo colunar (uma passada pela sequência);
+    # o gantry continua lido do CP para manter o texto original do DS no EFS
+    model = bm.BeamModel(beam)
+    Xjaw_positions, Yjaw_positions = efs_jaw_positions(model)
+    monitor_units = model.meterset_weight.tolist()
+
+    # Determina técnica do feixe
+    if 'NONE' in First_gantry_rot and cp_len > 2:
+        FieldTech = 'IMRT'
+        write_efs(efs_file, 0, 'FieldComplexity', 'Dynamic')
+    elif 'NONE' in First_gantry_rot and cp_len == 2:
+        FieldTech = 'Static'
+    else:
+        FieldTech = 'VMAT'
+        write_efs(efs_file, 0, 'FieldComplexity', 'IMAT')
+
+    # Loop por todos os Control Points
+    for idx, cp in enumerate(control_points):
+        cp_count = idx + 1
+        if 'VMAT' in FieldTech:
+            gantry_angle, gantry_rot = getGantry(cp)
+        else:
+            gantry_angleFl, gantry_rot = getFirstGantry(beam)
+            gantry_angle = int(gantry_angleFl)
+
+        # Só pula o último CP em static, escrevendo somente MeterSet; nos demais, escreve tudo
+#        if not ('Static' in FieldTech and cp_count == cp_len):
+        if not ('Static' in FieldTech and cp_count > cp_len):
+            efs_control_point_struct(
+                FieldTech,
+                energy,
+                gantry_angle,
+                gantry_rot,
+                collimator,
+                Xjaw_positions[idx],
+                Yjaw_positions[idx],
+                model.leaves[idx],
+                monitor_units[idx],
+                cp_count,
+                efs_file
+            )
+        else:
+            write_efs(efs_file, cp_count, 'MeterSet', 100 * monitor_units[idx])
+
+
+def _beam_job_plan(rtplan):
+    # Dataset mínimo enviado a cada processo: só o que o cabeçalho EFS utiliza
+    # (os MUs seguem no índice de metersets, dispensando FractionGroupSequence)
+    plan = pydicom.Dataset()
+    plan.PatientID = rtplan.PatientID
+    plan.PatientName = rtplan.PatientName
+    first_beam = pydicom.Dataset()
+    first_beam.TreatmentMachineName = rtplan.BeamSequence[0].TreatmentMachineName
+    plan.BeamSequence = [first_beam]
+    return plan
+
+
+def _convert_beam_job(rtplan, beam, tmp_file, meterset_index):
+    # Um único handle por feixe: as linhas são gravadas de uma vez ao final
+    with EfsWriter(tmp_file) as writer:
+        convert_beam_to_efs(rtplan, beam, writer, meterset_index)
+    return tmp_file
+
+
+def _temp_efs_path(efs_file):
+    fd, tmp_file = tempfile.mkstemp(prefix='.' + os.path.basename(efs_file) + '.',
+                                    suffix='.tmp', dir=os.path.dirname(efs_file) or None)
+    os.close(fd)
+    return tmp_file
+
+
+def efs_file_name(beam):
+    safe_name = beam.BeamName.replace(" ", "_")
+    return 'Beam_' + safe_name + '.efs'
+
+
+def write_beam_efs(rtplan, beam, stream, meterset_index=None):
+    # Converte um feixe do Dataset e grava o conteúdo EFS em qualquer objeto com write()
+    with EfsWriter(stream) as writer:
+        convert_beam_to_efs(rtplan, beam, writer, meterset_index)
+
+
+def dataset_to_efs_texts(rtplan):
+    """
+    Converte um RTPLAN já carregado (pydicom.Dataset) sem tocar no disco.
+    Retorna uma lista [(nome_do_arquivo_efs, conteúdo), ...] na ordem de BeamSequence.
+    """
+    texts = []
+    meterset_index = build_meterset_index(rtplan)
+    for beam in rtplan.BeamSequence:
+        stream = io.StringIO()
+        write_beam_efs(rtplan, beam, stream, meterset_index)
+        texts.append((efs_file_name(beam), stream.getvalue()))
+    return texts
+
+
+def convert_dataset_to_efs(rtplan, efs_name_path, workers=None, use_processes=True):
+    """
+    Converte um RTPLAN já carregado (pydicom.Dataset), incluindo edições feitas em
+    memória, em arquivos .efs (um por feixe) dentro de efs_name_path.
+    workers > 1 distribui os feixes num pool do concurrent.futures (processos por
+    padrão, ou threads com use_processes=False). Cada feixe é gravado num arquivo
+    temporário e só é renomeado para o nome final depois que todos terminarem,
+    de modo que uma falha nunca deixa .efs incompletos na pasta de destino.
+    Retorna a lista de caminhos na ordem de BeamSequence; erros são propagados.
+    """
+    efs_names = [os.path.join(efs_name_path, efs_file_name(beam)) for beam in rtplan.BeamSequence]
+    meterset_index = build_meterset_index(rtplan)
+    tmp_files = []
+    try:
+        tmp_files = [_temp_efs_path(efs_file) for efs_file in efs_names]
+
+        if workers is None or workers <= 1 or len(efs_names) <= 1:
+            for beam, tmp_file in zip(rtplan.BeamSequence, tmp_files):
+                _convert_beam_job(rtplan, beam, tmp_file, meterset_index)
+        else:
+            if use_processes:
+                pool = ProcessPoolExecutor(max_workers=workers)
+                job_plan = _beam_job_plan(rtplan)
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers)
+                job_plan = rtplan
+            with pool:
+                futures = [pool.submit(_convert_beam_job, job_plan, beam, tmp_file, meterset_index)
+                           for beam, tmp_file in zip(rtplan.BeamSequence, tmp_files)]
+                for future in futures:
+                    future.result()
+
+        for tmp_file, efs_file in zip(tmp_files, efs_names):
+            os.replace(tmp_file, efs_file)
+    except Exception:
+        for tmp_file in tmp_files:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        raise
+    return efs_names
+
+
+# Únicos elementos de nível superior que a conversão EFS consulta
+EFS_REQUIRED_TAGS = ["PatientID", "PatientName", "BeamSequence", "FractionGroupSequence"]
+
+
+def read_rtplan_for_efs(file_path, fast_load=True, defer_size="64 KB"):
+    """
+    Lê o RTPLAN para conversão. Com fast_load, usa specific_tags para ler apenas
+    EFS_REQUIRED_TAGS: os demais elementos (blocos privados, ReferencedDoseSequence,
+    DoseReferenceSequence etc.) são pulados sem serem carregados nem interpretados.
+    Valores maiores que defer_size dentro das sequências lidas só são carregados
+    se acessados; os demais continuam crus até o primeiro acesso (padrão do pydicom).
+    """
+    if not fast_load:
+        return pydicom.dcmread(file_path, force=True)
+    return pydicom.dcmread(file_path, force=True, specific_tags=EFS_REQUIRED_TAGS, defer_size=defer_size)
+
+
+def convert_dcm2efs(file_path, efs_name_path=None, workers=None, use_processes=True, fast_load=True):
+    # Lê o RTPLAN do disco e converte; ver read_rtplan_for_efs e convert_dataset_to_efs.
+    # Retorna a lista de caminhos .efs, ou None em caso de erro.
     try:
-        rtplan = pydicom.dcmread(file_path,force=True)
+        rtplan = read_rtplan_for_efs(file_path, fast_load)
         if efs_name_path is None:
             efs_name_path = os.path.dirname(file_path)
-        efs_names = []
-
-        for beam in rtplan.BeamSequence:
-            safe_name = beam.BeamName.replace(" ", "_")
-            efs_file = os.path.join(efs_name_path, 'Beam_' + safe_name + '.efs')
-
-            # Cabeçalhos gerais
-            efs_standard_header_struct(rtplan, beam, efs_file)
-
-            control_points = beam.ControlPointSequence
-            collimator = int(getCollimator(beam))
-            energy = control_points[0].NominalBeamEnergy
-
-            cp_count = 1
-            cp_len = len(control_points)
-            First_gantry, First_gantry_rot = getFirstGantry(beam)
-
-            # Obtém First_Yjaw_position do primeiro CP, caso exista
-            first_bl_seq = control_points[0].BeamLimitingDevicePositionSequence
-            First_Yjaw_position = None
-            if first_bl_seq:
-                for item in first_bl_seq:
-                    dtype = getattr(item, "RTBeamLimitingDeviceType", "").upper()
-                    if dtype.startswith("Y") and hasattr(item, "LeafJawPositions"):
-                        First_Yjaw_position = [float(x) for x in item.LeafJawPositions]
-                        break
-
-            total_mus = get_total_MUs(rtplan, beam.BeamNumber)
-
-            # Determina técnica do feixe
-            if 'NONE' in First_gantry_rot and cp_len > 2:
-                FieldTech = 'IMRT'
-                write_efs(efs_file, 0, 'FieldComplexity', 'Dynamic')
-            elif 'NONE' in First_gantry_rot and cp_len == 2:
-                FieldTech = 'Static'
-            else:
-                FieldTech = 'VMAT'
-                write_efs(efs_file, 0, 'FieldComplexity', 'IMAT')
-
-            # Loop por todos os Control Points
-            for cp in control_points:
-                if 'VMAT' in FieldTech:
-                    gantry_angle, gantry_rot = getGantry(cp)
-                else:
-                    gantry_angleFl, gantry_rot = getFirstGantry(beam)
-                    gantry_angle = int(gantry_angleFl)
-
-                monitor_units = cp.CumulativeMetersetWeight
-
-                # Só pula o último CP em static, escrevendo somente MeterSet; nos demais, escreve tudo
-#                if not ('Static' in FieldTech and cp_count == cp_len):
-                if not ('Static' in FieldTech and cp_count > cp_len):
-                    bl_seq = cp.BeamLimitingDevicePositionSequence
-                    Xjaw_position, Yjaw_position, mlc_positions = getBeamDelimiters(bl_seq, First_Yjaw_position)
-                    efs_control_point_struct(
-                        FieldTech,
-                        energy,
-                        gantry_angle,
-                        gantry_rot,
-                        collimator,
-                        Xjaw_position,
-                        Yjaw_position,
-                        mlc_positions,
-                        monitor_units,
-                        cp_count,
-                        efs_file
-                    )
-                else:
-                    write_efs(efs_file, cp_count, 'MeterSet', 100 * monitor_units)
-
-                cp_count += 1
-
-            efs_names.append(efs_file)
-
-        return efs_names
+        return convert_dataset_to_efs(rtplan, efs_name_path, workers, use_processes)
 
     except Exception as e:
         print(e)
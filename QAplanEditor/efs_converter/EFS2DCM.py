@@ -0,0 +1,228 @@
+"""
+Conversor inverso de DCM2EFS: reconstrói um RTPLAN DICOM a partir de um ou mais
+arquivos .efs e de um RTPLAN modelo.
+
+Do modelo são aproveitados os atributos gerais do plano, os atributos do feixe
+(exceto os control points) e os atributos do primeiro CP que o EFS não guarda
+(mesa, isocentro etc.). Os control points são montados em lote a partir dos arrays
+de efs_reader.read_efs, sem deepcopy de um CP por iteração.
+
+Uso (a partir da pasta QAplanEditor):
+    python -m efs_converter.EFS2DCM modelo_RP.dcm saida_RP.dcm Beam_A.efs Beam_B.efs
+"""
+import copy
+import os
+import sys
+
+import numpy as np
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.sequence import Sequence
+
+from efs_converter.efs_reader import _carry_forward, read_efs
+
+TAG_BEAM_SEQUENCE = 0x300A00B0
+TAG_CONTROL_POINT_SEQUENCE = 0x300A0111
+
+# Elementos de cada CP gerados a partir do EFS (os demais do CP0 vêm do modelo)
+CP_GENERATED_TAGS = {
+    0x300A0112,  # ControlPointIndex
+    0x300A0114,  # NominalBeamEnergy
+    0x300A011A,  # BeamLimitingDevicePositionSequence
+    0x300A011E,  # GantryAngle
+    0x300A011F,  # GantryRotationDirection
+    0x300A0120,  # BeamLimitingDeviceAngle
+    0x300A0121,  # BeamLimitingDeviceRotationDirection
+    0x300A0134,  # CumulativeMetersetWeight
+}
+
+
+def _copy_without(ds, excluded_tags):
+    # Cópia elemento a elemento, sem duplicar as sequências que serão reconstruídas.
+    # A codificação de leitura (VR implícito/explícito, endianness, charset) vai junto:
+    # sem TransferSyntaxUID no file_meta, é ela que save_as usa para gravar
+    new = Dataset()
+    implicit_vr, little_endian = getattr(ds, "original_encoding", (None, None))
+    if None not in (implicit_vr, little_endian):
+        new.set_original_encoding(implicit_vr, little_endian, ds.original_character_set)
+    for elem in ds:
+        if elem.tag not in excluded_tags:
+            new.add(copy.deepcopy(elem))
+    return new
+
+
+def _ds_strings(values, fmt):
+    # Formata uma matriz inteira de uma vez em strings DS. O sinal de -0.0 é mantido:
+    # no EFS ele distingue 0.0 de -0.0 e a ida e volta DICOM -> EFS -> DICOM fica exata
+    return np.char.mod(fmt, values).tolist()
+
+
+def _defined(values, name, efs):
+    """
+    Valores de um array do EFS prontos para DS: NaN (valor ausente no .efs) repete o
+    CP anterior, como no DICOM; sem valor anterior, o EFS é rejeitado em vez de
+    gravar "nan" no RTPLAN.
+    """
+    values = _carry_forward(np.asarray(values, dtype=float))
+    missing = np.isnan(values)
+    if missing.any():
+        cp = int(np.argwhere(missing)[0][0])
+        raise ValueError("%s: %s sem valor no CP %d (nem em CPs anteriores)."
+                         % (os.path.basename(str(efs.path)), name, cp + 1))
+    return values
+
+
+def _device_roles(template_cp):
+    # Tipo de cada dispositivo do modelo e qual array do EFS o alimenta
+    roles = []
+    for item in getattr(template_cp, "BeamLimitingDevicePositionSequence", None) or []:
+        dtype = getattr(item, "RTBeamLimitingDeviceType", "")
+        upper = dtype.upper()
+        if "MLC" in upper:
+            roles.append((dtype, "leaves"))
+        elif upper.startswith("X") or upper.startswith("ASYMX"):
+            roles.append((dtype, "jaw_x"))
+        elif upper.startswith("Y") or upper.startswith("ASYMY"):
+            roles.append((dtype, "jaw_y"))
+    if not roles:
+        roles = [("ASYMX", "jaw_x"), ("ASYMY", "jaw_y"), ("MLCX", "leaves")]
+    return roles
+
+
+def build_control_points(efs, template_cp=None):
+    """
+    Monta a ControlPointSequence de um feixe a partir de um EfsData.
+    Todos os valores numéricos são formatados em lote (um passo por array);
+    o laço por CP só cria os Datasets e atribui as strings já prontas.
+    """
+    n_cps = efs.n_cps
+    roles = _device_roles(template_cp)
+    used = {role for _, role in roles}
+    arrays = {
+        role: _ds_strings(np.round(_defined(getattr(efs, role), role, efs), 1), "%.1f")
+        for role in ("leaves", "jaw_x", "jaw_y") if role in used
+    }
+    gantry = _ds_strings(np.round(np.mod(_defined(efs.gantry, "Gantry", efs), 360.0), 1), "%.1f")
+    collimator = _ds_strings(np.round(np.mod(_defined(efs.collimator, "Collimator", efs), 360.0), 1), "%.1f")
+    weights = _ds_strings(np.round(_defined(efs.meterset_weight, "MeterSet", efs), 6), "%.6g")
+    energy = efs.energy[0] if n_cps else np.nan
+
+    control_points = []
+    for i in range(n_cps):
+        if i == 0 and template_cp is not None:
+            cp = _copy_without(template_cp, CP_GENERATED_TAGS)
+        else:
+            cp = Dataset()
+        cp.ControlPointIndex = i
+        if i == 0 and not np.isnan(energy):
+            cp.NominalBeamEnergy = str(float(energy))
+        bl_items = []
+        for dtype, role in roles:
+            item = Dataset()
+            item.RTBeamLimitingDeviceType = dtype
+            item.LeafJawPositions = arrays[role][i]
+            bl_items.append(item)
+        cp.BeamLimitingDevicePositionSequence = Sequence(bl_items)
+        cp.GantryAngle = gantry[i]
+        cp.GantryRotationDirection = efs.gantry_direction[i] or "NONE"
+        if i == 0:
+            cp.BeamLimitingDeviceAngle = collimator[i]
+            cp.BeamLimitingDeviceRotationDirection = "NONE"
+        cp.CumulativeMetersetWeight = weights[i]
+        control_points.append(cp)
+    return Sequence(control_points)
+
+
+def _beam_name_from_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return name[len("Beam_"):] if name.startswith("Beam_") else name
+
+
+def build_beam(efs, template_beam, beam_number):
+    beam = _copy_without(template_beam, {TAG_CONTROL_POINT_SEQUENCE})
+    template_cps = getattr(template_beam, "ControlPointSequence", None)
+    beam.ControlPointSequence = build_control_points(efs, template_cps[0] if template_cps else None)
+    beam.NumberOfControlPoints = efs.n_cps
+    beam.BeamNumber = beam_number
+    beam.BeamName = _beam_name_from_path(efs.path)
+    if "BeamName" in efs.header:
+        beam.BeamDescription = efs.header["BeamName"]
+    if "TxName" in efs.header:
+        beam.TreatmentMachineName = efs.header["TxName"]
+    is_static = efs.n_cps <= 2 and not efs.field_complexity
+    beam.BeamType = "STATIC" if is_static else "DYNAMIC"
+    return beam
+
+
+def convert_efs2dcm(efs_paths, template, output_path=None):
+    """
+    Reconstrói um RTPLAN a partir dos arquivos .efs (um feixe por arquivo, na ordem dada).
+    template pode ser o caminho de um RTPLAN ou um pydicom.Dataset; o feixe i usa o
+    feixe i do modelo (ou o último, se o modelo tiver menos feixes).
+    Retorna o Dataset; se output_path for informado, também grava o arquivo.
+    """
+    if not isinstance(template, Dataset):
+        template = pydicom.dcmread(template, force=True)
+    efs_list = [read_efs(path) for path in efs_paths]
+    if not efs_list:
+        raise ValueError("Nenhum arquivo .efs informado.")
+
+    rtplan = _copy_without(template, {TAG_BEAM_SEQUENCE})
+    if hasattr(template, "file_meta"):
+        rtplan.file_meta = copy.deepcopy(template.file_meta)
+    rtplan.SOPInstanceUID = pydicom.uid.generate_uid()
+    if hasattr(rtplan, "file_meta") and "MediaStorageSOPInstanceUID" in rtplan.file_meta:
+        rtplan.file_meta.MediaStorageSOPInstanceUID = rtplan.SOPInstanceUID
+
+    header = efs_list[0].header
+    if "PID" in header:
+        rtplan.PatientID = header["PID"]
+    if "PName" in header:
+        rtplan.PatientName = header["PName"]
+
+    template_beams = getattr(template, "BeamSequence", None) or [Dataset()]
+    beams = []
+    referenced_beams = []
+    for idx, efs in enumerate(efs_list):
+        try:
+            beam_number = int(efs.header.get("BeamID", idx + 1))
+        except ValueError:
+            beam_number = idx + 1
+        if any(int(b.BeamNumber) == beam_number for b in beams):
+            beam_number = max(int(b.BeamNumber) for b in beams) + 1
+        beam = build_beam(efs, template_beams[min(idx, len(template_beams) - 1)], beam_number)
+        beams.append(beam)
+
+        ref = Dataset()
+        ref.ReferencedBeamNumber = beam_number
+        if "MUs" in efs.header:
+            ref.BeamMeterset = efs.header["MUs"]
+        referenced_beams.append(ref)
+    rtplan.BeamSequence = Sequence(beams)
+
+    fraction_groups = getattr(rtplan, "FractionGroupSequence", None)
+    fraction_group = fraction_groups[0] if fraction_groups else Dataset()
+    if not fraction_groups:
+        fraction_group.FractionGroupNumber = 1
+    fraction_group.NumberOfBeams = len(beams)
+    fraction_group.ReferencedBeamSequence = Sequence(referenced_beams)
+    rtplan.FractionGroupSequence = Sequence([fraction_group])
+
+    if output_path is not None:
+        rtplan.save_as(output_path)
+    return rtplan
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 3:
+        print("Uso: python -m efs_converter.EFS2DCM modelo_RP.dcm saida_RP.dcm arquivo1.efs [arquivo2.efs ...]")
+        return 1
+    template_path, output_path, efs_paths = argv[0], argv[1], argv[2:]
+    rtplan = convert_efs2dcm(efs_paths, template_path, output_path)
+    print("RTPLAN gravado em %s (%d feixes)" % (output_path, len(rtplan.BeamSequence)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
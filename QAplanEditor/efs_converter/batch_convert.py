@@ -0,0 +1,212 @@
+"""
+Conversão em lote de RTPLANs para .efs, sem interface gráfica.
+
+Percorre uma árvore de diretórios, converte cada RTPLAN encontrado com
+convert_dcm2efs usando um pool de processos e mantém um manifesto JSON
+(hash SHA-256 do arquivo de entrada -> arquivos .efs gerados), de modo que
+execuções seguintes só convertem os planos que mudaram.
+
+RTPLANs da mesma pasta de saída que gerariam .efs com o mesmo nome (feixes com o
+mesmo BeamName) vão cada um para uma subpasta com o nome do arquivo, em vez de
+sobrescreverem os .efs uns dos outros.
+
+Uso (a partir da pasta QAplanEditor):
+    python -m efs_converter.batch_convert sample_files/RTplans/versaHD_dlgMeasurement
+    python -m efs_converter.batch_convert PASTA --out SAIDA --workers 4 --force
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pydicom
+
+import efs_converter.DCM2EFS as ec
+
+MANIFEST_NAME = ".efs_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_rtplan(path):
+    # Lê apenas Modality/SOPClassUID para descartar rapidamente arquivos que não são RTPLAN
+    try:
+        ds = pydicom.dcmread(path, force=True, specific_tags=["Modality", "SOPClassUID"])
+    except Exception:
+        return False
+    return getattr(ds, "Modality", "") == "RTPLAN" or \
+        getattr(ds, "SOPClassUID", "") == pydicom.uid.RTPlanStorage
+
+
+def find_rtplans(root_dir):
+    plans = []
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(".dcm"):
+                path = os.path.join(dirpath, name)
+                if is_rtplan(path):
+                    plans.append(path)
+    return plans
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("plans", {})
+
+
+def save_manifest(path, plans):
+    # Grava num temporário e renomeia, para não corromper o manifesto se o processo for interrompido
+    fd, tmp_path = tempfile.mkstemp(prefix=".efs_manifest.", suffix=".tmp",
+                                    dir=os.path.dirname(path) or None)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({"version": MANIFEST_VERSION, "plans": plans}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def output_dir_for(plan_path, root_dir, out_root):
+    if out_root is None:
+        return os.path.dirname(plan_path)
+    rel_dir = os.path.relpath(os.path.dirname(plan_path), root_dir)
+    return os.path.normpath(os.path.join(out_root, rel_dir))
+
+
+def efs_names_for(plan_path):
+    # Nomes dos .efs que convert_dcm2efs gera para o RTPLAN (um por feixe)
+    try:
+        ds = pydicom.dcmread(plan_path, force=True, specific_tags=["BeamSequence"])
+        return [ec.efs_file_name(beam) for beam in getattr(ds, "BeamSequence", None) or []]
+    except Exception:
+        return []
+
+
+def plan_output_dirs(plans, root_dir, out_root):
+    """
+    Pasta de saída de cada RTPLAN (output_dir_for). Na mesma pasta, os RTPLANs cujos
+    .efs teriam o mesmo nome que os de outro RTPLAN vão para uma subpasta com o nome
+    do próprio arquivo.
+    """
+    by_dir = {}
+    for plan_path in plans:
+        by_dir.setdefault(output_dir_for(plan_path, root_dir, out_root), []).append(plan_path)
+    out_dirs = {}
+    for out_dir, group in by_dir.items():
+        owners = {}
+        if len(group) > 1:
+            for plan_path in group:
+                for name in set(os.path.normcase(name) for name in efs_names_for(plan_path)):
+                    owners.setdefault(name, []).append(plan_path)
+        clashing = {plan_path for paths in owners.values() if len(paths) > 1 for plan_path in paths}
+        for plan_path in group:
+            if plan_path in clashing:
+                out_dirs[plan_path] = os.path.join(out_dir, os.path.splitext(os.path.basename(plan_path))[0])
+            else:
+                out_dirs[plan_path] = out_dir
+    return out_dirs
+
+
+def is_up_to_date(entry, sha256, manifest_dir, out_dir):
+    if entry is None or entry.get("sha256") != sha256:
+        return False
+    # Os .efs precisam existir e estar na pasta de saída atual do plano
+    paths = [os.path.normpath(os.path.join(manifest_dir, efs)) for efs in entry.get("efs", [])]
+    return all(os.path.dirname(path) == os.path.normpath(out_dir) and os.path.exists(path) for path in paths)
+
+
+def _convert_job(plan_path, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    return ec.convert_dcm2efs(plan_path, out_dir)
+
+
+def batch_convert(root_dir, out_root=None, workers=None, manifest_path=None, force=False):
+    """
+    Converte todos os RTPLANs de root_dir. Retorna (convertidos, ignorados, falhas),
+    cada um como lista de caminhos dos RTPLANs.
+    """
+    root_dir = os.path.abspath(root_dir)
+    if out_root is not None:
+        out_root = os.path.abspath(out_root)
+    if manifest_path is None:
+        manifest_path = os.path.join(out_root or root_dir, MANIFEST_NAME)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    manifest = {} if force else load_manifest(manifest_path)
+
+    plans = find_rtplans(root_dir)
+    out_dirs = plan_output_dirs(plans, root_dir, out_root)
+    pending = {}
+    skipped = []
+    for plan_path in plans:
+        key = os.path.relpath(plan_path, root_dir)
+        sha256 = file_sha256(plan_path)
+        if is_up_to_date(manifest.get(key), sha256, manifest_dir, out_dirs[plan_path]):
+            skipped.append(plan_path)
+        else:
+            pending[plan_path] = (key, sha256)
+
+    converted = []
+    failed = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_convert_job, plan_path, out_dirs[plan_path]): plan_path
+                       for plan_path in pending}
+            for future in as_completed(futures):
+                plan_path = futures[future]
+                key, sha256 = pending[plan_path]
+                try:
+                    efs_names = future.result()
+                except Exception as e:
+                    print("%s: %s" % (plan_path, e))
+                    efs_names = None
+                if efs_names is None:
+                    manifest.pop(key, None)
+                    failed.append(plan_path)
+                    continue
+                manifest[key] = {
+                    "sha256": sha256,
+                    "efs": [os.path.relpath(efs, manifest_dir) for efs in efs_names],
+                }
+                converted.append(plan_path)
+                print("OK  %s -> %d .efs" % (key, len(efs_names)))
+
+    save_manifest(manifest_path, manifest)
+    return sorted(converted), skipped, sorted(failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Converte em lote todos os RTPLANs de uma pasta para .efs")
+    parser.add_argument("root", help="Pasta raiz com os RTPLANs (busca recursiva por *.dcm)")
+    parser.add_argument("--out", default=None,
+                        help="Pasta de saída (replica a estrutura de subpastas); padrão: ao lado de cada RTPLAN")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos (padrão: núcleos da CPU)")
+    parser.add_argument("--manifest", default=None,
+                        help="Caminho do manifesto (padrão: %s na pasta de saída)" % MANIFEST_NAME)
+    parser.add_argument("--force", action="store_true", help="Ignora o manifesto e reconverte tudo")
+    args = parser.parse_args(argv)
+
+    converted, skipped, failed = batch_convert(args.root, args.out, args.workers, args.manifest, args.force)
+    print("Convertidos: %d  Inalterados: %d  Falhas: %d" % (len(converted), len(skipped), len(failed)))
+    for plan_path in failed:
+        print("FALHA %s" % plan_path)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
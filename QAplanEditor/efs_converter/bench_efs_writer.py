@@ -0,0 +1,109 @@
+"""
+Benchmark da escrita de arquivos .efs: caminho original (reabre o arquivo a cada
+linha/CP via write_efs(caminho, ...)) versus EfsWriter (um handle por feixe).
+
+Uso (a partir da pasta QAplanEditor):
+    python -m efs_converter.bench_efs_writer
+    python -m efs_converter.bench_efs_writer --repeat 5 --cps 360
+"""
+import argparse
+import copy
+import filecmp
+import glob
+import os
+import statistics
+import tempfile
+import time
+
+import pydicom
+
+import efs_converter.DCM2EFS as ec
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SAMPLES = os.path.join(BASE_DIR, "sample_files", "RTplans", "versaHD_dlgMeasurement")
+
+
+def build_synthetic_arc(template_path, n_cps=360):
+    """
+    Gera um arco VMAT sintético com n_cps control points a partir do primeiro
+    feixe de um RTPLAN de exemplo (gantry 180.1 -> 179.9 CW, MLC oscilando).
+    """
+    rtplan = pydicom.dcmread(template_path, force=True)
+    beam = rtplan.BeamSequence[0]
+    template_cp = beam.ControlPointSequence[0]
+    cps = []
+    for i in range(n_cps):
+        cp = copy.deepcopy(template_cp)
+        cp.ControlPointIndex = i
+        cp.GantryAngle = round((180.1 + i * 359.8 / (n_cps - 1)) % 360, 1)
+        cp.GantryRotationDirection = "CW"
+        cp.CumulativeMetersetWeight = round(i / (n_cps - 1), 6)
+        for item in cp.BeamLimitingDevicePositionSequence:
+            if "MLC" in getattr(item, "RTBeamLimitingDeviceType", "").upper():
+                n = len(item.LeafJawPositions) // 2
+                offset = 20.0 * ((i % 20) / 10.0 - 1.0)
+                item.LeafJawPositions = [round(-30.0 + offset + 0.37 * k, 2) for k in range(n)] + \
+                                        [round(30.0 + offset - 0.21 * k, 2) for k in range(n)]
+        cps.append(cp)
+    beam.ControlPointSequence = pydicom.sequence.Sequence(cps)
+    return rtplan
+
+
+def _time_beam(rtplan, beam, efs_file, use_writer, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        if use_writer:
+            with ec.EfsWriter(efs_file) as writer:
+                ec.convert_beam_to_efs(rtplan, beam, writer)
+        else:
+            ec.convert_beam_to_efs(rtplan, beam, efs_file)
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def bench_plan(label, rtplan, out_dir, repeat):
+    legacy_total = 0.0
+    writer_total = 0.0
+    for beam in rtplan.BeamSequence:
+        legacy_file = os.path.join(out_dir, "legacy.efs")
+        writer_file = os.path.join(out_dir, "writer.efs")
+        legacy = _time_beam(rtplan, beam, legacy_file, False, repeat)
+        writer = _time_beam(rtplan, beam, writer_file, True, repeat)
+        if not filecmp.cmp(legacy_file, writer_file, shallow=False):
+            raise AssertionError("Saída divergente em %s (feixe %s)" % (label, beam.BeamName))
+        legacy_total += statistics.median(legacy)
+        writer_total += statistics.median(writer)
+    return legacy_total, writer_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark EfsWriter vs. escrita linha a linha")
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES, help="Pasta com RTPLANs de exemplo")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições por feixe (usa a mediana)")
+    parser.add_argument("--cps", type=int, default=360, help="Número de CPs do arco sintético")
+    args = parser.parse_args()
+
+    plan_files = sorted(glob.glob(os.path.join(args.samples, "**", "*.dcm"), recursive=True))
+    print("%-28s %12s %12s %8s" % ("Plano", "original (s)", "writer (s)", "ganho"))
+    with tempfile.TemporaryDirectory() as out_dir:
+        legacy_sum = writer_sum = 0.0
+        for path in plan_files:
+            rtplan = pydicom.dcmread(path, force=True)
+            try:
+                legacy, writer = bench_plan(path, rtplan, out_dir, args.repeat)
+            except (ValueError, AttributeError) as e:
+                print("%-28s ignorado (%s)" % (os.path.basename(path), e))
+                continue
+            legacy_sum += legacy
+            writer_sum += writer
+            print("%-28s %12.4f %12.4f %7.1fx" % (os.path.basename(path), legacy, writer, legacy / writer))
+        print("%-28s %12.4f %12.4f %7.1fx" % ("TOTAL amostras", legacy_sum, writer_sum, legacy_sum / writer_sum))
+
+        arc = build_synthetic_arc(plan_files[0], args.cps)
+        legacy, writer = bench_plan("arco sintético", arc, out_dir, args.repeat)
+        print("%-28s %12.4f %12.4f %7.1fx" % ("Arco sintético %d CPs" % args.cps, legacy, writer, legacy / writer))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark da leitura para conversão EFS: dcmread completo versus leitura seletiva
+(read_rtplan_for_efs com specific_tags/defer_size), num RTPLAN sintético que imita
+exportações grandes de TPS (bloco privado volumoso e ReferencedDoseSequence extensa).
+
+Uso (a partir da pasta QAplanEditor):
+    python -m efs_converter.bench_fast_load
+    python -m efs_converter.bench_fast_load --private-mb 32 --dose-refs 5000 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import pydicom
+from pydicom.dataset import Dataset
+from pydicom.sequence import Sequence
+
+import efs_converter.DCM2EFS as ec
+from efs_converter.bench_efs_writer import DEFAULT_SAMPLES, build_synthetic_arc
+
+
+def build_large_export(path, private_mb=16, dose_refs=2000, n_cps=180):
+    rtplan = build_synthetic_arc(os.path.join(DEFAULT_SAMPLES, "6X", "slit05_6X.dcm"), n_cps)
+
+    # Bloco privado volumoso (comum em exportações de TPS)
+    block = rtplan.private_block(0x3253, "BENCH TPS EXPORT", create=True)
+    block.add_new(0x10, "OB", os.urandom(private_mb * 1024 * 1024))
+    block.add_new(0x11, "LT", "x" * 10000)
+
+    # ReferencedDoseSequence com muitos itens
+    refs = []
+    for _ in range(dose_refs):
+        item = Dataset()
+        item.ReferencedSOPClassUID = pydicom.uid.RTDoseStorage
+        item.ReferencedSOPInstanceUID = pydicom.uid.generate_uid()
+        refs.append(item)
+    rtplan.ReferencedDoseSequence = Sequence(refs)
+    rtplan.save_as(path)
+    return path
+
+
+def _median_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark leitura completa vs. seletiva para EFS")
+    parser.add_argument("--private-mb", type=int, default=16, help="Tamanho do bloco privado (MB)")
+    parser.add_argument("--dose-refs", type=int, default=2000, help="Itens em ReferencedDoseSequence")
+    parser.add_argument("--cps", type=int, default=180, help="CPs do arco sintético")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições (usa a mediana)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        plan_path = build_large_export(os.path.join(out_dir, "large_RP.dcm"),
+                                       args.private_mb, args.dose_refs, args.cps)
+        size_mb = os.path.getsize(plan_path) / (1024.0 * 1024.0)
+
+        def convert(fast_load):
+            rtplan = ec.read_rtplan_for_efs(plan_path, fast_load)
+            ec.dataset_to_efs_texts(rtplan)
+
+        full_read = _median_time(lambda: ec.read_rtplan_for_efs(plan_path, False), args.repeat)
+        fast_read = _median_time(lambda: ec.read_rtplan_for_efs(plan_path, True), args.repeat)
+        full_conv = _median_time(lambda: convert(False), args.repeat)
+        fast_conv = _median_time(lambda: convert(True), args.repeat)
+
+        same = ec.dataset_to_efs_texts(ec.read_rtplan_for_efs(plan_path, False)) == \
+            ec.dataset_to_efs_texts(ec.read_rtplan_for_efs(plan_path, True))
+
+    print("Arquivo sintético: %.1f MB, %d CPs, %d ReferencedDose" % (size_mb, args.cps, args.dose_refs))
+    print("%-24s %12s %12s %8s" % ("", "completo (s)", "seletivo (s)", "ganho"))
+    print("%-24s %12.4f %12.4f %7.1fx" % ("Leitura", full_read, fast_read, full_read / fast_read))
+    print("%-24s %12.4f %12.4f %7.1fx" % ("Leitura + conversão", full_conv, fast_conv, full_conv / fast_conv))
+    print("Saída EFS idêntica: %s" % ("sim" if same else "NÃO"))
+
+
+if __name__ == "__main__":
+    main()
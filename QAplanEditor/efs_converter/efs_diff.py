@@ -0,0 +1,189 @@
+"""
+Comparação vetorizada entre dois planos, CP a CP e lâmina a lâmina.
+
+Cada lado pode ser um RTPLAN (.dcm) ou um ou mais arquivos .efs. Os dois lados são
+levados para a mesma representação (EfsData de efs_reader: leaves em mm na ordem e
+sinal do DICOM, jaws X/Y em mm, gantry/colimador em -180..180 como em getGantry)
+e comparados com operações NumPy sobre as matrizes inteiras de cada feixe.
+
+Uso (a partir da pasta QAplanEditor):
+    python -m efs_converter.efs_diff plano_RP.dcm --against Beam_A.efs Beam_B.efs
+    python -m efs_converter.efs_diff plano_A.dcm --against plano_B.dcm --tolerance 0.5
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from pydicom.dataset import Dataset
+
+import dicom_utils.beam_model as bm
+import efs_converter.DCM2EFS as ec
+from efs_converter.efs_reader import EfsData, read_efs
+
+
+def _wrap_angle(values):
+    # Converte ângulos DICOM (0..360) para a convenção do EFS (-180..180]
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(values > 180, values - 360, values)
+
+
+def beam_to_efs_data(rtplan, beam, meterset_index=None):
+    """
+    Extrai os arrays de um feixe DICOM (via BeamModel) com as mesmas convenções do
+    conversor (efs_jaw_positions, getCollimator), sem o arredondamento do texto EFS.
+    Valores omitidos em CPs posteriores são herdados do CP anterior.
+    """
+    model = bm.BeamModel(beam)
+    jaw_x, jaw_y = ec.efs_jaw_positions(model)
+    n_cps = model.n_cps
+    collimator = np.full(n_cps, float(ec.getCollimator(beam)))
+    energy = np.full(n_cps, float(getattr(beam.ControlPointSequence[0], "NominalBeamEnergy", np.nan)))
+    header = {
+        'BeamID': str(getattr(beam, "BeamNumber", "")),
+        'BeamName': str(getattr(beam, "BeamDescription", getattr(beam, "BeamName", ""))),
+        'MUs': str(ec.get_total_MUs(rtplan, beam.BeamNumber, meterset_index)),
+    }
+    return EfsData(ec.efs_file_name(beam), header, _wrap_angle(model.gantry), collimator, energy,
+                   100.0 * model.meterset_weight, np.array(jaw_x), np.array(jaw_y),
+                   model.leaves, model.gantry_direction)
+
+
+def plan_to_efs_data(rtplan):
+    # Todos os feixes de um RTPLAN (caminho ou Dataset), na ordem de BeamSequence
+    if not isinstance(rtplan, Dataset):
+        rtplan = ec.read_rtplan_for_efs(rtplan)
+    meterset_index = ec.build_meterset_index(rtplan)
+    return [beam_to_efs_data(rtplan, beam, meterset_index) for beam in rtplan.BeamSequence]
+
+
+def load_side(paths):
+    """
+    Carrega um lado da comparação: um RTPLAN, ou uma lista de arquivos .efs
+    (um feixe por arquivo). Retorna a lista de EfsData.
+    """
+    if isinstance(paths, (str, Dataset)):
+        paths = [paths]
+    beams = []
+    for path in paths:
+        if isinstance(path, Dataset) or not path.lower().endswith(".efs"):
+            beams.extend(plan_to_efs_data(path))
+        else:
+            beams.append(read_efs(path))
+    return beams
+
+
+class BeamDiff:
+    """
+    Diferenças entre dois feixes (B - A), calculadas nos CPs e lâminas em comum.
+    leaf_delta é a matriz CP×lâmina de desvios (mm); as demais são por CP.
+    """
+
+    def __init__(self, label, a, b):
+        self.label = label
+        self.n_cps = (a.n_cps, b.n_cps)
+        self.n_leaves = (a.leaves.shape[1], b.leaves.shape[1])
+        n = min(a.n_cps, b.n_cps)
+        m = min(self.n_leaves)
+
+        self.leaf_delta = b.leaves[:n, :m] - a.leaves[:n, :m]
+        self.jaw_x_delta = b.jaw_x[:n] - a.jaw_x[:n]
+        self.jaw_y_delta = b.jaw_y[:n] - a.jaw_y[:n]
+        self.gantry_delta = (b.gantry[:n] - a.gantry[:n] + 180.0) % 360.0 - 180.0
+        self.collimator_delta = (b.collimator[:n] - a.collimator[:n] + 180.0) % 360.0 - 180.0
+        self.meterset_weight_delta = b.meterset_weight[:n] - a.meterset_weight[:n]
+
+        abs_leaf = np.abs(self.leaf_delta)
+        if abs_leaf.size and not np.all(np.isnan(abs_leaf)):
+            flat = np.nanargmax(abs_leaf)
+            self.leaf_max = float(abs_leaf.flat[flat])
+            self.leaf_max_at = tuple(int(i) for i in np.unravel_index(flat, abs_leaf.shape))
+            self.leaf_rms = float(np.sqrt(np.nanmean(self.leaf_delta ** 2)))
+            self.leaf_max_per_cp = np.nanmax(abs_leaf, axis=1)
+        else:
+            self.leaf_max = 0.0
+            self.leaf_max_at = None
+            self.leaf_rms = 0.0
+            self.leaf_max_per_cp = np.zeros(n)
+
+    @staticmethod
+    def _max_abs(values):
+        return float(np.nanmax(np.abs(values))) if values.size else 0.0
+
+    @property
+    def jaw_x_max(self):
+        return self._max_abs(self.jaw_x_delta)
+
+    @property
+    def jaw_y_max(self):
+        return self._max_abs(self.jaw_y_delta)
+
+    @property
+    def gantry_max(self):
+        return self._max_abs(self.gantry_delta)
+
+    @property
+    def collimator_max(self):
+        return self._max_abs(self.collimator_delta)
+
+    @property
+    def meterset_weight_max(self):
+        return self._max_abs(self.meterset_weight_delta)
+
+    def within(self, leaf_tolerance, angle_tolerance=0.1, weight_tolerance=1e-3):
+        return (self.n_cps[0] == self.n_cps[1] and self.n_leaves[0] == self.n_leaves[1] and
+                self.leaf_max <= leaf_tolerance and self.jaw_x_max <= leaf_tolerance and
+                self.jaw_y_max <= leaf_tolerance and self.gantry_max <= angle_tolerance and
+                self.collimator_max <= angle_tolerance and self.meterset_weight_max <= weight_tolerance)
+
+    def format_report(self):
+        lines = ["Feixe %s" % self.label]
+        if self.n_cps[0] != self.n_cps[1]:
+            lines.append("  CPs: %d x %d (comparados os %d primeiros)" % (
+                self.n_cps[0], self.n_cps[1], min(self.n_cps)))
+        if self.n_leaves[0] != self.n_leaves[1]:
+            lines.append("  Lâminas: %d x %d" % self.n_leaves)
+        where = ""
+        if self.leaf_max_at is not None:
+            where = " (CP %d, lâmina %d)" % (self.leaf_max_at[0] + 1, self.leaf_max_at[1] + 1)
+        lines.append("  Lâminas: máx %.3f mm%s, RMS %.3f mm" % (self.leaf_max, where, self.leaf_rms))
+        lines.append("  Jaws: X máx %.3f mm, Y máx %.3f mm" % (self.jaw_x_max, self.jaw_y_max))
+        lines.append("  Ângulos: gantry máx %.3f°, colimador máx %.3f°" % (self.gantry_max, self.collimator_max))
+        lines.append("  Meterset weight: máx %.6f" % self.meterset_weight_max)
+        return "\n".join(lines)
+
+
+def diff_plans(side_a, side_b):
+    """
+    Compara dois lados (ver load_side) feixe a feixe, na ordem. Retorna a lista de
+    BeamDiff; feixes sem par no outro lado são ignorados (ver o número de feixes).
+    """
+    beams_a = load_side(side_a)
+    beams_b = load_side(side_b)
+    diffs = []
+    for a, b in zip(beams_a, beams_b):
+        label = os.path.basename(a.path or '') or a.header.get('BeamName', '')
+        diffs.append(BeamDiff(label, a, b))
+    return diffs, (len(beams_a), len(beams_b))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compara dois planos (RTPLAN ou .efs) CP a CP e lâmina a lâmina")
+    parser.add_argument("a", nargs="+", help="Lado A: um RTPLAN ou arquivos .efs")
+    parser.add_argument("--against", "-b", nargs="+", required=True, help="Lado B: um RTPLAN ou arquivos .efs")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Tolerância para lâminas/jaws (mm)")
+    args = parser.parse_args(argv)
+
+    diffs, counts = diff_plans(args.a, args.against)
+    if counts[0] != counts[1]:
+        print("Número de feixes diferente: %d x %d" % counts)
+    ok = counts[0] == counts[1]
+    for diff in diffs:
+        print(diff.format_report())
+        ok = ok and diff.within(args.tolerance)
+    print("Resultado: %s" % ("dentro da tolerância" if ok else "FORA da tolerância"))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
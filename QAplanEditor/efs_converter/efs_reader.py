@@ -0,0 +1,217 @@
+"""
+Leitura de arquivos .efs para arrays NumPy colunares.
+
+Cada linha de um .efs tem o formato "grupo,elemento-cp valor". O arquivo é lido
+numa única passagem (via mmap para arquivos grandes) e decodificado em:
+  - header: campos gerais (cp 0), ex.: {'MUs': '100.0', 'BeamName': 'Re', ...}
+  - arrays por CP: gantry, collimator, energy, meterset, jaw_x, jaw_y
+  - leaves: matriz CP×160 em mm, na ordem e no sinal do LeafJawPositions do DICOM
+
+As convenções são as inversas de DCM2EFS.write_efs: o banco X2 do EFS guarda as
+80 primeiras lâminas do DICOM em ordem reversa e com sinal invertido (cm), e os
+campos X1/X2/Y1/Y2 do EFS correspondem aos jaws Y/X do DICOM.
+
+Uso (a partir da pasta QAplanEditor):
+    python -m efs_converter.efs_reader sample_files/RTplans/versaHD_dlgMeasurement/6X/Beam_slit06.efs
+"""
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import efs_converter.DCM2EFS as ec
+
+# Arquivos a partir deste tamanho são lidos via mmap, linha a linha
+MMAP_THRESHOLD = 1 << 20
+
+# Tag do EFS ("5001,7") -> nome do campo em DCM2EFS.EFS_CODES ("Gantry")
+EFS_TAGS = {template.split('-')[0].encode('ascii'): code for code, template in ec.EFS_CODES.items()}
+HEADER_CODES = {code for code, template in ec.EFS_CODES.items() if '-0 ' in template}
+
+# Tag da lâmina ("5001,250") -> coluna no LeafJawPositions do DICOM e fator cm -> mm
+LEAF_COLUMNS = {prefix[:-1].encode('ascii'): column for column, prefix in enumerate(ec.MLC_LINE_PREFIXES)}
+LEAF_SCALE = np.where(np.arange(len(ec.MLC_LINE_PREFIXES)) < ec.MLC_BANK_B_LEAVES, -10.0, 10.0)
+
+# Campos numéricos por CP
+NUMERIC_CODES = ('Gantry', 'Collimator', 'Energy', 'MeterSet', 'X1', 'X2', 'Y1', 'Y2')
+
+
+class EfsData:
+    """
+    Conteúdo decodificado de um arquivo .efs.
+    Arrays por CP (tamanho n_cps, CPs numerados a partir de 1 no arquivo):
+      gantry, collimator (graus), energy (MV), meterset (% acumulado, 0-100),
+      jaw_x, jaw_y (n_cps×2, mm, como no DICOM: [X1, X2] / [Y1, Y2]),
+      leaves (n_cps×160, mm, como LeafJawPositions do DICOM),
+      gantry_direction (lista de str).
+    """
+
+    def __init__(self, path, header, gantry, collimator, energy, meterset,
+                 jaw_x, jaw_y, leaves, gantry_direction):
+        self.path = path
+        self.header = header
+        self.gantry = gantry
+        self.collimator = collimator
+        self.energy = energy
+        self.meterset = meterset
+        self.jaw_x = jaw_x
+        self.jaw_y = jaw_y
+        self.leaves = leaves
+        self.gantry_direction = gantry_direction
+
+    @property
+    def n_cps(self):
+        return len(self.gantry)
+
+    @property
+    def meterset_weight(self):
+        # CumulativeMetersetWeight normalizado (0-1), como no DICOM
+        return self.meterset / 100.0
+
+    @property
+    def field_complexity(self):
+        return self.header.get('FieldComplexity', '')
+
+    def __repr__(self):
+        return "EfsData(%r, beam=%r, cps=%d)" % (
+            os.path.basename(self.path or ''), self.header.get('BeamName'), self.n_cps)
+
+
+def _iter_lines(path):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        if size < MMAP_THRESHOLD:
+            for line in f.read().splitlines():
+                yield line
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                yield line.rstrip(b'\r\n')
+
+
+def _carry_forward(values):
+    # Preenche NaN com o último valor válido ao longo dos CPs (eixo 0)
+    missing = np.isnan(values)
+    if not missing.any():
+        return values
+    idx = np.where(~missing, np.arange(values.shape[0]).reshape((-1,) + (1,) * (values.ndim - 1)), 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return np.take_along_axis(values, idx, axis=0)
+
+
+def read_efs(path, carry_forward=True):
+    """
+    Lê um arquivo .efs numa única passagem e retorna um EfsData.
+    Com carry_forward, valores ausentes num CP (ex.: último CP de campos estáticos,
+    que só traz o MeterSet) repetem o CP anterior, como permitido no DICOM;
+    sem ele, ficam como NaN.
+    """
+    header = {}
+    numeric = {code: ([], []) for code in NUMERIC_CODES}
+    directions = {}
+    leaf_cps = []
+    leaf_cols = []
+    leaf_vals = []
+    n_cps = 0
+
+    for line in _iter_lines(path):
+        key, sep, value = line.partition(b' ')
+        if not sep:
+            continue
+        tag, sep, cp = key.partition(b'-')
+        if not sep:
+            continue
+        cp = int(cp)
+        if cp > n_cps:
+            n_cps = cp
+
+        column = LEAF_COLUMNS.get(tag)
+        if column is not None:
+            leaf_cps.append(cp)
+            leaf_cols.append(column)
+            leaf_vals.append(float(value))
+            continue
+
+        code = EFS_TAGS.get(tag)
+        if code is None:
+            continue
+        if code in HEADER_CODES and cp == 0:
+            header[code] = value.decode('latin-1')
+        elif code in numeric:
+            if code == 'Energy':
+                value = value.split()[0]
+            numeric[code][0].append(cp)
+            numeric[code][1].append(float(value))
+        elif code == 'GantryDirection':
+            directions[cp] = value.decode('latin-1')
+
+    def column(code):
+        cps, vals = numeric[code]
+        out = np.full(n_cps, np.nan)
+        if cps:
+            out[np.asarray(cps) - 1] = vals
+        return out
+
+    x1, x2, y1, y2 = column('X1'), column('X2'), column('Y1'), column('Y2')
+    # Inverso de efs_control_point_struct: X1 = Y2/10, X2 = -Y1/10, Y1 = -X1/10, Y2 = X2/10
+    jaw_y = np.column_stack([-x2 * 10.0, x1 * 10.0])
+    jaw_x = np.column_stack([-y1 * 10.0, y2 * 10.0])
+
+    leaves = np.full((n_cps, len(ec.MLC_LINE_PREFIXES)), np.nan)
+    if leaf_cps:
+        cols = np.asarray(leaf_cols)
+        leaves[np.asarray(leaf_cps) - 1, cols] = np.asarray(leaf_vals) * LEAF_SCALE[cols]
+        n_leaves = cols.max() + 1
+        leaves = leaves[:, :n_leaves]
+
+    gantry = column('Gantry')
+    collimator = column('Collimator')
+    energy = column('Energy')
+    meterset = column('MeterSet')
+    if carry_forward and n_cps:
+        gantry, collimator, energy, jaw_x, jaw_y, leaves = [
+            _carry_forward(a) for a in (gantry, collimator, energy, jaw_x, jaw_y, leaves)]
+
+    gantry_direction = []
+    last_direction = ''
+    for cp in range(1, n_cps + 1):
+        if cp in directions or not carry_forward:
+            last_direction = directions.get(cp, '')
+        gantry_direction.append(last_direction)
+
+    return EfsData(path, header, gantry, collimator, energy, meterset,
+                   jaw_x, jaw_y, leaves, gantry_direction)
+
+
+def read_efs_files(paths, carry_forward=True, workers=None):
+    """
+    Lê vários arquivos .efs (ex.: um arquivo de QA inteiro) e retorna a lista de
+    EfsData na mesma ordem. workers > 1 distribui os arquivos num pool de processos.
+    """
+    paths = list(paths)
+    if workers is None or workers <= 1 or len(paths) <= 1:
+        return [read_efs(path, carry_forward) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(read_efs, paths, [carry_forward] * len(paths),
+                             chunksize=max(1, len(paths) // (workers * 4))))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    for path in argv:
+        efs = read_efs(path)
+        print(efs)
+        for code in sorted(efs.header):
+            print("  %-16s %s" % (code, efs.header[code]))
+        for cp in range(efs.n_cps):
+            open_leaves = efs.leaves[cp, efs.leaves.shape[1] // 2:] - efs.leaves[cp, :efs.leaves.shape[1] // 2]
+            print("  CP %3d  gantry %7.1f  coll %6.1f  X %s  Y %s  meterset %6.2f  abertura média %.2f mm" % (
+                cp + 1, efs.gantry[cp], efs.collimator[cp], efs.jaw_x[cp], efs.jaw_y[cp],
+                efs.meterset[cp], np.nanmean(open_leaves) if open_leaves.size else float('nan')))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
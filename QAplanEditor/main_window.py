@@ -7,24 +7,43 @@ import datetime
 import pydicom
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QFileDialog, QWidget,
-    QVBoxLayout, QHBoxLayout, QPushButton, QTreeWidget,
-    QTreeWidgetItem, QLabel, QLineEdit, QMessageBox,
+    QVBoxLayout, QHBoxLayout, QPushButton, QTreeView,
+    QLabel, QLineEdit, QMessageBox,
     QAction, QComboBox, QHeaderView, QSpacerItem, QSizePolicy,
-    QInputDialog
+    QInputDialog, QProgressDialog, QTabBar, QSlider
 )
-from PyQt5.QtCore import Qt, QUrl
-from PyQt5.QtGui import QFont, QDesktopServices
+from PyQt5.QtCore import Qt, QUrl, QModelIndex, QPersistentModelIndex, QTimer
+from PyQt5.QtGui import QFont, QDesktopServices, QColor, QKeySequence
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
-from matplotlib.patches import Rectangle
 
 import dicom_utils.reader as dr
+import dicom_utils.beam_model as bm
 import dicom_utils.export_excel as ex
+import dicom_utils.tree_model as tm
+import dicom_utils.tag_index as ti
+import dicom_utils.loader as ld
+import dicom_utils.plan_cache as pc
+import dicom_utils.workspace as ws
+import dicom_utils.journal as jr
+import dicom_utils.mlc_renderer as mr
+import dicom_utils.fluence as fl
+import dicom_utils.fluence_view as fv
+import dicom_utils.fluence_pool as fp
+import dicom_utils.leaf_motion as lm
+import dicom_utils.leaf_motion_view as lv
 import efs_converter.DCM2EFS as ec
 #from utils.PyCuboQA import gerar_volume_com_cubo_mm, exportar_dicom
 #from utils.ct_generator import update_rtplan_reference
 #from utils.PyCuboQA import gerar_volume_com_cubo_mm, exportar_dicom, update_rtplan_reference
 
+# Reprodução dos CPs: intervalo entre quadros e espera do scrub antes de desenhar (ms)
+PLAY_INTERVAL_MS = 40
+SCRUB_DELAY_MS = 15
+# Quadros vizinhos pré-desenhados no cache do visualizador (à frente e atrás do CP atual)
+PREFETCH_AHEAD = 16
+PREFETCH_BEHIND = 4
+
 class DicomEditor(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -42,6 +61,20 @@ class DicomEditor(QMainWindow):
         action_export_efs = QAction("Exportar EFS", self)
         action_export_efs.triggered.connect(self.export_efs)
         file_menu.addAction(action_export_efs)
+        action_memory = QAction("Memória dos Planos Abertos...", self)
+        action_memory.triggered.connect(self.on_set_memory_budget)
+        file_menu.addAction(action_memory)
+
+        # --- Menu "Editar" com desfazer/refazer (histórico por plano) ---
+        edit_menu = menu_bar.addMenu("Editar")
+        self.action_undo = QAction("Desfazer", self)
+        self.action_undo.setShortcut(QKeySequence.Undo)
+        self.action_undo.triggered.connect(self.on_undo)
+        edit_menu.addAction(self.action_undo)
+        self.action_redo = QAction("Refazer", self)
+        self.action_redo.setShortcut(QKeySequence.Redo)
+        self.action_redo.triggered.connect(self.on_redo)
+        edit_menu.addAction(self.action_redo)
 
         # --- Menu "CT" para gerar CT e atualizar RTPLAN ---
         ct_menu = menu_bar.addMenu("CT")
@@ -52,6 +85,15 @@ class DicomEditor(QMainWindow):
         action_update_rtplan.triggered.connect(self.menu_update_rtplan)
         ct_menu.addAction(action_update_rtplan)
 
+        # --- Menu "Análise" com a fluência acumulada e a velocidade das lâminas ---
+        analysis_menu = menu_bar.addMenu("Análise")
+        action_fluence = QAction("Fluência do Feixe...", self)
+        action_fluence.triggered.connect(self.on_show_fluence)
+        analysis_menu.addAction(action_fluence)
+        action_leaf_motion = QAction("Velocidade das Lâminas...", self)
+        action_leaf_motion.triggered.connect(self.on_show_leaf_motion)
+        analysis_menu.addAction(action_leaf_motion)
+
         # --- Menu "Ajuda" direcionando ao repositório GitHub ---
         help_menu = menu_bar.addMenu("Ajuda")
         action_github = QAction("Repositório no GitHub", self)
@@ -71,15 +113,46 @@ class DicomEditor(QMainWindow):
         self.btn_open.clicked.connect(self.open_dicom)
         left_panel.addWidget(self.btn_open)
 
-        self.tree = QTreeWidget()
-        self.tree.setHeaderLabels(["Tag (Group,Elem)", "VR", "Name", "Value"])
+        # Uma aba por plano aberto (Workspace); planos descartados da memória ficam em cinza
+        self.plan_tabs = QTabBar()
+        self.plan_tabs.setTabsClosable(True)
+        self.plan_tabs.setMovable(True)
+        self.plan_tabs.setExpanding(False)
+        self.plan_tabs.setElideMode(Qt.ElideMiddle)
+        self.plan_tabs.currentChanged.connect(self.on_plan_tab_changed)
+        self.plan_tabs.tabCloseRequested.connect(self.on_plan_tab_close)
+        left_panel.addWidget(self.plan_tabs)
+
+        # Busca de tags: índice montado ao abrir o arquivo, filtro aplicado via proxy
+        search_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Buscar tag, nome ou valor...")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(lambda _: self.search_timer.start())
+        search_layout.addWidget(self.search_edit)
+        self.lbl_search = QLabel("")
+        search_layout.addWidget(self.lbl_search)
+        left_panel.addLayout(search_layout)
+
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(200)
+        self.search_timer.timeout.connect(self.apply_search)
+
+        # Árvore virtual: as linhas são lidas direto do Dataset quando a view pede
+        self.tree_model = tm.DicomTreeModel()
+        self.tree_proxy = tm.DicomFilterProxyModel(self)
+        self.tree_proxy.setSourceModel(self.tree_model)
+        self.tree = QTreeView()
+        self.tree.setModel(self.tree_proxy)
+        self.tree.setUniformRowHeights(True)
         self.tree.setColumnWidth(0, 300)
         header = self.tree.header()
         header.setSectionResizeMode(0, QHeaderView.Fixed)
         header.setSectionResizeMode(1, QHeaderView.ResizeToContents)
         header.setSectionResizeMode(2, QHeaderView.Stretch)
         header.setSectionResizeMode(3, QHeaderView.Stretch)
-        self.tree.itemClicked.connect(self.on_item_selected)
+        self.tree.clicked.connect(self.on_item_selected)
         left_panel.addWidget(self.tree)
 
         # --- Painel direito (40%): edição + seleção de modelo + parâmetros + Excel + visualizador + OBS ---
@@ -124,6 +197,8 @@ class DicomEditor(QMainWindow):
         self.mlc_model_combo.addItem("MLCi2 (10 mm)", 10)
         self.mlc_model_combo.setCurrentIndex(0)
         self.mlc_model_combo.currentIndexChanged.connect(lambda _: self.update_mlc_view())
+        self.mlc_model_combo.currentIndexChanged.connect(lambda _: self.update_fluence_view())
+        self.mlc_model_combo.currentIndexChanged.connect(lambda _: self.on_mlc_model_changed())
         mlc_model_layout.addWidget(self.mlc_model_combo)
         right_panel.addLayout(mlc_model_layout)
 
@@ -186,6 +261,35 @@ class DicomEditor(QMainWindow):
 
         right_panel.addLayout(mlc_nav_layout)
 
+        # Reprodução e scrub pelos CPs do feixe
+        cp_play_layout = QHBoxLayout()
+        self.play_btn = QPushButton("▶ Reproduzir")
+        self.play_btn.setCheckable(True)
+        self.play_btn.toggled.connect(self.on_play_toggled)
+        self.play_btn.setEnabled(False)
+        cp_play_layout.addWidget(self.play_btn)
+
+        self.cp_slider = QSlider(Qt.Horizontal)
+        self.cp_slider.setRange(0, 0)
+        self.cp_slider.valueChanged.connect(self.on_cp_slider_moved)
+        self.cp_slider.setEnabled(False)
+        cp_play_layout.addWidget(self.cp_slider)
+        right_panel.addLayout(cp_play_layout)
+
+        self.play_timer = QTimer(self)
+        self.play_timer.setInterval(PLAY_INTERVAL_MS)
+        self.play_timer.timeout.connect(self.on_play_tick)
+        # Scrub: vários valores do slider em sequência desenham só o último
+        self.cp_scrub_timer = QTimer(self)
+        self.cp_scrub_timer.setSingleShot(True)
+        self.cp_scrub_timer.setInterval(SCRUB_DELAY_MS)
+        self.cp_scrub_timer.timeout.connect(self.update_mlc_view)
+        # Pré-desenho dos CPs vizinhos, um quadro por volta do laço de eventos
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(0)
+        self.prefetch_timer.timeout.connect(self.prefetch_cp_frames)
+
         # Botões para exportar/importar Excel de Control Points
         btns_excel_layout = QHBoxLayout()
         self.btn_export_excel = QPushButton("Exportar CPs para Excel")
@@ -200,6 +304,7 @@ class DicomEditor(QMainWindow):
         self.fig = Figure(figsize=(5, 5))
         self.canvas = FigureCanvas(self.fig)
         self.ax = self.fig.add_subplot(111)
+        self.mlc_renderer = mr.MLCRenderer(self.ax)
         right_panel.addWidget(self.canvas)
 
         self.lbl_obs = QLabel("OBS: ")
@@ -210,11 +315,30 @@ class DicomEditor(QMainWindow):
         # ===== Estados internos =====
         self.dataset = None
         self.dicom_path = None
-        self.current_item = None
+        self.tag_index = ti.TagIndex()
+        self.load_thread = None
+        self.load_dialog = None
+        # Janela da fluência (criada ao ser aberta pela primeira vez)
+        self.fluence_dialog = None
+        # Fluência de todos os feixes, calculada num pool de processos
+        self.fluence_pool = fp.FluencePool(parent=self)
+        self.fluence_pool.finished.connect(self.on_fluence_ready)
+        self.fluence_pool.failed.connect(self.on_fluence_failed)
+        # beam_idx -> (chave, meterset, origem dos limites, título) do plano em exibição
+        self.fluence_jobs = {}
+        self._fluence_shown = None
+        # Janela da velocidade das lâminas (criada ao ser aberta pela primeira vez)
+        self.leaf_motion_dialog = None
+        self.plan_cache = pc.PlanCache()
+        self.workspace = ws.Workspace()
+        self.journal = jr.EditJournal()
+        self.update_undo_actions()
+        self.current_index = QPersistentModelIndex()
         self.current_element = None
         self.current_beam_idx = 0
         self.current_cp_idx = 0
         self._excel_path = None
+        self.beam_models = {}
 
     # -------------------------------------------------------------------------
     #    CALLBACK DO MENU DE AJUDA
@@ -281,52 +405,61 @@ class DicomEditor(QMainWindow):
         # 4) Atualiza o RTPLAN carregado (self.dataset) em memória
         try:
             rt = self.dataset  # Alias para abreviar
-
-            # a) PatientName / PatientID
-            if new_patient_name is not None:
-                rt.PatientName = new_patient_name
-            if new_patient_id is not None:
-                rt.PatientID = new_patient_id
-
-            # b) StudyInstanceUID / SeriesInstanceUID
-            rt.StudyInstanceUID  = new_study_uid
-            rt.SeriesInstanceUID = new_series_uid
-
-            # c) FrameOfReferenceUID
-            rt.FrameOfReferenceUID = new_for_uid
-
-            # d) SOPInstanceUID (gerar novo, opcional)
-            rt.SOPInstanceUID = pydicom.uid.generate_uid()
-
-            # e) REFERENCED STUDY & SERIES (muda para nova série de CT)
-            if hasattr(rt, "ReferencedStudySequence"):
-                for study_item in rt.ReferencedStudySequence:
-                    study_item.ReferencedStudyInstanceUID = new_study_uid
-                    if hasattr(study_item, "ReferencedSeriesSequence"):
-                        for series_item in study_item.ReferencedSeriesSequence:
-                            series_item.SeriesInstanceUID = new_series_uid
-
-            # f) REFERENCED FRAME OF REFERENCE SEQUENCE
-            #    (se existir, atualiza para o mesmo FoR do CT)
-            if hasattr(rt, "ReferencedFrameOfReferenceSequence"):
-                for ref_for_item in rt.ReferencedFrameOfReferenceSequence:
-                    ref_for_item.FrameOfReferenceUID = new_for_uid
-                    # dentro dele pode haver RTReferencedStudySequence → etc.
-                    if hasattr(ref_for_item, "RTReferencedStudySequence"):
-                        for rts_item in ref_for_item.RTReferencedStudySequence:
-                            rts_item.RTReferencedStudyInstanceUID = new_study_uid
-                            if hasattr(rts_item, "RTReferencedSeriesSequence"):
-                                for rts_series_item in rts_item.RTReferencedSeriesSequence:
-                                    rts_series_item.SeriesInstanceUID = new_series_uid
+            # (dataset, tag) alterados, para atualizar só essas linhas da árvore
+            changed = []
+            # Cada atribuição entra no histórico (um único passo de desfazer)
+            def set_tag(ds, keyword, value):
+                self.journal.touch(ds, keyword)
+                setattr(ds, keyword, value)
+                changed.append((ds, keyword))
+
+            with self.journal.record("Atualizar RTPLAN com CT"):
+                # a) PatientName / PatientID
+                if new_patient_name is not None:
+                    set_tag(rt, "PatientName", new_patient_name)
+                if new_patient_id is not None:
+                    set_tag(rt, "PatientID", new_patient_id)
+
+                # b) StudyInstanceUID / SeriesInstanceUID
+                set_tag(rt, "StudyInstanceUID", new_study_uid)
+                set_tag(rt, "SeriesInstanceUID", new_series_uid)
+
+                # c) FrameOfReferenceUID
+                set_tag(rt, "FrameOfReferenceUID", new_for_uid)
+
+                # d) SOPInstanceUID (gerar novo, opcional)
+                set_tag(rt, "SOPInstanceUID", pydicom.uid.generate_uid())
+
+                # e) REFERENCED STUDY & SERIES (muda para nova série de CT)
+                if hasattr(rt, "ReferencedStudySequence"):
+                    for study_item in rt.ReferencedStudySequence:
+                        set_tag(study_item, "ReferencedStudyInstanceUID", new_study_uid)
+                        if hasattr(study_item, "ReferencedSeriesSequence"):
+                            for series_item in study_item.ReferencedSeriesSequence:
+                                set_tag(series_item, "SeriesInstanceUID", new_series_uid)
+
+                # f) REFERENCED FRAME OF REFERENCE SEQUENCE
+                #    (se existir, atualiza para o mesmo FoR do CT)
+                if hasattr(rt, "ReferencedFrameOfReferenceSequence"):
+                    for ref_for_item in rt.ReferencedFrameOfReferenceSequence:
+                        set_tag(ref_for_item, "FrameOfReferenceUID", new_for_uid)
+                        # dentro dele pode haver RTReferencedStudySequence → etc.
+                        if hasattr(ref_for_item, "RTReferencedStudySequence"):
+                            for rts_item in ref_for_item.RTReferencedStudySequence:
+                                set_tag(rts_item, "RTReferencedStudyInstanceUID", new_study_uid)
+                                if hasattr(rts_item, "RTReferencedSeriesSequence"):
+                                    for rts_series_item in rts_item.RTReferencedSeriesSequence:
+                                        set_tag(rts_series_item, "SeriesInstanceUID", new_series_uid)
 
         except Exception as e:
+            # O que já foi alterado continua no histórico e na árvore
+            self.notify_dataset_edits(changed)
             QMessageBox.critical(self, "Erro",
                 f"Falha ao atualizar RTPLAN em memória:\n{e}")
             return
 
-        # 5) Recarrega a árvore e a visualização para refletir as mudanças
-        self.tree.clear()
-        dr.populate_tree(self.dataset, self.tree.invisibleRootItem())
+        # 5) Atualiza só as linhas alteradas da árvore e recarrega a visualização
+        self.notify_dataset_edits(changed)
         self.init_beam_cp_view()
 
         QMessageBox.information(self, "RTPLAN Atualizado",
@@ -343,29 +476,300 @@ class DicomEditor(QMainWindow):
         if not path:
             return
 
-        try:
-            self.dataset = dr.open_dicom_file(path)
-        except Exception as e:
-            QMessageBox.critical(self, "Erro", f"Falha ao ler DICOM:\n{e}")
+        entry = self.workspace.get(path)
+        if entry is not None and entry.loaded:
+            # Já aberto: só seleciona a aba
+            self.plan_tabs.setCurrentIndex(self._plan_tab_index(entry.path))
             return
+        self.start_plan_load(path)
+
+    def start_plan_load(self, path):
+        if self.load_thread is not None:
+            # Um carregamento por vez: o anterior é abandonado
+            self.load_thread.requestInterruption()
+            self.load_thread.wait()
+            self._end_load()
+
+        # Leitura, feixes e índice de busca em segundo plano; a janela só troca de
+        # plano em on_plan_loaded, com tudo pronto
+        self.load_dialog = QProgressDialog("Abrindo RTPLAN...", "Cancelar", 0, 100, self)
+        self.load_dialog.setWindowTitle("Abrir RTPLAN")
+        self.load_dialog.setWindowModality(Qt.WindowModal)
+        self.load_dialog.setMinimumDuration(300)
+        self.load_dialog.setAutoClose(False)
+        self.load_dialog.setAutoReset(False)
+
+        self.load_thread = ld.PlanLoadThread(path, self.plan_cache, self)
+        self.load_dialog.canceled.connect(self.load_thread.requestInterruption)
+        self.load_thread.progress.connect(self.on_load_progress)
+        self.load_thread.loaded.connect(self.on_plan_loaded)
+        self.load_thread.failed.connect(self.on_load_failed)
+        self.load_thread.finished.connect(self.on_load_finished)
+        self.load_thread.start()
+
+    def on_load_progress(self, percent, text):
+        if self.sender() is self.load_thread and self.load_dialog is not None:
+            self.load_dialog.setLabelText(text)
+            self.load_dialog.setValue(percent)
+
+    def on_plan_loaded(self, plan):
+        # Resultados de um carregamento abandonado ou cancelado são ignorados
+        if self.sender() is not self.load_thread or self.load_thread.isInterruptionRequested():
+            return
+        # O plano anterior continua aberto na sua aba, com as edições e a navegação
+        self.store_active_plan()
+        entry = self.workspace.set_plan(plan)
+        index = self._plan_tab_index(entry.path)
+        if index < 0:
+            index = self.plan_tabs.addTab(entry.name)
+            self.plan_tabs.setTabData(index, entry.path)
+            self.plan_tabs.setTabToolTip(index, entry.path)
+        self.plan_tabs.blockSignals(True)
+        self.plan_tabs.setCurrentIndex(index)
+        self.plan_tabs.blockSignals(False)
+        self.show_plan(entry)
+        self.evict_plans()
+
+    def on_load_failed(self, message):
+        if self.sender() is not self.load_thread:
+            return
+        QMessageBox.critical(self, "Erro", f"Falha ao ler DICOM:\n{message}")
+
+    def on_load_finished(self):
+        if self.sender() is self.load_thread:
+            self._end_load()
+
+    def _end_load(self):
+        if self.load_dialog is not None:
+            self.load_dialog.close()
+            self.load_dialog.deleteLater()
+            self.load_dialog = None
+        if self.load_thread is not None:
+            self.load_thread.deleteLater()
+            self.load_thread = None
+        # Carregamento cancelado ou com erro: a aba volta para o plano em exibição
+        active = self._plan_tab_index(self.dicom_path) if self.dicom_path else -1
+        if active >= 0 and active != self.plan_tabs.currentIndex():
+            self.plan_tabs.blockSignals(True)
+            self.plan_tabs.setCurrentIndex(active)
+            self.plan_tabs.blockSignals(False)
 
-        self.dicom_path = path
-        self.tree.clear()
-        dr.populate_tree(self.dataset, self.tree.invisibleRootItem())
-        self.setWindowTitle(f"Editor DICOM — {path}")
-        self.init_beam_cp_view()
+    # -------------------------------------------------------------------------
+    #    PLANOS ABERTOS (WORKSPACE)
+    # -------------------------------------------------------------------------
+    def _plan_tab_index(self, path):
+        key = ws.plan_key(path)
+        for index in range(self.plan_tabs.count()):
+            if ws.plan_key(self.plan_tabs.tabData(index)) == key:
+                return index
+        return -1
+
+    def store_active_plan(self):
+        # Guarda na entrada do plano em exibição as edições pendentes e a navegação
+        entry = self.workspace.get(self.dicom_path)
+        if entry is None or not entry.loaded:
+            return
+        self.write_back_beam_models()
+        entry.beam_models = dict(self.beam_models)
+        entry.beam_idx = self.current_beam_idx
+        entry.cp_idx = self.current_cp_idx
+
+    def show_plan(self, entry):
+        self.workspace.touch(entry.path)
+        plan = entry.plan
+        self.beam_models = {}
+        self.dataset = plan.dataset
+        self.dicom_path = entry.path
+        self.current_index = QPersistentModelIndex()
+        self.current_element = None
+        self.tree_model.set_dataset(self.dataset)
+        self.tag_index = plan.tag_index
+        self.tree_proxy.set_tag_index(self.tag_index)
+        self.apply_search()
+        self.journal = entry.journal
+        self.update_undo_actions()
+        self.setWindowTitle(f"Editor DICOM — {entry.path}")
+        self.init_beam_cp_view(list(entry.beam_models.values()), entry.beam_idx, entry.cp_idx)
+
+    def clear_plan_view(self):
+        # Nenhum plano aberto (última aba fechada)
+        self.beam_models = {}
+        self.dataset = None
+        self.dicom_path = None
+        self.current_index = QPersistentModelIndex()
+        self.current_element = None
+        self.tree_model.set_dataset(None)
+        self.tag_index = ti.TagIndex()
+        self.tree_proxy.set_tag_index(self.tag_index)
+        self.apply_search()
+        self.journal = jr.EditJournal()
+        self.update_undo_actions()
+        self.update_fluence_view()
+        self.update_leaf_motion_view()
+        self.setWindowTitle("Editor de Tags DICOM (RTPLAN) com Visualizador de MLC, Jaws e Export EFS")
+        self.beam_combo.blockSignals(True)
+        self.beam_combo.clear()
+        self.beam_combo.blockSignals(False)
+        self.beam_combo.setEnabled(False)
+        self.prev_cp_btn.setEnabled(False)
+        self.next_cp_btn.setEnabled(False)
+        self.play_btn.setChecked(False)
+        self.play_btn.setEnabled(False)
+        self.cp_slider.setEnabled(False)
+        self.cp_label.setText("CP: 0/0")
+        self.mlc_renderer.show_message()
+
+    def evict_plans(self):
+        # Aplica o limite de memória e marca as abas dos planos descartados
+        self.workspace.evict(keep=self.dicom_path)
+        for index in range(self.plan_tabs.count()):
+            entry = self.workspace.get(self.plan_tabs.tabData(index))
+            self.plan_tabs.setTabTextColor(index, QColor() if entry.loaded else QColor(Qt.gray))
+            self.plan_tabs.setTabText(index, entry.name + (" *" if entry.modified else ""))
+
+    def on_plan_tab_changed(self, index):
+        if index < 0:
+            return
+        entry = self.workspace.get(self.plan_tabs.tabData(index))
+        if entry is None or ws.plan_key(entry.path) == ws.plan_key(self.dicom_path or ""):
+            return
+        if not entry.loaded:
+            # Descartado da memória: lido de novo (pelo cache) e exibido em on_plan_loaded
+            self.start_plan_load(entry.path)
+            return
+        self.store_active_plan()
+        self.show_plan(entry)
+        self.evict_plans()
+
+    def on_plan_tab_close(self, index):
+        path = self.plan_tabs.tabData(index)
+        entry = self.workspace.get(path)
+        if entry is not None and entry.modified:
+            answer = QMessageBox.question(
+                self, "Fechar plano",
+                f"{entry.name} tem alterações não salvas. Fechar mesmo assim?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if answer != QMessageBox.Yes:
+                return
+        if self.load_thread is not None and ws.plan_key(self.load_thread.path) == ws.plan_key(path):
+            self.load_thread.requestInterruption()
+            self.load_thread.wait()
+            self._end_load()
+        closing_active = self.dicom_path is not None and ws.plan_key(path) == ws.plan_key(self.dicom_path)
+        if closing_active:
+            # Sem gravar nada no plano que está sendo fechado
+            self.clear_plan_view()
+        self.workspace.remove(path)
+        self.plan_tabs.blockSignals(True)
+        self.plan_tabs.removeTab(index)
+        self.plan_tabs.blockSignals(False)
+        if closing_active and self.plan_tabs.count():
+            self.on_plan_tab_changed(self.plan_tabs.currentIndex())
+
+    def on_set_memory_budget(self):
+        in_use = self.workspace.memory_in_use() // (1024 * 1024)
+        budget, ok = QInputDialog.getInt(
+            self, "Memória dos Planos Abertos",
+            f"Limite de memória para os planos abertos (MB).\nEm uso (estimado): {in_use} MB",
+            self.workspace.budget_bytes // (1024 * 1024), 64, 64 * 1024
+        )
+        if not ok:
+            return
+        self.workspace.budget_bytes = budget * 1024 * 1024
+        self.evict_plans()
+
+    def closeEvent(self, event):
+        if self.load_thread is not None:
+            self.load_thread.requestInterruption()
+            self.load_thread.wait()
+        self.fluence_pool.shutdown()
+        super().closeEvent(event)
+
+    # -------------------------------------------------------------------------
+    #    BUSCA E AVISOS DE ALTERAÇÃO DA ÁRVORE
+    # -------------------------------------------------------------------------
+    def apply_search(self):
+        text = self.search_edit.text()
+        count = self.tree_proxy.set_query(text)
+        if not self.tree_proxy.is_filtering():
+            self.lbl_search.setText("")
+            return
+        self.lbl_search.setText(f"{count} encontrado(s)")
+        # Abre só os ramos que levam aos resultados, quando são poucos
+        if 0 < count <= 50:
+            for path in self.tree_proxy.matches():
+                index = self.tree_proxy.mapFromSource(self.tree_model.index_for_path(path[:-1]))
+                while index.isValid():
+                    self.tree.expand(index)
+                    index = index.parent()
+
+    def notify_dataset_edits(self, changed):
+        # changed: [(dataset, tag), ...] alterados fora da árvore; atualiza só essas linhas e o índice
+        if not changed:
+            return
+        entry = self.workspace.get(self.dicom_path)
+        if entry is not None and not entry.modified:
+            # Plano com alterações não salvas: não é descartado da memória
+            entry.modified = True
+            self.evict_plans()
+        self.tree_model.notify_elements_changed(changed)
+        self.tag_index.refresh_elements(changed)
+        self.mlc_renderer.clear_frames()
+        self.update_fluence_view()
+        self.update_leaf_motion_view()
+        if self.tree_proxy.is_filtering():
+            self.apply_search()
+        self.update_undo_actions()
+
+    # -------------------------------------------------------------------------
+    #    DESFAZER / REFAZER
+    # -------------------------------------------------------------------------
+    def update_undo_actions(self):
+        undo_label = self.journal.undo_label()
+        redo_label = self.journal.redo_label()
+        self.action_undo.setEnabled(undo_label is not None)
+        self.action_undo.setText(f"Desfazer: {undo_label}" if undo_label else "Desfazer")
+        self.action_redo.setEnabled(redo_label is not None)
+        self.action_redo.setText(f"Refazer: {redo_label}" if redo_label else "Refazer")
+
+    def on_undo(self):
+        self._apply_journal(self.journal.undo)
+
+    def on_redo(self):
+        self._apply_journal(self.journal.redo)
+
+    def _apply_journal(self, action):
+        if self.dataset is None:
+            return
+        # Edições pendentes nos arrays viram um passo antes (e são as primeiras desfeitas)
+        self.write_back_beam_models()
+        changed = action()
+        if not changed:
+            self.update_undo_actions()
+            return
+        # Os BeamModel são refeitos a partir do Dataset restaurado
+        self.beam_models = {}
+        self.notify_dataset_edits(changed)
+        self.init_beam_cp_view(None, self.current_beam_idx, self.current_cp_idx)
+        # Atualiza os campos do elemento selecionado
+        if self.current_index.isValid():
+            index = self.tree_proxy.mapFromSource(QModelIndex(self.current_index))
+            if index.isValid():
+                self.on_item_selected(index)
 
     # -------------------------------------------------------------------------
     #    SELEÇÃO E EDIÇÃO DE DATA_ELEMENT
     # -------------------------------------------------------------------------
-    def on_item_selected(self, item: QTreeWidgetItem, column: int):
-        self.current_item = item
-        elem = getattr(item, "data_element", None)
+    def on_item_selected(self, index: QModelIndex):
+        index = self.tree_proxy.mapToSource(index)
+        self.current_index = QPersistentModelIndex(index)
+        elem = self.tree_model.element(index)
         if elem is None or elem.VR == "SQ":
             self.current_element = None
             self.edit_tag.setText("")
             self.edit_vr.setText("")
-            self.edit_name.setText(item.text(2))
+            self.edit_name.setText(index.sibling(index.row(), 2).data() or "")
             self.edit_value.setText("")
             self.edit_value.setReadOnly(True)
             self.btn_save_value.setEnabled(False)
@@ -389,14 +793,20 @@ class DicomEditor(QMainWindow):
         if self.current_element is None:
             return
         new_str = self.edit_value.text().strip()
-
-        try:
-            dr.save_data_element(self.current_element, new_str)
-        except Exception as e:
-            QMessageBox.warning(self, "Erro na conversão", f"Não foi possível converter:\n{e}")
-            return
-
-        self.current_item.setText(3, new_str)
+        index = QModelIndex(self.current_index)
+        # Edições pendentes nos arrays vão antes, para não sobrescreverem esta
+        self.write_back_beam_models()
+
+        with self.journal.record(f"Editar {self.current_element.name}"):
+            self.journal.touch(*self.tree_model.element_key(index))
+            try:
+                changed = self.tree_model.set_value(index, new_str)
+            except Exception as e:
+                QMessageBox.warning(self, "Erro na conversão", f"Não foi possível converter:\n{e}")
+                return
+        self.notify_dataset_edits([changed])
+
+        self.invalidate_beam_models()
         QMessageBox.information(
             self, "OK",
             "Valor atualizado em memória.\nUse “Salvar Como...” para gravar em disco."
@@ -417,7 +827,10 @@ class DicomEditor(QMainWindow):
             return
 
         try:
-            dr.save_dicom_file(self.dataset, path_out)
+            self.write_back_beam_models()
+            entry = self.workspace.get(self.dicom_path)
+            source = entry.plan.source if entry is not None and entry.loaded else None
+            dr.save_dicom_file(self.dataset, path_out, source, self.journal.modified)
             QMessageBox.information(self, "Arquivo salvo", f"Arquivo gravado em:\n{path_out}")
         except Exception as e:
             QMessageBox.critical(self, "Erro ao salvar", f"Não foi possível salvar:\n{e}")
@@ -425,8 +838,18 @@ class DicomEditor(QMainWindow):
     # -------------------------------------------------------------------------
     #    INICIALIZAÇÃO E NAVEGAÇÃO DE BEAMS/CONTROL POINTS
     # -------------------------------------------------------------------------
-    def init_beam_cp_view(self):
+    def init_beam_cp_view(self, beam_models=None, beam_idx=0, cp_idx=0):
+        # beam_models: BeamModel já montados (ex.: pelo carregamento em segundo plano);
+        # beam_idx/cp_idx: navegação a restaurar (troca de aba)
+        self.invalidate_beam_models()
+        if beam_models:
+            self.beam_models = {model.index: model for model in beam_models}
+        # Quadros em cache são de (feixe, CP) do plano anterior
+        self.play_btn.setChecked(False)
+        self.mlc_renderer.clear_frames()
+        self.beam_combo.blockSignals(True)
         self.beam_combo.clear()
+        self.beam_combo.blockSignals(False)
         self.current_beam_idx = 0
         self.current_cp_idx = 0
 
@@ -441,35 +864,71 @@ class DicomEditor(QMainWindow):
             self.beam_combo.setEnabled(False)
             self.prev_cp_btn.setEnabled(False)
             self.next_cp_btn.setEnabled(False)
+            self.play_btn.setEnabled(False)
+            self.cp_slider.setEnabled(False)
             self.cp_label.setText("CP: 0/0")
-            self.ax.clear()
-            self.ax.set_title("Sem dados de feixes/MLC")
-            self.canvas.draw()
+            self.mlc_renderer.show_message("Sem dados de feixes/MLC")
             return
 
         for idx, beam in enumerate(beams):
             beam_num = getattr(beam, "BeamNumber", idx + 1)
             beam_name = getattr(beam, "BeamName", "")
             label = f"{beam_num}  {beam_name}"
+            self.beam_combo.blockSignals(True)
             self.beam_combo.addItem(label, idx)
-
+            self.beam_combo.blockSignals(False)
+
+        self.current_beam_idx = beam_idx if beam_idx < len(beams) else 0
+        n_cps = self.get_beam_model(self.current_beam_idx).n_cps
+        self.current_cp_idx = cp_idx if cp_idx < n_cps else 0
+        self.beam_combo.blockSignals(True)
+        self.beam_combo.setCurrentIndex(self.current_beam_idx)
+        self.beam_combo.blockSignals(False)
         self.beam_combo.setEnabled(True)
-        self.beam_combo.setCurrentIndex(0)
         self.prev_cp_btn.setEnabled(True)
         self.next_cp_btn.setEnabled(True)
+        self.play_btn.setEnabled(True)
+        self.cp_slider.setEnabled(True)
 
         self.update_mlc_view()
+        self.update_fluence_view(self.current_beam_idx)
+        self.update_leaf_motion_view()
+
+    def get_beam_model(self, beam_idx):
+        # Cada feixe é convertido em arrays uma única vez; a navegação entre CPs só indexa
+        model = self.beam_models.get(beam_idx)
+        if model is None:
+            beams = dr.get_beams(self.dataset)
+            model = bm.BeamModel(beams[beam_idx], beam_idx)
+            self.beam_models[beam_idx] = model
+        return model
+
+    def write_back_beam_models(self):
+        # Grava no Dataset, numa única passada, só os CPs/campos editados nos arrays,
+        # e atualiza as linhas correspondentes da árvore
+        with self.journal.record("Editar CPs"):
+            changed = bm.write_back_models(self.beam_models.values(), self.journal)
+        self.notify_dataset_edits(changed)
+        return changed
+
+    def invalidate_beam_models(self):
+        # Chamado sempre que o Dataset é alterado fora do modelo (árvore, CT);
+        # edições ainda pendentes nos arrays são gravadas antes de descartá-los
+        self.write_back_beam_models()
+        self.beam_models = {}
 
     def on_beam_changed(self, index):
         self.current_beam_idx = index
         self.current_cp_idx = 0
         self.update_mlc_view()
+        if self.fluence_dialog is not None and self.fluence_dialog.isVisible():
+            self.fluence_dialog.select_beam(index)
+            self.show_selected_fluence()
+        self.update_leaf_motion_view()
 
     def on_prev_cp(self):
         if self.dataset is None:
             return
-        beams = dr.get_beams(self.dataset)
-        cps = dr.get_control_points(beams[self.current_beam_idx])
         if self.current_cp_idx > 0:
             self.current_cp_idx -= 1
             self.update_mlc_view()
@@ -477,9 +936,8 @@ class DicomEditor(QMainWindow):
     def on_next_cp(self):
         if self.dataset is None:
             return
-        beams = dr.get_beams(self.dataset)
-        cps = dr.get_control_points(beams[self.current_beam_idx])
-        if self.current_cp_idx < len(cps) - 1:
+        model = self.get_beam_model(self.current_beam_idx)
+        if self.current_cp_idx < model.n_cps - 1:
             self.current_cp_idx += 1
             self.update_mlc_view()
 
@@ -487,31 +945,32 @@ class DicomEditor(QMainWindow):
     #    ATUALIZAÇÃO DO VISUALIZADOR DE MLC E JAWS
     # -------------------------------------------------------------------------
     def update_mlc_view(self):
-        self.ax.clear()
-
+        self.cp_scrub_timer.stop()
         beams = dr.get_beams(self.dataset)
         if not beams:
-            self.ax.set_title("Sem RTBeamSequence/BeamSequence")
-            self.canvas.draw()
+            self.mlc_renderer.show_message("Sem RTBeamSequence/BeamSequence")
             return
 
         beam = beams[self.current_beam_idx]
-        cps = dr.get_control_points(beam)
-        total_cps = len(cps)
-        self.cp_label.setText(f"CP: {self.current_cp_idx + 1}/{total_cps}")
-
-        cp = cps[self.current_cp_idx]
-        bl_seq = dr.get_bl_seq(cp)
-        if not bl_seq:
-            self.ax.set_title("Sem BeamLimitingDevicePositionSequence")
-            self.canvas.draw()
+        model = self.get_beam_model(self.current_beam_idx)
+        total_cps = model.n_cps
+        cp_idx = self.current_cp_idx
+        self.cp_label.setText(f"CP: {cp_idx + 1}/{total_cps}")
+        self.cp_slider.blockSignals(True)
+        self.cp_slider.setRange(0, max(total_cps - 1, 0))
+        self.cp_slider.setValue(cp_idx)
+        self.cp_slider.blockSignals(False)
+
+        if not model.defined['bl_seq'][:cp_idx + 1].any():
+            self.mlc_renderer.show_message("Sem BeamLimitingDevicePositionSequence")
             self.lbl_obs.setText("OBS: Sem BeamLimitingDevicePositionSequence")
             return
 
-        gantry = getattr(cp, "GantryAngle", "N/A")
-        collim = getattr(cp, "BeamLimitingDeviceAngle", "N/A")
-        table = getattr(cp, "PatientSupportAngle", "N/A")
-        fraction = getattr(cp, "CumulativeMetersetWeight", "N/A")
+        # Valores omitidos no CP são herdados do CP anterior (BeamModel)
+        gantry = self._format_cp_value(model.gantry[cp_idx])
+        collim = self._format_cp_value(model.collimator[cp_idx])
+        table = self._format_cp_value(model.couch[cp_idx])
+        fraction = self._format_cp_value(model.meterset_weight[cp_idx])
         mu = getattr(beam, "BeamMeterset", "N/A")
 
         self.lbl_gantry.setText(f"Gantry: {gantry}°")
@@ -520,24 +979,13 @@ class DicomEditor(QMainWindow):
         self.lbl_mu.setText(f"MU: {mu}")
         self.lbl_fraction.setText(f"Fraction: {fraction}")
 
-        # Encontra item MLC
-        mlc_item = dr.find_mlc_item(bl_seq)
-        if mlc_item is None:
-            self.ax.set_title("Nenhum MLC encontrado neste CP")
-            self.canvas.draw()
+        frame = self.cp_frame(model, cp_idx)
+        if frame is None:
+            self.mlc_renderer.show_message("Nenhum MLC encontrado neste CP")
             self.lbl_obs.setText("OBS: Nenhum MLC encontrado neste CP")
             return
 
-        leaf_positions = dr.get_mlc_positions(mlc_item)
-        N2 = len(leaf_positions)
-        N = N2 // 2
-        left_positions = leaf_positions[:N]
-        right_positions = leaf_positions[N:]
-
-        # Jaws X e Y
-        x_jaws = dr.find_jaw_positions(bl_seq, axis='X')
-        y_jaws = dr.find_jaw_positions(bl_seq, axis='Y')
-
+        _, _, x_jaws, y_jaws, _, _ = frame
         obs_msgs = []
         if not x_jaws:
             obs_msgs.append("Sem colimadores X")
@@ -545,69 +993,253 @@ class DicomEditor(QMainWindow):
             obs_msgs.append("Sem colimadores Y")
         self.lbl_obs.setText("OBS: " + "; ".join(obs_msgs) if obs_msgs else "OBS: Colimadores detectados")
 
-        xmin, xmax = -200.0, 200.0
-
+        self.mlc_renderer.draw_cp(*frame, key=(self.current_beam_idx, cp_idx))
+        self.prefetch_timer.start()
+
+    def cp_frame(self, model, cp_idx):
+        """
+        Argumentos de MLCRenderer.draw_cp para o CP do feixe: (banco esquerdo,
+        banco direito, jaws X, jaws Y, espessura das lâminas, título), ou None se
+        não houver MLC a desenhar.
+        """
+        if not model.defined['bl_seq'][:cp_idx + 1].any() or not model.mlc_type:
+            return None
+        leaf_positions = model.device_positions(model.mlc_type, cp_idx)
+        if leaf_positions is None:
+            return None
+        n = len(leaf_positions) // 2
+        x_jaws = model.device_positions(model.jaw_x_type, cp_idx) if model.jaw_x_type else None
+        y_jaws = model.device_positions(model.jaw_y_type, cp_idx) if model.jaw_y_type else None
         thickness = float(self.mlc_model_combo.currentData())
-        total_height = N * thickness
-        half_height = total_height / 2.0
-
-        for i in range(N):
-            left_val = left_positions[i]
-            right_val = right_positions[i]
-            y_bottom = (i * thickness) - half_height
-            if left_val > xmin:
-                width_left = left_val - xmin
-                rect_left = Rectangle((xmin, y_bottom), width_left, thickness, facecolor="lightgray", edgecolor="black")
-                self.ax.add_patch(rect_left)
-            if xmax > right_val:
-                width_right = xmax - right_val
-                rect_right = Rectangle((right_val, y_bottom), width_right, thickness, facecolor="lightgray", edgecolor="black")
-                self.ax.add_patch(rect_right)
-
-        if x_jaws:
-            x_left_jaw, x_right_jaw = x_jaws
-            x_left_jaw = max(min(x_left_jaw, 200.0), -200.0)
-            x_right_jaw = max(min(x_right_jaw, 200.0), -200.0)
-            self.ax.axvline(x=x_left_jaw, color="red", linestyle="--", linewidth=1.5, label="X Jaw Esquerda")
-            self.ax.axvline(x=x_right_jaw, color="red", linestyle="--", linewidth=1.5, label="X Jaw Direita")
-
-        if y_jaws:
-            y_min_jaw, y_max_jaw = y_jaws
-            self.ax.axhline(y=y_min_jaw, color="blue", linestyle="--", linewidth=1.5, label=f"Y Jaw {y_min_jaw}mm")
-            self.ax.axhline(y=y_max_jaw, color="blue", linestyle="--", linewidth=1.5, label=f"Y Jaw {y_max_jaw}mm")
-            new_y_top = max(half_height, y_max_jaw)
-            new_y_bottom = min(-half_height, y_min_jaw)
-            self.ax.set_ylim(new_y_top, new_y_bottom)
+        return (leaf_positions[:n], leaf_positions[n:], x_jaws, y_jaws, thickness,
+                f"Beam {model.number} · CP {cp_idx + 1}/{model.n_cps}")
+
+    def prefetch_cp_frames(self):
+        # Pré-desenha no cache o próximo CP vizinho que falta (à frente primeiro) e se
+        # reagenda; o laço de eventos atende a interface entre um quadro e outro
+        model = self.beam_models.get(self.current_beam_idx) if self.dataset is not None else None
+        if model is None:
+            return
+        cp_idx = self.current_cp_idx
+        ahead = range(cp_idx + 1, min(cp_idx + 1 + PREFETCH_AHEAD, model.n_cps))
+        behind = range(cp_idx - 1, max(cp_idx - 1 - PREFETCH_BEHIND, -1), -1)
+        for idx in list(ahead) + list(behind):
+            key = (self.current_beam_idx, idx)
+            if self.mlc_renderer.has_frame(key):
+                continue
+            frame = self.cp_frame(model, idx)
+            if frame is not None and self.mlc_renderer.prefetch(key, *frame):
+                self.prefetch_timer.start()
+                return
+
+    def on_cp_slider_moved(self, value):
+        if self.dataset is None:
+            return
+        self.current_cp_idx = value
+        self.cp_label.setText(f"CP: {value + 1}/{self.cp_slider.maximum() + 1}")
+        if self.mlc_renderer.has_frame((self.current_beam_idx, value)):
+            self.update_mlc_view()
         else:
-            self.ax.set_ylim(half_height, -half_height)
+            self.cp_scrub_timer.start()
+
+    def on_play_toggled(self, playing):
+        if not playing:
+            self.play_timer.stop()
+            self.play_btn.setText("▶ Reproduzir")
+            return
+        model = self.get_beam_model(self.current_beam_idx) if self.dataset is not None else None
+        if model is None:
+            self.play_btn.setChecked(False)
+            return
+        if self.current_cp_idx >= model.n_cps - 1:
+            # No fim do feixe: recomeça do primeiro CP
+            self.current_cp_idx = 0
+            self.update_mlc_view()
+        self.play_btn.setText("⏸ Pausar")
+        self.play_timer.start()
+
+    def on_play_tick(self):
+        model = self.beam_models.get(self.current_beam_idx) if self.dataset is not None else None
+        if model is None or self.current_cp_idx >= model.n_cps - 1:
+            self.play_btn.setChecked(False)
+            return
+        self.current_cp_idx += 1
+        self.update_mlc_view()
+
+    @staticmethod
+    def _format_cp_value(value):
+        return "N/A" if np.isnan(value) else str(float(value))
+
+    # -------------------------------------------------------------------------
+    #    FLUÊNCIA ACUMULADA DO FEIXE
+    # -------------------------------------------------------------------------
+    def on_show_fluence(self):
+        if self.dataset is None:
+            QMessageBox.warning(self, "Atenção", "Nenhum arquivo aberto.")
+            return
+        if self.fluence_dialog is None:
+            self.fluence_dialog = fv.FluenceDialog(self)
+            self.fluence_dialog.beam_combo.currentIndexChanged.connect(lambda _: self.show_selected_fluence())
+        self.fluence_dialog.show()
+        self.fluence_dialog.raise_()
+        self.update_fluence_view(self.current_beam_idx)
+
+    def leaf_boundaries(self, model):
+        """
+        Limites das lâminas do feixe: LeafPositionBoundaries do plano ou, sem eles,
+        a espessura do modelo selecionado em "Modelo MLC". Retorna (limites, origem).
+        """
+        boundaries = fl.plan_leaf_boundaries(model)
+        if boundaries is not None:
+            return boundaries, "limites das lâminas: LeafPositionBoundaries do plano"
+        thickness = float(self.mlc_model_combo.currentData())
+        n_pairs = model.n_leaves // 2
+        if not n_pairs:
+            return fl.uniform_leaf_boundaries(1, fl.X_LIMITS[1] - fl.X_LIMITS[0]), "feixe sem MLC"
+        return fl.uniform_leaf_boundaries(n_pairs, thickness), \
+            f"limites das lâminas: {self.mlc_model_combo.currentText()}"
+
+    def update_fluence_view(self, beam_idx=None):
+        """
+        Agenda no pool a fluência de todos os feixes (as já calculadas, com os mesmos
+        arrays, saem do cache) e mostra a do feixe escolhido na janela, se ela estiver
+        aberta. beam_idx: feixe a selecionar na janela (None: mantém a seleção).
+        """
+        if self.fluence_dialog is None or not self.fluence_dialog.isVisible():
+            return
+        self.fluence_jobs = {}
+        beams = dr.get_beams(self.dataset) if self.dataset is not None else None
+        if not beams:
+            self.fluence_pool.cancel_except(())
+            self.fluence_dialog.set_beams([])
+            self.fluence_dialog.set_status("")
+            self._fluence_shown = None
+            self.fluence_dialog.show_message("Sem dados de feixes")
+            return
+        labels = []
+        jobs = {}
+        for idx in range(len(beams)):
+            model = self.get_beam_model(idx)
+            boundaries, source = self.leaf_boundaries(model)
+            jobs[idx] = args = fl.beam_job(model, boundaries)
+            meterset = fl.beam_meterset(self.dataset, model.number)
+            title = f"Fluência · Beam {model.number} {model.name}".rstrip()
+            self.fluence_jobs[idx] = (fl.fluence_key(*args), meterset, source, title)
+            labels.append(f"{model.number}  {model.name}")
+        if beam_idx is None and self.fluence_dialog.beam_combo.count() == len(labels):
+            beam_idx = self.fluence_dialog.selected_beam()
+        self.fluence_dialog.set_beams(labels, beam_idx or 0)
+        # Jobs de feixes que mudaram desde o último pedido não servem mais
+        self.fluence_pool.cancel_except(job[0] for job in self.fluence_jobs.values())
+        # O feixe escolhido entra primeiro na fila
+        selected = self.fluence_dialog.selected_beam()
+        for idx in sorted(jobs, key=lambda idx: idx != selected):
+            self.fluence_pool.submit(self.fluence_jobs[idx][0], jobs[idx])
+        self.show_selected_fluence()
+
+    def show_selected_fluence(self):
+        # Mostra o mapa do feixe escolhido na janela (ou o aviso de cálculo em andamento)
+        if self.fluence_dialog is None or not self.fluence_dialog.isVisible():
+            return
+        ready = sum(self.fluence_pool.get(job[0]) is not None for job in self.fluence_jobs.values())
+        total = len(self.fluence_jobs)
+        self.fluence_dialog.set_status(f"{ready}/{total} feixes calculados" if ready < total else "")
+        job = self.fluence_jobs.get(self.fluence_dialog.selected_beam())
+        if job is None or job == self._fluence_shown:
+            return
+        key, meterset, source, title = job
+        result = self.fluence_pool.get(key)
+        if result is None:
+            self._fluence_shown = None
+            self.fluence_dialog.show_message(f"{title} · calculando...")
+            return
+        self._fluence_shown = job
+        fluence, x_edges, y_edges = result
+        self.fluence_dialog.show_fluence(title, fluence, x_edges, y_edges, meterset, source)
 
-        self.ax.set_xlim(xmin, xmax)
-        self.ax.set_xlabel("Posição X (mm)")
-        self.ax.set_ylabel("Posição Y (mm)")
+    def on_fluence_ready(self, key):
+        self.show_selected_fluence()
 
-        beam_label = getattr(beam, "BeamNumber", self.current_beam_idx + 1)
-        self.ax.set_title(f"Beam {beam_label} · CP {self.current_cp_idx + 1}/{total_cps}")
+    def on_fluence_failed(self, key, message):
+        job = self.fluence_jobs.get(self.fluence_dialog.selected_beam()) if self.fluence_dialog else None
+        if job is not None and job[0] == key and self.fluence_dialog.isVisible():
+            self._fluence_shown = None
+            self.fluence_dialog.show_message(f"Erro no cálculo da fluência: {message}")
 
-        if x_jaws or y_jaws:
-            self.ax.legend(loc="upper right", fontsize="small")
+    # -------------------------------------------------------------------------
+    #    DESLOCAMENTO E VELOCIDADE DAS LÂMINAS
+    # -------------------------------------------------------------------------
+    def mlc_model_name(self):
+        # "Agility (5 mm)" -> "Agility" (chave de leaf_motion.MACHINE_LIMITS)
+        return self.mlc_model_combo.currentText().split(" (")[0]
 
-        self.ax.grid(True, linestyle=":", linewidth=0.5, alpha=0.6)
-        self.canvas.draw()
+    def on_show_leaf_motion(self):
+        if self.dataset is None:
+            QMessageBox.warning(self, "Atenção", "Nenhum arquivo aberto.")
+            return
+        if self.leaf_motion_dialog is None:
+            self.leaf_motion_dialog = lv.LeafMotionDialog(self)
+            self.leaf_motion_dialog.set_limits(lm.machine_limits(self.mlc_model_name()), self.mlc_model_name())
+            self.leaf_motion_dialog.limits_changed.connect(self.update_leaf_motion_view)
+        self.leaf_motion_dialog.show()
+        self.leaf_motion_dialog.raise_()
+        self.update_leaf_motion_view()
+
+    def on_mlc_model_changed(self):
+        # Os limites da janela voltam aos do modelo escolhido
+        if self.leaf_motion_dialog is not None:
+            self.leaf_motion_dialog.set_limits(lm.machine_limits(self.mlc_model_name()), self.mlc_model_name())
+        self.update_leaf_motion_view()
+
+    def update_leaf_motion_view(self):
+        # Recalcula a análise do feixe em exibição, se a janela estiver aberta
+        if self.leaf_motion_dialog is None or not self.leaf_motion_dialog.isVisible():
+            return
+        if self.dataset is None or not dr.get_beams(self.dataset):
+            self.leaf_motion_dialog.show_message("Sem dados de feixes")
+            return
+        model = self.get_beam_model(self.current_beam_idx)
+        title = f"Velocidade das lâminas · Beam {model.number} {model.name}".rstrip()
+        if not model.n_leaves or model.n_cps < 2:
+            self.leaf_motion_dialog.show_message(f"{title} · sem MLC ou com menos de 2 CPs")
+            return
+        meterset = fl.beam_meterset(self.dataset, model.number)
+        motion = lm.beam_leaf_motion(model, self.leaf_motion_dialog.limits(), meterset)
+        info = "tempo dos intervalos: gantry" + (" e taxa de dose" if meterset else " (sem BeamMeterset)")
+        self.leaf_motion_dialog.show_motion(title, motion, lm.leaf_labels(model.n_leaves), info)
 
     # -------------------------------------------------------------------------
     #    EXPORTAÇÃO / IMPORTAÇÃO DE EXCEL
     # -------------------------------------------------------------------------
     def export_control_points_to_excel(self):
-        ex.export_to_excel(self.dataset)
+        beams = dr.get_beams(self.dataset) if self.dataset is not None else None
+        models = [self.get_beam_model(idx) for idx in range(len(beams))] if beams else None
+        ex.export_to_excel(self.dataset, models)
 
     def import_control_points_from_excel(self):
-        ex.import_from_excel(self.dataset, self.current_beam_idx)
+        if self.dataset is None:
+            QMessageBox.warning(self, "Atenção", "Abra um RTPLAN primeiro.")
+            return
+        beam_idx = self.current_beam_idx
+        old_model = self.get_beam_model(beam_idx)
+        with self.journal.record("Importar Excel"):
+            model = ex.import_from_excel(self.dataset, beam_idx, old_model, self.journal)
+            if model is not None:
+                # Grava só os CPs alterados pela planilha e atualiza essas linhas da árvore
+                self.beam_models[beam_idx] = model
+                changed = model.write_back(self.journal)
+        if model is not None:
+            if model.n_cps != old_model.n_cps:
+                # CPs incluídos pela planilha: ressincroniza os itens da sequência
+                changed.append((model.beam, "ControlPointSequence"))
+            self.notify_dataset_edits(changed)
+            self.update_mlc_view()
 
     # -------------------------------------------------------------------------
     #    EXPORTAÇÃO PARA EFS
     # -------------------------------------------------------------------------
     def export_efs(self):
-        if self.dataset is None or self.dicom_path is None:
+        if self.dataset is None:
             QMessageBox.warning(self, "Atenção", "Abra um RTPLAN primeiro antes de exportar EFS.")
             return
 
@@ -615,8 +1247,10 @@ class DicomEditor(QMainWindow):
         if not output_folder:
             return
 
+        # Converte o Dataset em memória (com as edições da árvore/Excel), sem reler o arquivo
         try:
-            ec.convert_dcm2efs(self.dicom_path, output_folder)
+            self.write_back_beam_models()
+            ec.convert_dataset_to_efs(self.dataset, output_folder)
         except Exception as e:
             QMessageBox.critical(self, "Erro ao gerar EFS", f"Falha ao criar arquivos EFS:\n{e}")
             return
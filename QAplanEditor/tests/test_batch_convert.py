@@ -0,0 +1,47 @@
+"""
+batch_convert: pastas de saída de RTPLANs com o mesmo BeamName e manifesto
+incremental.
+
+Rodar a partir da pasta QAplanEditor:
+    python -m pytest -q tests
+"""
+import os
+import shutil
+
+import pydicom
+
+import efs_converter.batch_convert as bc
+
+SAMPLE_PLAN = os.path.join(os.path.dirname(__file__), os.pardir, "sample_files", "RTplans",
+                           "epid_validation_files", "Kernel_Conversion", "conversion_RP.06X.dcm")
+
+
+def test_plans_sharing_beam_names_convert_incrementally(tmp_path):
+    in_dir = tmp_path / "in" / "sub"
+    out_root = tmp_path / "out"
+    in_dir.mkdir(parents=True)
+    plan_a, plan_b = str(in_dir / "a.dcm"), str(in_dir / "b.dcm")
+    shutil.copy(SAMPLE_PLAN, plan_a)
+    shutil.copy(SAMPLE_PLAN, plan_b)
+    efs_names = bc.efs_names_for(SAMPLE_PLAN)
+    assert efs_names
+
+    converted, skipped, failed = bc.batch_convert(str(tmp_path / "in"), str(out_root), workers=2)
+    assert converted == sorted([plan_a, plan_b]) and skipped == [] and failed == []
+    # Mesmos nomes de .efs: cada plano na sua subpasta, sem sobrescrever o outro
+    for name in ("a", "b"):
+        for efs in efs_names:
+            assert (out_root / "sub" / name / efs).exists()
+    assert not any((out_root / "sub" / efs).exists() for efs in efs_names)
+
+    converted, skipped, failed = bc.batch_convert(str(tmp_path / "in"), str(out_root), workers=2)
+    assert converted == [] and sorted(skipped) == sorted([plan_a, plan_b]) and failed == []
+
+    # Só o plano cujo conteúdo mudou é convertido de novo
+    ds = pydicom.dcmread(plan_b, force=True)
+    ds.PatientName = "Alterado"
+    ds.save_as(plan_b)
+    converted, skipped, failed = bc.batch_convert(str(tmp_path / "in"), str(out_root), workers=2)
+    assert converted == [plan_b] and skipped == [plan_a] and failed == []
+    for efs in efs_names:
+        assert (out_root / "sub" / "b" / efs).exists()
@@ -0,0 +1,94 @@
+"""
+BeamModel: leitura dos valores DS dos CPs e gravação das edições no Dataset.
+
+Rodar a partir da pasta QAplanEditor:
+    python -m pytest -q tests
+"""
+import os
+
+import pydicom
+import pytest
+from pydicom.dataelem import RawDataElement
+from pydicom.dataset import Dataset
+from pydicom.tag import Tag
+from pydicom.valuerep import format_number_as_ds
+
+import dicom_utils.beam_model as bm
+import dicom_utils.reader as dr
+
+RTPLANS = os.path.join(os.path.dirname(__file__), os.pardir, "sample_files", "RTplans")
+CONVERSION_PLAN = os.path.join(RTPLANS, "epid_validation_files", "Kernel_Conversion", "conversion_RP.06X.dcm")
+SLIT12_PLAN = os.path.join(RTPLANS, "versaHD_dlgMeasurement", "10X", "slit12_10X.dcm")
+
+
+@pytest.mark.parametrize("text", ["66 .0", b"66 .0", " 66.0 ", "66. 0"])
+def test_ds_with_embedded_spaces(text):
+    assert bm._to_float(text) == 66.0
+
+
+def test_ds_values_from_raw_element_with_embedded_spaces():
+    ds = Dataset()
+    tag = Tag(bm.TAG_LEAF_JAW_POSITIONS)
+    ds[tag] = RawDataElement(tag, "DS", 14, b"-66 .0\\66 .0 ", 0, True, True)
+    assert bm._ds_values(ds, tag) == [-66.0, 66.0]
+
+
+def test_slit12_plan_builds_beam_models():
+    ds = pydicom.dcmread(SLIT12_PLAN, force=True)
+    models = bm.build_beam_models(ds)
+    assert models and all(model.n_cps for model in models)
+
+
+def _plain_elements(ds):
+    # Elementos não-sequência de um Dataset, como {tag: valor}
+    return {elem.tag: elem.value for elem in ds if elem.VR != "SQ"}
+
+
+def test_write_back_changes_only_the_edited_cp(tmp_path):
+    ds = pydicom.dcmread(CONVERSION_PLAN, force=True)
+    original = pydicom.dcmread(CONVERSION_PLAN, force=True)
+    model = bm.BeamModel(ds.BeamSequence[0], 0)
+    gantry = 123.456789012345
+    leaves = [1.0 / 3.0, -2.0 / 3.0]
+
+    model.set_scalar('gantry', 0, gantry)
+    model.set_leaves(0, leaves, [0, 1])
+    changed = model.write_back()
+
+    edited_cp = ds.BeamSequence[0].ControlPointSequence[0]
+    original_cp = original.BeamSequence[0].ControlPointSequence[0]
+    mlc_items = [item for item in edited_cp.BeamLimitingDevicePositionSequence
+                 if "MLC" in item.RTBeamLimitingDeviceType]
+    assert {(id(dataset), Tag(tag)) for dataset, tag in changed} == {
+        (id(edited_cp), Tag(bm.TAG_GANTRY_ANGLE)), (id(mlc_items[0]), Tag(bm.TAG_LEAF_JAW_POSITIONS))}
+
+    # No CP editado, só o GantryAngle e as duas lâminas mudaram
+    before, after = _plain_elements(original_cp), _plain_elements(edited_cp)
+    assert before.keys() == after.keys()
+    assert [tag for tag in before if before[tag] != after[tag]] == [Tag(bm.TAG_GANTRY_ANGLE)]
+    for item, item_original in zip(edited_cp.BeamLimitingDevicePositionSequence,
+                                    original_cp.BeamLimitingDevicePositionSequence):
+        positions = list(item_original.LeafJawPositions)
+        if item is mlc_items[0]:
+            positions[:2] = leaves
+        assert [float(v) for v in item.LeafJawPositions] == pytest.approx(positions, abs=1e-13)
+
+    # Os demais CPs do feixe e os outros feixes ficam iguais
+    for cp, cp_original in zip(ds.BeamSequence[0].ControlPointSequence[1:],
+                               original.BeamSequence[0].ControlPointSequence[1:]):
+        assert cp == cp_original
+    for beam, beam_original in zip(ds.BeamSequence[1:], original.BeamSequence[1:]):
+        assert beam.ControlPointSequence == beam_original.ControlPointSequence
+
+    # Gravado e relido: DS com a precisão máxima de 16 caracteres
+    path = tmp_path / "edited_RP.dcm"
+    dr.save_dicom_file(ds, str(path))
+    reread = pydicom.dcmread(str(path), force=True)
+    cp = reread.BeamSequence[0].ControlPointSequence[0]
+    assert str(cp.GantryAngle) == format_number_as_ds(gantry) == "123.456789012345"
+    assert float(cp.GantryAngle) == gantry
+    mlc = [item for item in cp.BeamLimitingDevicePositionSequence if "MLC" in item.RTBeamLimitingDeviceType][0]
+    assert [str(v) for v in mlc.LeafJawPositions[:2]] == [format_number_as_ds(v) for v in leaves]
+    assert [float(v) for v in mlc.LeafJawPositions[:2]] == pytest.approx(leaves, abs=1e-13)
+    for beam, beam_original in zip(reread.BeamSequence[1:], original.BeamSequence[1:]):
+        assert beam.ControlPointSequence == beam_original.ControlPointSequence
@@ -0,0 +1,57 @@
+"""
+Ida e volta DICOM -> EFS -> DICOM com um dos planos de exemplo.
+
+Rodar a partir da pasta QAplanEditor:
+    python -m pytest -q tests
+"""
+import os
+
+import numpy as np
+import pydicom
+import pytest
+
+import dicom_utils.beam_model as bm
+import efs_converter.DCM2EFS as ec
+import efs_converter.EFS2DCM as ed
+
+SAMPLE_PLAN = os.path.join(os.path.dirname(__file__), os.pardir, "sample_files", "RTplans",
+                           "epid_validation_files", "Kernel_Conversion", "conversion_RP.06X.dcm")
+
+
+def test_round_trip_sample_plan(tmp_path):
+    template = pydicom.dcmread(SAMPLE_PLAN, force=True)
+    efs_paths = ec.convert_dataset_to_efs(template, str(tmp_path))
+    output = tmp_path / "roundtrip_RP.dcm"
+
+    ed.convert_efs2dcm(efs_paths, SAMPLE_PLAN, str(output))
+
+    rtplan = pydicom.dcmread(str(output), force=True)
+    assert rtplan.original_encoding == template.original_encoding
+    assert len(rtplan.BeamSequence) == len(template.BeamSequence)
+    for beam, original in zip(rtplan.BeamSequence, template.BeamSequence):
+        assert len(beam.ControlPointSequence) == len(original.ControlPointSequence)
+        # CPs que omitem posições no original repetem o CP anterior (BeamModel)
+        model, model_original = bm.BeamModel(beam), bm.BeamModel(original)
+        np.testing.assert_allclose(model.leaves, model_original.leaves, atol=0.05)
+        np.testing.assert_allclose(model.jaw_y, model_original.jaw_y, atol=0.05)
+        np.testing.assert_allclose(model.gantry, model_original.gantry, atol=0.05)
+        for cp, cp_original in zip(beam.ControlPointSequence, original.ControlPointSequence):
+            assert float(cp.CumulativeMetersetWeight) == pytest.approx(
+                float(cp_original.CumulativeMetersetWeight), abs=1e-6)
+
+
+def test_missing_values_are_carried_forward_or_rejected(tmp_path):
+    template = pydicom.dcmread(SAMPLE_PLAN, force=True)
+    efs_path = ec.convert_dataset_to_efs(template, str(tmp_path))[0]
+    efs = ed.read_efs(efs_path, carry_forward=False)
+
+    # Valor ausente num CP intermediário: repete o CP anterior
+    efs.gantry[1:] = np.nan
+    beam = ed.build_beam(efs, template.BeamSequence[0], 1)
+    angles = [cp.GantryAngle for cp in beam.ControlPointSequence]
+    assert angles == [angles[0]] * len(angles)
+
+    # Sem valor no primeiro CP: o EFS é rejeitado em vez de gravar "nan"
+    efs.gantry[:] = np.nan
+    with pytest.raises(ValueError):
+        ed.build_beam(efs, template.BeamSequence[0], 1)
@@ -0,0 +1,44 @@
+"""
+FluencePool: encerramento do pool de processos.
+
+Rodar a partir da pasta QAplanEditor:
+    python -m pytest -q tests
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+QAPLAN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+SCRIPT = textwrap.dedent("""
+    import numpy as np
+    from PyQt5.QtCore import QCoreApplication
+
+    import dicom_utils.fluence as fl
+    import dicom_utils.fluence_pool as fp
+
+    app = QCoreApplication([])
+    pool = fp.FluencePool(workers=2)
+    n_cps, n_pairs = 3, 4
+    leaves = np.column_stack([np.full((n_cps, n_pairs), -10.0), np.full((n_cps, n_pairs), 10.0)])
+    jaws = np.tile([-10.0, 10.0], (n_cps, 1))
+    args = (leaves, jaws, jaws, np.linspace(0.0, 1.0, n_cps), fl.uniform_leaf_boundaries(n_pairs, 5.0), 1.0)
+    # Vários jobs distintos: parte ainda na fila (cancelada) ao encerrar
+    for shift in range(6):
+        job = (args[0] + shift,) + args[1:]
+        pool.submit(fl.fluence_key(*job), job)
+    assert pool.pending_count() == 6
+    pool.shutdown()
+    assert pool.pending_count() == 0
+    print("ok")
+""")
+
+
+def test_shutdown_exits_cleanly():
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=QAPLAN_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "ok"
+    assert result.stderr.strip() == ""
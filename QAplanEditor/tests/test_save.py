@@ -0,0 +1,77 @@
+"""
+reader.save_dicom_file: sequências não alteradas gravadas com os bytes originais.
+
+Rodar a partir da pasta QAplanEditor:
+    python -m pytest -q tests
+"""
+import os
+
+import pydicom
+import pytest
+
+import dicom_utils.loader as ld
+import dicom_utils.reader as dr
+from dicom_utils.journal import EditJournal
+
+RTPLANS = os.path.join(os.path.dirname(__file__), os.pardir, "sample_files", "RTplans")
+SAMPLE_PLANS = [
+    # VR implícito, sem File Meta
+    os.path.join(RTPLANS, "epid_validation_files", "Kernel_Conversion", "conversion_RP.06X.dcm"),
+    # Com File Meta e TransferSyntaxUID
+    os.path.join(RTPLANS, "versaHD_dlgMeasurement", "10X", "open_10X.dcm"),
+]
+
+
+def _defined_length_plan(tmp_path):
+    """
+    Plano de exemplo regravado com sequências de tamanho definido (as únicas que
+    podem ser copiadas byte a byte) e um DS com preenchimento fora do padrão, que o
+    pydicom grava diferente se o elemento for recodificado.
+    """
+    ds = pydicom.dcmread(SAMPLE_PLANS[0], force=True)
+
+    def defined(dataset, elem):
+        if elem.VR == "SQ":
+            elem.is_undefined_length = False
+    ds.walk(defined)
+    path = tmp_path / "defined_RP.dcm"
+    ds.save_as(str(path))
+    data = path.read_bytes()
+    assert b"1.000000" in data
+    path.write_bytes(data.replace(b"1.000000", b"1.000   "))
+    return str(path)
+
+
+@pytest.fixture(params=SAMPLE_PLANS + [None], ids=["implicit", "file_meta", "defined_length"])
+def plan_path(request, tmp_path):
+    return request.param or _defined_length_plan(tmp_path)
+
+
+def test_unedited_save_is_byte_identical(plan_path, tmp_path):
+    plan = ld.load_plan(plan_path)
+    # Como a árvore ao exibir tudo: todos os valores convertidos pelo pydicom
+    plan.dataset.walk(lambda dataset, elem: elem.value)
+    out = tmp_path / "saved_RP.dcm"
+
+    dr.save_dicom_file(plan.dataset, str(out), plan.source, EditJournal().modified)
+
+    assert out.read_bytes() == plan.source
+
+
+def test_edited_save_matches_full_save_as(plan_path, tmp_path):
+    plan = ld.load_plan(plan_path)
+    plan.dataset.walk(lambda dataset, elem: elem.value)
+    journal = EditJournal()
+    cp = plan.dataset.BeamSequence[0].ControlPointSequence[0]
+    with journal.record("Editar"):
+        journal.touch(cp, "GantryAngle")
+        cp.GantryAngle = "12.5"
+    out = tmp_path / "saved_RP.dcm"
+    full = tmp_path / "save_as_RP.dcm"
+
+    dr.save_dicom_file(plan.dataset, str(out), plan.source, journal.modified)
+    plan.dataset.save_as(str(full))
+
+    saved = pydicom.dcmread(str(out), force=True)
+    assert saved == pydicom.dcmread(str(full), force=True)
+    assert float(saved.BeamSequence[0].ControlPointSequence[0].GantryAngle) == 12.5